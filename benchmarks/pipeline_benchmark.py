@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+
+from src.git_repository import GitRepository
+from src.dataframe_creator import DataFrameCreator
+from src.video_generator import VideoGenerator
+from src.telemetry import Telemetry
+from .synthetic_repo import SyntheticRepository
+
+
+class PipelineBenchmark:
+    """
+    合成リポジトリに対して、RepositoryTimelapse と同じ順序で各ステージを実行し、測定結果をJSONにまとめます。
+    """
+
+    STAGES = [
+        'process_commits',
+        'treemap_dateframe',
+        'create_time_series_df',
+        'create_extension_df',
+        'prepare_treemap_data',
+        'generate_animated_treemap',
+    ]
+
+    def __init__(self, repository, workdir, repeat=1, backend='gitpython', storage='csv',
+                 file_extensions=None, period='Y', trace_python=False, traversal='first-parent',
+                 sample=None, max_blob_size=None):
+        """
+        :param repository: SyntheticRepository
+        :param workdir: リポジトリと出力を置くディレクトリ
+        :param repeat: 各ステージを繰り返す回数（結果には中央値と最小値を記録します）
+        :param backend: GitRepository.process_commits の backend
+        :param storage: GitRepository.process_commits の storage
+        :param file_extensions: 対象とする拡張子のリスト（Noneなら全て）
+        :param period: create_time_series_df の期間
+        :param trace_python: tracemallocでPythonのピークメモリも測定します（処理は遅くなります）
+        :param traversal: GitRepository.process_commits の traversal
+        :param sample: GitRepository.process_commits の sample
+        :param max_blob_size: GitRepository.process_commits の max_blob_size
+        """
+        self.repository = repository
+        self.workdir = workdir
+        self.repeat = repeat
+        self.backend = backend
+        self.storage = storage
+        self.file_extensions = file_extensions
+        self.period = period
+        self.trace_python = trace_python
+        self.traversal = traversal
+        self.sample = sample
+        self.max_blob_size = max_blob_size
+
+    def _stages(self, git_repository):
+        """(ステージ名, 実行する関数) を順に返します。関数は処理した件数を返します。"""
+        csv_filename = os.path.join(git_repository.output_dir, "commit_history.csv")
+        state = {}
+
+        def process_commits():
+            state['history'] = git_repository.process_commits(
+                csv_filename, self.file_extensions, incremental=False, backend=self.backend, storage=self.storage,
+                traversal=self.traversal, sample=self.sample,
+                max_blob_size=self.max_blob_size)
+            return git_repository.count_commits(git_repository.repo.active_branch.name)
+
+        def treemap_dateframe():
+            state['df_latest'], _ = DataFrameCreator.treemap_dateframe(state['history'])
+            return len(state['df_latest'])
+
+        def create_time_series_df():
+            state['period_dfs'] = DataFrameCreator.create_time_series_df(state['df_latest'], self.period)
+            return len(state['period_dfs'])
+
+        def create_extension_df():
+            return len(DataFrameCreator.create_extension_df(state['history']))
+
+        def prepare_treemap_data():
+            return sum(len(VideoGenerator.prepare_treemap_data(df)[0])
+                       for df in state['period_dfs'].values() if not df.empty)
+
+        def generate_animated_treemap():
+            output_path = os.path.join(git_repository.output_dir, "file_structure_treemap_animation.html")
+            VideoGenerator.generate_animated_treemap(state['period_dfs'], output_path, 'Benchmark')
+            return len(state['period_dfs'])
+
+        return [
+            ('process_commits', process_commits),
+            ('treemap_dateframe', treemap_dateframe),
+            ('create_time_series_df', create_time_series_df),
+            ('create_extension_df', create_extension_df),
+            ('prepare_treemap_data', prepare_treemap_data),
+            ('generate_animated_treemap', generate_animated_treemap),
+        ]
+
+    def run(self):
+        """
+        リポジトリを生成して全ステージを測定し、結果の辞書を返します。
+        """
+        os.makedirs(self.workdir, exist_ok=True)
+        cwd = os.getcwd()
+        # GitRepository は出力をカレントディレクトリの out/ 以下に書く
+        os.chdir(self.workdir)
+        telemetry = Telemetry()
+        try:
+            with telemetry.stage('generate') as generation:
+                self.repository.generate()
+            git_repository = GitRepository(self.repository.path)
+            runs = {name: [] for name in self.STAGES}
+            for _ in range(self.repeat):
+                for name, stage in self._stages(git_repository):
+                    if self.trace_python:
+                        tracemalloc.start()
+                    with telemetry.stage(name) as record:
+                        items = stage()
+                    runs[name].append(self.measurement(record, items))
+                    if self.trace_python:
+                        runs[name][-1]['python_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                        tracemalloc.stop()
+            git_repository.close()
+        finally:
+            os.chdir(cwd)
+
+        return {
+            'schema': 1,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'environment': self.environment(),
+            'repository': {
+                **self.repository.params(),
+                'generate_seconds': generation['wall_seconds'],
+            },
+            'settings': {
+                'repeat': self.repeat,
+                'backend': self.backend,
+                'storage': self.storage,
+                'traversal': self.traversal,
+                'sample': self.sample,
+                'max_blob_size': self.max_blob_size,
+                'file_extensions': self.file_extensions,
+                'period': self.period,
+            },
+            'stages': {name: self.summarize(stage_runs) for name, stage_runs in runs.items()},
+        }
+
+    @staticmethod
+    def measurement(record, items):
+        """Telemetry のステージの記録から、比較に使う値を取り出します。"""
+        return {
+            'wall_seconds': record['wall_seconds'],
+            'cpu_seconds': record['cpu_seconds'],
+            'children_cpu_seconds': record['children_cpu_seconds'],
+            'peak_rss_mb': record['peak_rss_mb'],
+            'items': items,
+        }
+
+    @staticmethod
+    def summarize(runs):
+        """繰り返した測定を、中央値（wall_seconds_min は最小値）にまとめます。"""
+        summary = {key: statistics.median(run[key] for run in runs)
+                   for key in runs[0] if key != 'items'}
+        summary['wall_seconds_min'] = min(run['wall_seconds'] for run in runs)
+        summary['items'] = runs[-1]['items']
+        summary['items_per_second'] = summary['items'] / summary['wall_seconds'] if summary['wall_seconds'] else None
+        summary['runs'] = runs
+        return summary
+
+    @staticmethod
+    def environment():
+        git_version = subprocess.run(['git', '--version'], capture_output=True, text=True).stdout.strip()
+        return {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'git': git_version,
+        }
+
+    @staticmethod
+    def compare(result, baseline, threshold=0.1):
+        """
+        ベースラインの結果と経過時間（中央値）を比べ、threshold を超えて遅くなったステージ名のリストを返します。
+        """
+        regressions = []
+        print(f"{'stage':<28}{'baseline':>12}{'current':>12}{'change':>10}")
+        for name, stage in result['stages'].items():
+            before = baseline.get('stages', {}).get(name)
+            if before is None:
+                print(f"{name:<28}{'-':>12}{stage['wall_seconds']:>12.3f}{'':>10}")
+                continue
+            change = stage['wall_seconds'] / before['wall_seconds'] - 1 if before['wall_seconds'] else 0.0
+            mark = ' !' if change > threshold else ''
+            print(f"{name:<28}{before['wall_seconds']:>12.3f}{stage['wall_seconds']:>12.3f}{change:>+10.1%}{mark}")
+            if change > threshold:
+                regressions.append(name)
+        return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark each pipeline stage on a synthetic repository.')
+    parser.add_argument('--commits', type=int, default=1000, help='Number of commits on the main branch')
+    parser.add_argument('--files', type=int, default=500, help='Target number of files')
+    parser.add_argument('--depth', type=int, default=4, help='Maximum directory depth')
+    parser.add_argument('--fanout', type=int, default=4, help='Number of distinct directory names per level')
+    parser.add_argument('--rename-rate', type=float, default=0.05, help='Probability that a change is a rename')
+    parser.add_argument('--delete-rate', type=float, default=0.05, help='Probability that a change is a delete')
+    parser.add_argument('--binary-rate', type=float, default=0.02, help='Probability that a new file is binary')
+    parser.add_argument('--merge-interval', type=int, default=0,
+                        help='Merge a side-branch commit every N commits (0 disables merges)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic repository')
+    parser.add_argument('--repeat', type=int, default=1, help='Number of times each stage is measured')
+    parser.add_argument('--backend', choices=['gitpython', 'log'], default='gitpython')
+    parser.add_argument('--storage', choices=['csv', 'columnar'], default='csv')
+    parser.add_argument('--traversal', choices=['first-parent', 'full', 'no-merges'], default='first-parent')
+    parser.add_argument('--sample', type=lambda v: int(v) if v.isdigit() else v, default=None,
+                        help='Sample period boundaries (Y, M, W, D) or every N commits instead of every commit')
+    parser.add_argument('--max-blob-size', type=int, default=None,
+                        help='Skip counting lines of blobs larger than this many bytes')
+    parser.add_argument('--extensions', nargs='+', default=None, help='File extensions to analyze')
+    parser.add_argument('--period', default='Y', help='Period of the treemap frames (Y, M, W, D)')
+    parser.add_argument('--trace-python', action='store_true',
+                        help='Also measure the peak Python heap with tracemalloc (slower)')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory for the synthetic repository and outputs (default: a temporary directory)')
+    parser.add_argument('--output', default=None, help='Path of the result JSON (default: stdout)')
+    parser.add_argument('--compare', default=None, help='Baseline result JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative slowdown of a stage reported as a regression')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='repotimelapse-bench-') as tmp:
+        workdir = os.path.abspath(args.workdir or tmp)
+        repository = SyntheticRepository(
+            os.path.join(workdir, 'synthetic'), commits=args.commits, files=args.files, depth=args.depth,
+            fanout=args.fanout, rename_rate=args.rename_rate, delete_rate=args.delete_rate,
+            binary_rate=args.binary_rate, merge_interval=args.merge_interval, seed=args.seed)
+        benchmark = PipelineBenchmark(repository, workdir, repeat=args.repeat, backend=args.backend,
+                                      storage=args.storage, file_extensions=args.extensions,
+                                      period=args.period, trace_python=args.trace_python,
+                                      traversal=args.traversal, sample=args.sample,
+                                      max_blob_size=args.max_blob_size)
+        result = benchmark.run()
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Benchmark results have been saved to {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = PipelineBenchmark.compare(result, json.load(f), args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
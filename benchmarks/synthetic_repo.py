@@ -0,0 +1,169 @@
+import os
+import random
+import shutil
+import subprocess
+
+
+class SyntheticRepository:
+    """
+    ベンチマーク用のGitリポジトリを `git fast-import` で生成します。
+
+    乱数のシード・コミット日時・作者を固定しているため、同じ引数からは
+    コミットのSHAまで同じリポジトリが生成されます。
+    """
+
+    TEXT_EXTENSIONS = ['.java', '.kt', '.xml', '.gradle', '.py', '.md']
+    BINARY_EXTENSIONS = ['.png', '.jar']
+    START_TIME = 1_500_000_000
+
+    def __init__(self, path, commits=1000, files=500, depth=4, fanout=4, rename_rate=0.05,
+                 delete_rate=0.05, binary_rate=0.02, changes_per_commit=5, max_lines=400,
+                 merge_interval=0, seed=0):
+        """
+        :param path: 生成するリポジトリのパス（既存のものは削除されます）
+        :param commits: メインブランチのコミット数
+        :param files: 目標とするファイル数（これに達するまではファイルを追加しやすくなります）
+        :param depth: ディレクトリの最大の深さ
+        :param fanout: 各階層のディレクトリ名の種類の数
+        :param rename_rate: 1つの変更がリネームである確率
+        :param delete_rate: 1つの変更が削除である確率
+        :param binary_rate: 追加するファイルがバイナリである確率
+        :param changes_per_commit: 1コミットあたりの変更数の最大値
+        :param max_lines: 追加するファイルの最大行数
+        :param merge_interval: この間隔で側枝のコミットをマージします（0ならマージしない）
+        :param seed: 乱数のシード
+        """
+        self.path = path
+        self.commits = commits
+        self.files = files
+        self.depth = depth
+        self.fanout = fanout
+        self.rename_rate = rename_rate
+        self.delete_rate = delete_rate
+        self.binary_rate = binary_rate
+        self.changes_per_commit = changes_per_commit
+        self.max_lines = max_lines
+        self.merge_interval = merge_interval
+        self.seed = seed
+
+    def params(self):
+        """生成に使った引数を辞書で返します（結果のJSONに記録するため）。"""
+        return {name: value for name, value in vars(self).items() if name != 'path'}
+
+    def _new_path(self, rnd, existing):
+        while True:
+            directories = [f"d{level}_{rnd.randrange(self.fanout)}" for level in range(rnd.randint(0, self.depth))]
+            binary = rnd.random() < self.binary_rate
+            extension = rnd.choice(self.BINARY_EXTENSIONS if binary else self.TEXT_EXTENSIONS)
+            path = '/'.join(directories + [f"f{rnd.randrange(10 ** 6)}{extension}"])
+            if path not in existing:
+                return path, binary
+
+    @staticmethod
+    def _text(path, version, lines):
+        # 先頭行だけが版ごとに変わり、残りは行数の増減だけの差分になる
+        return (f"// {path} v{version}\n" + ''.join(f"line {k}\n" for k in range(1, lines))).encode('utf-8')
+
+    @staticmethod
+    def _binary(rnd, size):
+        return bytes(rnd.randrange(256) for _ in range(size)) + b'\0'
+
+    def _stream(self):
+        """fast-import に渡すコマンド列を生成します。"""
+        rnd = random.Random(self.seed)
+        files = {}  # パス -> (バイナリか, 版, 行数)
+        paths = []  # 無作為に選ぶためのパスの一覧（順序は決定的）
+        positions = {}
+
+        def add(path, state):
+            files[path] = state
+            positions[path] = len(paths)
+            paths.append(path)
+
+        def remove(path):
+            # 末尾の要素を空いた位置に移して O(1) で取り除く
+            last = paths.pop()
+            if last != path:
+                paths[positions[path]] = last
+                positions[last] = positions[path]
+            del positions[path]
+            return files.pop(path)
+
+        when = self.START_TIME
+        side = None
+
+        def blob(data):
+            return b'data %d\n%s\n' % (len(data), data)
+
+        def content(path):
+            binary, version, lines = files[path]
+            return self._binary(rnd, lines * 16) if binary else self._text(path, version, lines)
+
+        for i in range(self.commits):
+            operations = []
+            for _ in range(rnd.randint(1, self.changes_per_commit)):
+                r = rnd.random()
+                if files and r < self.delete_rate:
+                    path = rnd.choice(paths)
+                    remove(path)
+                    operations.append(b'D %s\n' % path.encode('utf-8'))
+                elif files and r < self.delete_rate + self.rename_rate:
+                    old_path = rnd.choice(paths)
+                    new_path, _ = self._new_path(rnd, files)
+                    new_path = os.path.join(os.path.dirname(new_path), os.path.basename(old_path))
+                    if new_path in files:
+                        continue
+                    add(new_path, remove(old_path))
+                    operations.append(b'R %s %s\n' % (old_path.encode('utf-8'), new_path.encode('utf-8')))
+                elif not files or (len(files) < self.files and rnd.random() < 0.6):
+                    path, binary = self._new_path(rnd, files)
+                    add(path, (binary, 0, rnd.randint(1, self.max_lines)))
+                    operations.append(b'M 100644 inline %s\n' % path.encode('utf-8') + blob(content(path)))
+                else:
+                    path = rnd.choice(paths)
+                    binary, version, lines = files[path]
+                    files[path] = (binary, version + 1, max(1, lines + rnd.randint(-lines // 4, 20)))
+                    operations.append(b'M 100644 inline %s\n' % path.encode('utf-8') + blob(content(path)))
+
+            when += rnd.randint(600, 3 * 86400)
+            message = f"commit {i}".encode('utf-8')
+            yield (b'commit refs/heads/main\nmark :%d\n' % (i + 1)
+                   + b'author Bench <bench@example.com> %d +0900\n' % when
+                   + b'committer Bench <bench@example.com> %d +0900\n' % when
+                   + blob(message).rstrip(b'\n') + b'\n')
+            if i > 0:
+                yield b'from :%d\n' % i
+            if side is not None:
+                yield b'merge :%d\n' % side
+                side = None
+            yield b''.join(operations) + b'\n'
+
+            # 側枝に1コミット作り、次のメインのコミットでマージする
+            if self.merge_interval and i % self.merge_interval == self.merge_interval - 1:
+                when += 60
+                path = f"side/s{i}.java"
+                side = self.commits + i + 1
+                yield (b'commit refs/heads/side\nmark :%d\n' % side
+                       + b'committer Bench <bench@example.com> %d +0900\n' % when
+                       + blob(b'side').rstrip(b'\n') + b'\n'
+                       + b'from :%d\n' % (i + 1)
+                       + b'M 100644 inline %s\n' % path.encode('utf-8') + blob(self._text(path, 0, 10)) + b'\n')
+
+    def generate(self):
+        """
+        リポジトリを生成し、そのパスを返します。
+        """
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        subprocess.run(['git', 'init', '-q', '-b', 'main', self.path], check=True)
+        process = subprocess.Popen(['git', '-C', self.path, 'fast-import', '--quiet'], stdin=subprocess.PIPE)
+        try:
+            for command in self._stream():
+                process.stdin.write(command)
+        finally:
+            process.stdin.close()
+            process.wait()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, 'git fast-import')
+        subprocess.run(['git', '-C', self.path, 'checkout', '-q', 'main'], check=True)
+        return self.path
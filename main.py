@@ -8,13 +8,32 @@ __date__ = '2024/09/10 (created: 2024/05/31)'
 
 from src.cli import CLI
 from src.repotimelapse import RepositoryTimelapse
+from src.batch_scheduler import BatchScheduler
+from src.telemetry import Telemetry
 
 def main():
     cli = CLI()
     args = cli.parse_args()
 
-    processor = RepositoryTimelapse(args.repo_url)
-    processor.run_extended_analysis()
+    options = dict(incremental=not args.full_rebuild, backend=args.backend,
+                   traversal=args.traversal, sample=args.sample,
+                   max_blob_size=args.max_blob_size, storage=args.storage, export_csv=args.export_csv,
+                   treemap_format=args.treemap_format, node_budget=args.node_budget,
+                   video=args.video, fps=args.fps, resolution=args.resolution, churn=args.churn)
+
+    if args.manifest:
+        scheduler = BatchScheduler(args.manifest, max_concurrent_repos=args.max_concurrent_repos,
+                                   defaults={'clone_mode': args.clone_mode, **options},
+                                   profile_format=args.profile_format if args.profile else None,
+                                   profile_capture=args.profile_capture)
+        scheduler.run()
+        return
+
+    telemetry = Telemetry(capture=args.profile_capture) if args.profile else None
+    processor = RepositoryTimelapse(args.repo_url, args.clone_mode, telemetry)
+    processor.run_extended_analysis(**options)
+    if args.profile:
+        processor.write_profile(args.profile_format)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
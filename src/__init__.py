@@ -1,9 +1,32 @@
 __all__ = ['GitRepository', 'CommitAnalyzer', 'DataFrameCreator', 
-           'VideoGenerator', 'DirectoryFinder', 'RepositoryTimelapse']
+           'VideoGenerator', 'DirectoryFinder', 'RepositoryTimelapse',
+           'LineCountCache', 'CommitStream', 'BlobReader', 'HistoryStore',
+           'HistoryWriter', 'FileIndex',
+           'SnapshotEngine', 'TreemapPlayer',
+           'TreemapLOD', 'VideoRenderer', 'BatchScheduler',
+           'Telemetry', 'StackSampler', 'AnalysisSession', 'PathTable',
+           'LineCounter', 'ChurnStream']
 
 from .git_repository import GitRepository
 from .commit_analyzer import CommitAnalyzer
 from .dataframe_creator import DataFrameCreator
 from .video_generator import VideoGenerator
 from .directory_finder import DirectoryFinder
-from .repotimelapse import RepositoryTimelapse
\ No newline at end of file
+from .repotimelapse import RepositoryTimelapse
+from .line_count_cache import LineCountCache
+from .commit_stream import CommitStream
+from .blob_reader import BlobReader
+from .history_store import HistoryStore
+from .history_writer import HistoryWriter
+from .file_index import FileIndex
+from .snapshot_engine import SnapshotEngine
+from .treemap_player import TreemapPlayer
+from .treemap_lod import TreemapLOD
+from .video_renderer import VideoRenderer
+from .batch_scheduler import BatchScheduler
+from .telemetry import Telemetry
+from .stack_sampler import StackSampler
+from .analysis_session import AnalysisSession
+from .path_table import PathTable
+from .line_counter import LineCounter
+from .churn_stream import ChurnStream
\ No newline at end of file
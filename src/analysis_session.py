@@ -0,0 +1,73 @@
+from .dataframe_creator import DataFrameCreator
+from .path_table import PathTable
+
+
+class AnalysisSession:
+    """
+    コミット履歴を1回だけ読み込み、そこから作る表をパラメータごとに保持します。
+
+    同じ表を複数の出力（TreeMap・アニメーション・動画・拡張子の棒グラフ）で使う場合も、
+    履歴の読み込みと groupby('File').last() の集計は1回で済みます。
+    履歴を書き換えた場合は invalidate() で保持している表を破棄してください。
+    パスは path_table() のIDで集計し、文字列は出力の直前に取り出します。
+    返す表は共有されるので、呼び出し側で書き換えないこと。
+    """
+
+    def __init__(self, history_path):
+        """
+        :param history_path: CSVファイルまたは列指向ストアのパス
+        """
+        self.history_path = history_path
+        self._cache = {}
+
+    def _memoize(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def invalidate(self, *names):
+        """
+        保持している表を破棄します。
+
+        :param names: 破棄する表の名前（'history', 'latest_state' など）。省略すると全て破棄します
+        """
+        if not names:
+            self._cache.clear()
+            return
+        for key in [key for key in self._cache if key[0] in names]:
+            del self._cache[key]
+
+    def history(self):
+        """コミット履歴の全ての行（date列を含む）。"""
+        return self._memoize(('history',), lambda: DataFrameCreator.load_history(self.history_path))
+
+    def path_table(self):
+        """履歴に現れる全てのパス（リネーム前のパスを含む）と、その親ディレクトリの PathTable。"""
+        return self._memoize(('path_table',), lambda: PathTable.from_frames([self.history()]))
+
+    def latest_state(self):
+        """各パスの最新の状態（削除されたものを除く）。"""
+        return self._memoize(('latest_state',), lambda: DataFrameCreator.latest_state(self.history()))
+
+    def change_counts(self):
+        """パスごとの変更回数（リネームをたどった同じファイルの変更を合計する）。"""
+        return self._memoize(('change_counts',), lambda: DataFrameCreator.change_counts(
+            self.history(), self.path_table()))
+
+    def treemap_frame(self):
+        """DataFrameCreator.treemap_dateframe と同じ (DataFrame, パスのカラム名のリスト)。"""
+        return self._memoize(('treemap_frame',), lambda: DataFrameCreator.treemap_frame(
+            self.latest_state(), self.change_counts(), self.path_table()))
+
+    def snapshots(self, period='Y'):
+        """
+        DataFrameCreator.create_time_series_df と同じ、期間ごとの状態の辞書。
+
+        :param period: 期間（'Y', 'M', 'W', 'D' など）
+        """
+        return self._memoize(('snapshots', period), lambda: DataFrameCreator.create_time_series_df(
+            self.treemap_frame()[0], period, self.path_table()))
+
+    def extension_stats(self):
+        """DataFrameCreator.create_extension_df と同じ、拡張子ごとの合計行数とファイル数。"""
+        return self._memoize(('extension_stats',), lambda: DataFrameCreator.extension_stats(self.latest_state()))
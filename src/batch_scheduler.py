@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool, cpu_count
+
+from .git_repository import GitRepository
+from .repotimelapse import RepositoryTimelapse
+from .telemetry import Telemetry
+
+
+class BatchScheduler:
+    """
+    マニフェストに書かれた複数のリポジトリを、1つの共有ワーカープールで解析します。
+
+    リポジトリは優先度の高い順に開始し、同時に解析するリポジトリの数は max_concurrent_repos までです。
+    コミットの処理は全てのリポジトリで同じプールに投入されるため、リポジトリごとにプールを
+    起動し直す必要がなく、同時に動くリポジトリが増えてもワーカーの数はコア数を超えません。
+    1つのリポジトリで発生した例外は記録するだけで、他のリポジトリの解析は続けます。
+    出力先（out/<owner>/<repo>）が同じになるリポジトリは、同時には解析しません。
+
+    マニフェストはJSONの配列で、要素はリポジトリのURL（またはパス）か、次のキーを持つオブジェクトです::
+
+        [
+          "https://github.com/stleary/JSON-java.git",
+          {"repo_url": "https://github.com/owner/big.git", "priority": 10,
+           "clone_mode": "blobless", "extensions": [".java"], "backend": "log"}
+        ]
+
+    repo_url / priority / clone_mode / extensions 以外のキーは
+    RepositoryTimelapse.run_extended_analysis の引数として渡します。
+    """
+
+    def __init__(self, manifest_path, num_processes=None, max_concurrent_repos=2, defaults=None,
+                 profile_format=None, profile_capture=None):
+        """
+        :param manifest_path: マニフェスト（JSON）のパス
+        :param num_processes: 共有ワーカープールのプロセス数（Noneならコア数）
+        :param max_concurrent_repos: 同時に解析するリポジトリの数の上限
+        :param defaults: マニフェストで指定されなかった項目の既定値
+        :param profile_format: 指定した場合、リポジトリごとに計測結果を 'json' または 'chrome' で書き出します
+        :param profile_capture: 計測する場合に、ステージごとに取るプロファイル（'cprofile' または 'sample'）
+        """
+        self.manifest_path = manifest_path
+        self.num_processes = num_processes or cpu_count()
+        self.max_concurrent_repos = max_concurrent_repos
+        self.defaults = defaults or {}
+        self.profile_format = profile_format
+        self.profile_capture = profile_capture
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _output_lock(self, repo_url):
+        info = GitRepository.parse_repo_url(repo_url)
+        with self._locks_lock:
+            return self._locks.setdefault((info['owner'], info['repo']), threading.Lock())
+
+    def load_manifest(self):
+        """
+        マニフェストを読み込み、優先度の高い順（同じ優先度ならマニフェストの順）に並べた設定のリストを返します。
+        """
+        with open(self.manifest_path, encoding='utf-8') as f:
+            entries = json.load(f)
+        if not isinstance(entries, list):
+            raise ValueError(f"Manifest must be a JSON array: {self.manifest_path}")
+
+        jobs = []
+        for entry in entries:
+            if isinstance(entry, str):
+                entry = {'repo_url': entry}
+            if not entry.get('repo_url'):
+                raise ValueError(f"Manifest entry has no repo_url: {entry}")
+            jobs.append({**self.defaults, **entry})
+        return sorted(jobs, key=lambda job: -job.get('priority', 0))
+
+    def run_job(self, job, pool):
+        """
+        1つのリポジトリを解析し、結果を辞書で返します。例外は外に出さずに結果に記録します。
+        """
+        options = dict(job)
+        repo_url = options.pop('repo_url')
+        options.pop('priority', None)
+        clone_mode = options.pop('clone_mode', 'full')
+        file_extensions = options.pop('extensions', None)
+        if 'resolution' in options:
+            options['resolution'] = tuple(options['resolution'])
+
+        result = {'repo_url': repo_url, 'priority': job.get('priority', 0)}
+        start_time = time.time()
+        processor = None
+        telemetry = Telemetry(capture=self.profile_capture) if self.profile_format else None
+        try:
+            with self._output_lock(repo_url):
+                processor = RepositoryTimelapse(repo_url, clone_mode, telemetry)
+                result['output_dir'] = processor.repo.output_dir
+                processor.run_extended_analysis(file_extensions, pool=pool, **options)
+                if telemetry is not None:
+                    result['profile'] = processor.write_profile(self.profile_format)
+            result['status'] = 'succeeded'
+        except Exception as e:
+            print(f"Failed to analyze {repo_url}: {e}")
+            result['status'] = 'failed'
+            result['error'] = f"{type(e).__name__}: {e}"
+            result['traceback'] = traceback.format_exc()
+        finally:
+            if processor is not None:
+                processor.repo.close()
+        result['seconds'] = round(time.time() - start_time, 3)
+        return result
+
+    def run(self, summary_path=os.path.join("out", "batch_summary.json")):
+        """
+        マニフェストの全てのリポジトリを解析し、リポジトリごとの結果をsummary_pathに書き出します。
+
+        :return: 結果の辞書のリスト（優先度の順）
+        """
+        jobs = self.load_manifest()
+        print(f"Analyzing {len(jobs)} repositories with {self.num_processes} shared workers "
+              f"({self.max_concurrent_repos} at a time)")
+
+        # スレッドを起動する前にプールをforkしておく
+        with Pool(processes=self.num_processes) as pool:
+            with ThreadPoolExecutor(max_workers=self.max_concurrent_repos) as executor:
+                futures = [executor.submit(self.run_job, job, pool) for job in jobs]
+                results = [future.result() for future in futures]
+
+        os.makedirs(os.path.dirname(summary_path) or '.', exist_ok=True)
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+        failed = [r['repo_url'] for r in results if r['status'] == 'failed']
+        print(f"Batch finished: {len(results) - len(failed)} succeeded, {len(failed)} failed. "
+              f"Summary: {summary_path}")
+        return results
@@ -0,0 +1,163 @@
+import os
+import subprocess
+import threading
+
+from .line_counter import LineCounter
+
+
+class BlobReader:
+    """
+    常駐する `git cat-file --batch` プロセスを使ってblobを読み込みます。
+
+    要求はまとめてパイプに書き込み、応答の読み込みと並行して処理するため、
+    オブジェクトごとの往復待ちが発生しません。プロセスはOSのプロセスごとに起動し直すため、
+    Poolのワーカーでもそれぞれ専用のプロセスを持ちます。
+    """
+
+    def __init__(self, repo_path, num_processes=1):
+        """
+        :param repo_path: リポジトリのパス
+        :param num_processes: ワーカーごとに起動する `git cat-file --batch` の数
+        """
+        self.repo_path = repo_path
+        self.num_processes = num_processes
+        self._processes = []
+        self._pid = None
+        self._lock = threading.Lock()
+        # 計測用の累計（Telemetry のカウンター名。line_counts で更新します）
+        self.stats = {'blobs_read': 0, 'bytes_scanned': 0, 'blobs_binary': 0, 'blobs_oversized': 0}
+
+    def __getstate__(self):
+        # サブプロセスのパイプとロックはプロセス間で受け渡せない
+        state = self.__dict__.copy()
+        state['_processes'] = []
+        state['_pid'] = None
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _ensure_processes(self):
+        if self._pid != os.getpid():
+            # fork後の子プロセスでは親のパイプを使わず、新しく起動する
+            self._processes = []
+            self._pid = os.getpid()
+        self._processes = [p for p in self._processes if p.poll() is None]
+        while len(self._processes) < self.num_processes:
+            self._processes.append(subprocess.Popen(
+                ['git', '-C', self.repo_path, 'cat-file', '--batch'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            ))
+        return self._processes
+
+    @staticmethod
+    def _write_requests(process, specs):
+        for spec in specs:
+            process.stdin.write(spec.encode('utf-8') + b'\n')
+        process.stdin.flush()
+
+    @staticmethod
+    def _read_response(process):
+        header = process.stdout.readline()
+        parts = header.split()
+        if len(parts) != 3 or parts[-1] in (b'missing', b'ambiguous'):
+            # "<spec> missing" や "<spec> ambiguous"
+            return None, None
+        size = int(parts[2])
+        data = process.stdout.read(size)
+        process.stdout.read(1)  # 末尾の改行
+        return size, data
+
+    @staticmethod
+    def _count_response(process, counter):
+        # 内容をまとめて読まず、パイプから少しずつ読みながら数える
+        header = process.stdout.readline()
+        parts = header.split()
+        if len(parts) != 3 or parts[-1] in (b'missing', b'ambiguous'):
+            return None, None
+        size = int(parts[2])
+        lines = counter.count_stream(process.stdout.read, size)
+        process.stdout.read(1)  # 末尾の改行
+        return size, lines
+
+    def iter_objects(self, specs):
+        """
+        オブジェクトの内容を要求した順に返します。
+
+        :param specs: blobのSHA、または `<commit>:<path>` 形式のオブジェクト指定のリスト
+        :return: (size, data) を順に返すイテレータ。見つからない場合は (None, None)
+        """
+        return self._iter_responses(specs, self._read_response)
+
+    def _iter_responses(self, specs, read_response):
+        specs = list(specs)
+        if not specs:
+            return
+        with self._lock:
+            processes = self._ensure_processes()
+            chunk = -(-len(specs) // len(processes))
+            assignments = [(p, specs[i * chunk:(i + 1) * chunk]) for i, p in enumerate(processes)]
+
+            # 書き込みは別スレッドで行い、応答の読み込みと重ねる
+            writers = []
+            for process, assigned in assignments:
+                if assigned:
+                    writer = threading.Thread(target=self._write_requests, args=(process, assigned), daemon=True)
+                    writer.start()
+                    writers.append(writer)
+
+            remaining = [len(assigned) for _, assigned in assignments]
+            try:
+                for index, (process, _) in enumerate(assignments):
+                    while remaining[index]:
+                        response = read_response(process)
+                        remaining[index] -= 1
+                        yield response
+            finally:
+                # 途中で打ち切られた場合も、次の要求とずれないよう残りの応答を読み捨てる
+                for index, (process, _) in enumerate(assignments):
+                    for _ in range(remaining[index]):
+                        read_response(process)
+                for writer in writers:
+                    writer.join()
+
+    def read(self, spec):
+        """
+        1つのオブジェクトの内容を返します。見つからない場合はNoneを返します。
+        """
+        for _, data in self.iter_objects([spec]):
+            return data
+
+    def line_counts(self, specs, counter=None):
+        """
+        オブジェクトのサイズと行数をまとめて取得します。内容はデコードせず、読みながら数えます。
+
+        :param specs: blobのSHA、または `<commit>:<path>` 形式のオブジェクト指定のリスト
+        :param counter: LineCounter（Noneなら既定の設定）
+        :return: (size, lines) のリスト。lines は LineCounter.count_stream の結果で、見つからない場合は (None, 0)
+        """
+        counter = counter or LineCounter()
+        results = []
+        for size, lines in self._iter_responses(specs, lambda process: self._count_response(process, counter)):
+            if size is None:
+                results.append((None, 0))
+                continue
+            self.stats['blobs_read'] += 1
+            if lines == LineCounter.BINARY:
+                self.stats['blobs_binary'] += 1
+            elif lines == LineCounter.OVERSIZED:
+                self.stats['blobs_oversized'] += 1
+            else:
+                self.stats['bytes_scanned'] += size
+            results.append((size, lines))
+        return results
+
+    def close(self):
+        if self._pid == os.getpid():
+            for process in self._processes:
+                process.stdin.close()
+                process.wait()
+        self._processes = []
+        self._pid = None
@@ -0,0 +1,92 @@
+from .commit_stream import CommitStream
+
+
+class ChurnStream(CommitStream):
+    """
+    1つの `git log --numstat -z` サブプロセスの出力を逐次パースし、
+    コミットごとのファイルの追加行数・削除行数を返します。
+
+    各要素は (commit_info, files) のタプルです。
+    commit_info は Commit / Author / Date_Unix / Date_ISO / Message を持つ辞書、
+    files は (insertions, deletions, path, old_path) のリストです。
+    バイナリファイルは insertions / deletions がNone、リネームでなければ old_path はNoneです。
+    パスの絞り込みは pathspec として git に渡すので、対象外のファイルの差分は計算されません。
+    """
+
+    FORMAT = '%H%x00%an%x00%ct%x00%cI%x00%B'
+
+    def __init__(self, repo_path, rev_range, pathspecs=None, reverse=False, chunk_size=1 << 16,
+                 traversal='first-parent', renames=True, diff_merges=None):
+        """
+        :param repo_path: リポジトリのパス
+        :param rev_range: `git log` に渡すリビジョン（ブランチ名や `a..b` など）
+        :param pathspecs: 対象とするパスの pathspec のリスト（Noneなら全て）
+        :param reverse: Trueなら古いコミットから順に返します
+        :param chunk_size: パイプから一度に読み込むバイト数
+        :param traversal: 走査の方法（CommitStream.TRAVERSALS のいずれか）
+        :param renames: Falseならリネームを検出せず、元のパスの削除と新しいパスの追加として返します
+        :param diff_merges: マージコミットの差分の取り方（'first-parent' または 'off'）。
+                            Noneなら traversal に合わせます（log_options を参照）
+        """
+        super().__init__(repo_path, rev_range, reverse, chunk_size, traversal, renames)
+        if diff_merges not in (None, 'first-parent', 'off'):
+            raise ValueError(f"Invalid diff_merges: {diff_merges}. Use 'first-parent' or 'off'.")
+        self.pathspecs = pathspecs or []
+        self.diff_merges = diff_merges
+
+    @classmethod
+    def log_options(cls, traversal, diff_merges=None):
+        """
+        'first-parent' ではマージコミットを第1親との差分（側枝の変更をまとめたもの）として数えます。
+        それ以外では側枝のコミットをそれぞれ数えるので、既定ではマージコミットの差分は出力しません。
+        """
+        if diff_merges is None:
+            diff_merges = 'first-parent' if traversal == 'first-parent' else 'off'
+        return cls.rev_list_options(traversal) + [f'--diff-merges={diff_merges}']
+
+    def command(self):
+        return [
+            'git', '-C', self.repo_path, 'log',
+            '-z', '--numstat', '--root', '-M' if self.renames else '--no-renames', '--full-history',
+        ] + self.log_options(self.traversal, self.diff_merges) + [
+            f'--format={self.FORMAT}',
+        ] + (['--reverse'] if self.reverse else []) + [self.rev_range, '--'] + self.pathspecs
+
+    @staticmethod
+    def _count(value):
+        return None if value == b'-' else int(value)
+
+    def _parse(self, tokens):
+        commit_info = None
+        files = []
+
+        for token in tokens:
+            token = token.lstrip(b'\n')
+            if not token:
+                continue
+
+            if b'\t' in token:
+                # "<追加>\t<削除>\t<パス>"。リネームはパスが空で、元のパスと新しいパスが続く
+                insertions, deletions, path = token.split(b'\t', 2)
+                old_path = None
+                if not path:
+                    old_path = next(tokens).decode('utf-8', errors='replace')
+                    path = next(tokens)
+                files.append((self._count(insertions), self._count(deletions),
+                              path.decode('utf-8', errors='replace'), old_path))
+                continue
+
+            # コミットヘッダー: %H, %an, %ct, %cI, %B
+            if commit_info is not None:
+                yield commit_info, files
+            commit_info = {
+                'Commit': token.decode('ascii'),
+                'Author': next(tokens).decode('utf-8', errors='replace'),
+                'Date_Unix': int(next(tokens)),
+                'Date_ISO': next(tokens).decode('ascii'),
+                'Message': next(tokens).decode('utf-8', errors='replace'),
+            }
+            files = []
+
+        if commit_info is not None:
+            yield commit_info, files
@@ -6,13 +6,77 @@ class CLI:
         self._add_arguments()
 
     def _add_arguments(self):
-        self.parser.add_argument('--repo_url', type=str, default="https://github.com/stleary/JSON-java.git", help='URL of the repository to analyze')
+        self.parser.add_argument('--repo_url', type=str, default="https://github.com/stleary/JSON-java.git", help='URL or local path of the repository to analyze')
+        self.parser.add_argument('--clone-mode', choices=['full', 'blobless', 'mirror'], default='full',
+                                 help='How to clone the repository: a full clone, a blobless partial clone that '
+                                      'fetches only the blobs to analyze, or a bare mirror')
+        self.parser.add_argument('--manifest', type=str, default=None,
+                                 help='JSON manifest of repositories to analyze in one batch with a shared worker pool')
+        self.parser.add_argument('--max-concurrent-repos', type=int, default=2,
+                                 help='Maximum number of repositories analyzed at the same time in batch mode')
         self.parser.add_argument('--extensions', nargs='+', default=['.gradle', '.java', '.kt', '.xml'], 
                                  help='File extensions to analyze (e.g., .java .kt .xml)')
         self.parser.add_argument('--output', type=str, default='out', help='Output directory for results')
+        self.parser.add_argument('--full-rebuild', action='store_true',
+                                 help='Rebuild commit_history.csv from scratch instead of appending new commits')
+        self.parser.add_argument('--backend', choices=['gitpython', 'log'], default='gitpython',
+                                 help='Commit ingestion backend: per-commit GitPython diffs or a single streamed git log')
+        self.parser.add_argument('--traversal', choices=['first-parent', 'full', 'no-merges'], default='first-parent',
+                                 help='Commits to analyze: the mainline only (first parents), every commit with '
+                                      'merges counted once, or every commit except merges. no-merges drops changes '
+                                      'made in merge commits themselves (conflict resolutions, evil merges), so its '
+                                      'final state can differ from HEAD')
+        self.parser.add_argument('--sample', type=self._sample, default=None,
+                                 help='Only compute the state at period boundaries (Y, M, W, D) or every N commits '
+                                      'of the mainline, skipping the diffs of the commits in between')
+        self.parser.add_argument('--max-blob-size', type=int, default=None,
+                                 help='Skip counting lines of blobs larger than this many bytes (they count as 0 '
+                                      'lines, like binary files)')
+        self.parser.add_argument('--storage', choices=['csv', 'columnar'], default='csv',
+                                 help='Commit history storage: CSV or typed memory-mapped columnar store')
+        self.parser.add_argument('--export-csv', action='store_true',
+                                 help='Also export commit_history.csv when using columnar storage')
+        self.parser.add_argument('--treemap-format', choices=['html', 'player'], default='html',
+                                 help='Animated treemap output: a single self-contained HTML, or a player that '
+                                      'loads delta-encoded frames on demand')
+        self.parser.add_argument('--node-budget', type=int, default=None,
+                                 help='Maximum number of treemap nodes; smaller files and subtrees are collapsed '
+                                      'into "(other)" nodes')
+        self.parser.add_argument('--video', action='store_true',
+                                 help='Also render the treemap and line count race as MP4 videos with ffmpeg')
+        self.parser.add_argument('--fps', type=int, default=30, help='Frame rate of the MP4 videos')
+        self.parser.add_argument('--churn', action='store_true',
+                                 help='Also write per-author and per-directory insertion/deletion tables')
+        self.parser.add_argument('--profile', action='store_true',
+                                 help='Record wall time, CPU time, peak RSS and counters per stage into the output '
+                                      'directory')
+        self.parser.add_argument('--profile-format', choices=['json', 'chrome'], default='json',
+                                 help='Profile output: a JSON summary or a Chrome trace (chrome://tracing, Perfetto)')
+        self.parser.add_argument('--profile-capture', choices=['cprofile', 'sample'], default=None,
+                                 help='Also capture a cProfile or sampled-stack profile of each top-level stage')
+        self.parser.add_argument('--resolution', type=self._resolution, default=(1280, 720),
+                                 help='Resolution of the MP4 videos as WIDTHxHEIGHT (e.g. 1920x1080)')
+
+    @staticmethod
+    def _resolution(value):
+        try:
+            width, height = (int(v) for v in value.lower().split('x'))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid resolution: {value!r} (expected WIDTHxHEIGHT)")
+        if width <= 0 or height <= 0 or width % 2 or height % 2:
+            raise argparse.ArgumentTypeError(f"invalid resolution: {value!r} (width and height must be even)")
+        return width, height
+
+    @staticmethod
+    def _sample(value):
+        if value.isdigit():
+            if int(value) <= 0:
+                raise argparse.ArgumentTypeError(f"invalid sample: {value!r} (must be a positive integer)")
+            return int(value)
+        return value
 
     def parse_args(self):
         args = self.parser.parse_args()
-        if not args.repo_url:
+        if not args.repo_url and not args.manifest:
             args.repo_url = input("Enter the URL of the repository you want to analyze: ")
         return args
\ No newline at end of file
@@ -1,3 +1,11 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .churn_stream import ChurnStream
+
+
 class CommitAnalyzer:
     @staticmethod
     def analyze_commits(repo, commits, directory_path):
@@ -26,4 +34,121 @@ class CommitAnalyzer:
                 }
                 files.append(file_info)
         return files
-    
+
+    @staticmethod
+    def pathspecs(directory_path='', file_extensions=None):
+        """
+        パスの先頭（directory_path）と拡張子の絞り込みを `git log` の pathspec にします。
+        pathspec の `*` は `/` にも一致するので、`src/*.java` は src 以下の全ての .java に一致します。
+
+        :return: pathspec のリスト（絞り込まない場合は空）
+        """
+        if file_extensions:
+            return [f"{directory_path}*{ext}" for ext in file_extensions]
+        return [f"{directory_path}*"] if directory_path else []
+
+    @staticmethod
+    def analyze_range(repo_path, rev_range='HEAD', directory_path='', traversal='first-parent'):
+        """
+        analyze_commits と同じ形式の結果を、1本の `git log --numstat -z` から作ります（新しい順）。
+        コミットごとに `git diff --numstat` を起動しないので、長い履歴でも速く処理できます。
+        commit.stats と同じくリネームは削除と追加として数え、バイナリファイルの insertions / deletions は0です。
+        マージコミットも commit.stats と同じく第1親との差分を数えます（'full' では側枝のコミットの変更も
+        それぞれ数えるので、churn_frame と違い同じ変更がマージでもう一度現れます）。
+        directory_path は pathspec として git に渡すので、そのパスのファイルを変更したコミットだけを返します。
+
+        :param repo_path: リポジトリのパス
+        :param rev_range: `git log` に渡すリビジョン
+        :param directory_path: 対象とするパスの先頭
+        :param traversal: 走査の方法（CommitStream.TRAVERSALS のいずれか）
+        """
+        commit_data = []
+        stream = ChurnStream(repo_path, rev_range, CommitAnalyzer.pathspecs(directory_path), traversal=traversal,
+                             renames=False, diff_merges='first-parent')
+        for commit_info, files in stream:
+            commit_data.append({
+                "commit_hexsha": commit_info['Commit'],
+                "author": commit_info['Author'],
+                "date": datetime.fromisoformat(commit_info['Date_ISO']),
+                "message": commit_info['Message'],
+                "files": [{"file_path": path, "insertions": insertions or 0, "deletions": deletions or 0}
+                          for insertions, deletions, path, _ in files]
+            })
+        return commit_data
+
+    @staticmethod
+    def churn_frame(repo_path, rev_range='HEAD', directory_path='', file_extensions=None,
+                    traversal='first-parent'):
+        """
+        コミットとファイルの組ごとの追加行数・削除行数を、1本の `git log --numstat -z` から読み込みます。
+        リネームは検出するので（OldPath に元のパス）、移動しただけのファイルは変更行数に数えません。
+
+        :return: Commit / Author / File / OldPath はCategorical、Date_Unix / Insertions / Deletions はint64、
+                 Binary はbool、date はUTCの日時のDataFrame（古い順）
+        """
+        columns = {name: [] for name in ('Commit', 'Author', 'Date_Unix', 'File', 'OldPath',
+                                         'Insertions', 'Deletions', 'Binary')}
+        stream = ChurnStream(repo_path, rev_range, CommitAnalyzer.pathspecs(directory_path, file_extensions),
+                             reverse=True, traversal=traversal)
+        for commit_info, files in stream:
+            for insertions, deletions, path, old_path in files:
+                columns['Commit'].append(commit_info['Commit'])
+                columns['Author'].append(commit_info['Author'])
+                columns['Date_Unix'].append(commit_info['Date_Unix'])
+                columns['File'].append(path)
+                columns['OldPath'].append(old_path)
+                columns['Insertions'].append(insertions or 0)
+                columns['Deletions'].append(deletions or 0)
+                columns['Binary'].append(insertions is None)
+
+        df = pd.DataFrame({
+            'Commit': pd.Categorical(columns['Commit']),
+            'Author': pd.Categorical(columns['Author']),
+            'Date_Unix': np.array(columns['Date_Unix'], dtype=np.int64),
+            'File': pd.Categorical(columns['File']),
+            'OldPath': pd.Categorical(columns['OldPath']),
+            'Insertions': np.array(columns['Insertions'], dtype=np.int64),
+            'Deletions': np.array(columns['Deletions'], dtype=np.int64),
+            'Binary': np.array(columns['Binary'], dtype=bool),
+        })
+        df['date'] = pd.to_datetime(df['Date_Unix'], unit='s', utc=True)
+        return df
+
+    @staticmethod
+    def _churn_table(df, keys, by):
+        table = df.groupby(keys, observed=True).agg(
+            Commits=('Commit', 'nunique'),
+            Files=('File', 'nunique'),
+            Insertions=('Insertions', 'sum'),
+            Deletions=('Deletions', 'sum'),
+        )
+        table['Churn'] = table['Insertions'] + table['Deletions']
+        table = table.astype(np.int64).sort_values('Churn', ascending=False, kind='stable')
+        table.index.name = by
+        return table.reset_index()
+
+    @staticmethod
+    def author_churn(df):
+        """
+        作者ごとのコミット数・変更したファイル数・追加行数・削除行数・その合計（Churn）を返します。
+
+        :param df: churn_frame が返すDataFrame
+        :return: Churn の多い順のDataFrame（Author 以外の列はint64）
+        """
+        return CommitAnalyzer._churn_table(df, 'Author', 'Author')
+
+    @staticmethod
+    def directory_churn(df, depth=1):
+        """
+        ディレクトリごとの author_churn と同じ集計を返します。
+
+        :param df: churn_frame が返すDataFrame
+        :param depth: 集計するディレクトリの階層（1ならトップレベルのディレクトリ）。
+                      それより浅い位置のファイルはその親ディレクトリ（ルートなら '.'）に数えます
+        :return: Churn の多い順のDataFrame（Directory 以外の列はint64）
+        """
+        # パスの分割はファイルごとではなくカテゴリごとに1回だけ行う
+        categories = df['File'].cat.categories
+        directories = pd.Index(['/'.join(path.split('/')[:-1][:depth]) or '.' for path in categories], dtype=object)
+        keys = pd.Categorical(directories[df['File'].cat.codes.to_numpy()])
+        return CommitAnalyzer._churn_table(df, keys, 'Directory')
@@ -0,0 +1,154 @@
+import subprocess
+
+
+class CommitStream:
+    """
+    1つの `git log --raw -z` サブプロセスの出力を逐次パースし、
+    コミットごとの変更一覧を返します。
+
+    各要素は (commit_info, parents, changes) のタプルです。
+    commit_info は Commit / Date_Unix / Date_ISO を持つ辞書、parents は親コミットのSHAのリスト、
+    changes は (change_type, a_path, b_path, b_blob_sha) のリストで、
+    GitPython の Diff.change_type と同じ A / M / D / R / T などの種別を持ちます。
+    """
+
+    FORMAT = '%H%x00%P%x00%ct%x00%cI'
+    NULL_SHA = '0' * 40
+
+    # 走査の方法: 'first-parent'（第1親だけをたどる本流）、'full'（全てのコミット。マージは全ての親との差分）、
+    # 'no-merges'（マージコミットを除く全てのコミット）
+    TRAVERSALS = ('first-parent', 'full', 'no-merges')
+
+    def __init__(self, repo_path, rev_range, reverse=False, chunk_size=1 << 16, traversal='first-parent',
+                 renames=True):
+        """
+        :param repo_path: リポジトリのパス
+        :param rev_range: `git log` に渡すリビジョン（ブランチ名や `a..b` など）
+        :param reverse: Trueなら古いコミットから順に返します
+        :param chunk_size: パイプから一度に読み込むバイト数
+        :param traversal: 走査の方法（TRAVERSALS のいずれか）
+        :param renames: Falseならリネームを検出せず（blobの内容を読まずに済む）、削除と追加として返します
+        """
+        self.repo_path = repo_path
+        self.rev_range = rev_range
+        self.reverse = reverse
+        self.chunk_size = chunk_size
+        self.traversal = traversal
+        self.renames = renames
+
+    @classmethod
+    def rev_list_options(cls, traversal):
+        """走査の方法に対応する `git rev-list` / `git log` のコミットの選び方のオプションを返します。"""
+        if traversal not in cls.TRAVERSALS:
+            raise ValueError(f"Invalid traversal: {traversal}. Use 'first-parent', 'full' or 'no-merges'.")
+        return {'first-parent': ['--first-parent'], 'full': [], 'no-merges': ['--no-merges']}[traversal]
+
+    @classmethod
+    def log_options(cls, traversal):
+        """
+        走査の方法に対応する `git log` のオプションを返します。
+        'full' ではマージコミットを親ごとの差分として出力します（同じコミットが親の数だけ続きます）。
+        それ以外では GitPython の parent.diff(commit) と同様に第1親との差分を出力します。
+        """
+        diff_merges = 'separate' if traversal == 'full' else 'first-parent'
+        return cls.rev_list_options(traversal) + [f'--diff-merges={diff_merges}']
+
+    @staticmethod
+    def union_changes(*change_lists):
+        """
+        複数の親との変更一覧を、変更後のパスごとに1つにまとめます。
+
+        変更後の内容はどの親との差分でも同じなので、同じパスの変更は最初のものを使います。
+        ただしリネームは元のパスの削除も表すので、追加・変更より優先します。
+        """
+        if len(change_lists) == 1:
+            return change_lists[0]
+        combined = {}
+        for changes in change_lists:
+            for change in changes:
+                change_type, a_path, b_path, _ = change
+                key = (change_type == 'D', b_path or a_path)
+                if key not in combined or (change_type == 'R' and combined[key][0] != 'R'):
+                    combined[key] = change
+        return list(combined.values())
+
+    def command(self):
+        return [
+            'git', '-C', self.repo_path, 'log',
+            '-z', '--raw', '--no-abbrev', '--root', '-M' if self.renames else '--no-renames',
+        ] + self.log_options(self.traversal) + [
+            f'--format={self.FORMAT}',
+        ] + (['--reverse'] if self.reverse else []) + [self.rev_range, '--']
+
+    def _tokens(self, stream):
+        """NUL区切りのトークンをチャンク単位で読み出します。"""
+        buffer = b''
+        while True:
+            chunk = stream.read(self.chunk_size)
+            if not chunk:
+                break
+            buffer += chunk
+            parts = buffer.split(b'\0')
+            buffer = parts.pop()
+            yield from parts
+        if buffer:
+            yield buffer
+
+    def __iter__(self):
+        process = subprocess.Popen(self.command(), stdout=subprocess.PIPE)
+        try:
+            yield from self._parse(self._tokens(process.stdout))
+        finally:
+            process.stdout.close()
+            process.wait()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, self.command())
+
+    def _parse(self, tokens):
+        commit_info = None
+        parents = []
+        changes = []
+        change_lists = []
+
+        for token in tokens:
+            token = token.lstrip(b'\n')
+            if not token:
+                continue
+
+            if token.startswith(b':'):
+                # ":<a_mode> <b_mode> <a_sha> <b_sha> <status>" の後にパスが続く
+                _, b_mode, _, b_sha, status = token[1:].decode('ascii').split(' ')
+                a_path = next(tokens).decode('utf-8', errors='replace')
+                change_type = status[0]
+                if change_type in ('R', 'C'):
+                    b_path = next(tokens).decode('utf-8', errors='replace')
+                else:
+                    b_path = a_path
+                # サブモジュール（gitlink）は blob ではないので行数を数えない
+                if b_sha == self.NULL_SHA or b_mode == '160000':
+                    b_sha = None
+                changes.append((change_type, a_path, b_path, b_sha))
+                continue
+
+            # コミットヘッダー: %H, %P, %ct, %cI
+            hexsha = token.decode('ascii')
+            if commit_info is not None and commit_info['Commit'] == hexsha:
+                # 'full' のマージコミットは親ごとに続けて出力されるので、変更一覧をまとめる
+                for _ in range(3):
+                    next(tokens)
+                change_lists.append(changes)
+                changes = []
+                continue
+            if commit_info is not None:
+                yield commit_info, parents, self.union_changes(*change_lists, changes)
+            parents = next(tokens).decode('ascii').split()
+            commit_info = {
+                'Commit': hexsha,
+                'Date_Unix': int(next(tokens)),
+                'Date_ISO': next(tokens).decode('ascii'),
+            }
+            changes = []
+            change_lists = []
+
+        if commit_info is not None:
+            yield commit_info, parents, self.union_changes(*change_lists, changes)
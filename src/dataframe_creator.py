@@ -1,49 +1,99 @@
+import numpy as np
 import pandas as pd
 import os
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .history_store import HistoryStore
+from .snapshot_engine import SnapshotEngine
+from .path_table import PathTable
+from .line_counter import LineCounter
 
 class DataFrameCreator:
+    # 値の種類が少ない文字列の列はカテゴリとして読み込む
+    CATEGORICAL_COLUMNS = ['Commit', 'File', 'OldPath', 'Change', 'Type']
+
     @staticmethod
-    def create_dataframe(repo, directory_path, commit_data, max_workers=4):
-        data = {}
-        current_files = {}
+    def create_dataframe(repo, directory_path, commit_data, max_workers=4, blob_reader=None, line_counter=None):
+        """
+        コミットごとのファイル行数を表す疎なDataFrameを作成します。
+
+        各コミットでは変更されたファイルの行数だけを数え、コミット順に（古い順に）反映します。
+        値はそのコミットで変わったファイルだけが持ち（削除されたファイルは0）、変わらないファイルは欠損値です。
+        列は欠損値を埋め値とする Sparse[float64] なので、メモリ使用量は変更の数に比例します。
+        コミット時点の全ファイルの行数の表は `.ffill().fillna(0)` で得られます（aggregate_dataframe は
+        疎なまま期間ごとに集計します）。
+
+        :param repo: git.Repo
+        :param directory_path: 対象とするディレクトリのパス
+        :param commit_data: CommitAnalyzer.analyze_commits の結果（新しい順）
+        :param max_workers: 行数を数えるスレッド数
+        :param blob_reader: BlobReader を渡すと、コミットごとのblobをまとめて読み込みます
+        :param line_counter: LineCounter（Noneなら既定の設定。バイナリとサイズ超過のファイルは0行です）
+        :return: 日時×ファイルの行数のDataFrame
+        """
+        line_counter = line_counter or LineCounter()
+        # git.Repo の cat-file プロセスはスレッド間で共有できないので、repo の読み込みは1スレッドずつ行う
+        repo_lock = threading.Lock()
 
-        def process_commit(commit):
+        def count_commit(commit):
+            commit_hexsha = commit["commit_hexsha"]
+            file_paths = list(dict.fromkeys(file["file_path"] for file in commit["files"]
+                                            if file["file_path"].startswith(directory_path)))
             try:
-                commit_date = commit["date"].strftime('%Y-%m-%d %H:%M:%S')
-                commit_hexsha = commit["commit_hexsha"]
-                
-                changed_files = {file["file_path"] for file in commit["files"] if file["file_path"].startswith(directory_path)}
-                files_to_update = set(current_files.keys()) | changed_files
-                
+                if blob_reader is not None:
+                    line_counts = blob_reader.line_counts(
+                        [f"{commit_hexsha}:{file_path[len(directory_path):]}" for file_path in file_paths],
+                        counter=line_counter
+                    )
+                    # 存在しないパス（削除されたファイル）は0行
+                    return commit, {file_path: LineCounter.lines(line_count) if size is not None else 0
+                                    for file_path, (size, line_count) in zip(file_paths, line_counts)}
+
                 updated_files = {}
-                commit_tree = repo.commit(commit_hexsha).tree
-                for file_path in files_to_update:
-                    try:
-                        file_blob = commit_tree[file_path[len(directory_path):]]
-                        line_count = file_blob.data_stream.read().decode('utf-8').count('\n')
-                        if line_count > 0:
-                            updated_files[file_path] = line_count
-                    except KeyError:
-                        pass
-
-                return commit_date, updated_files
+                with repo_lock:
+                    commit_tree = repo.commit(commit_hexsha).tree
+                    for file_path in file_paths:
+                        try:
+                            file_blob = commit_tree[file_path[len(directory_path):]]
+                        except KeyError:
+                            updated_files[file_path] = 0
+                            continue
+                        updated_files[file_path] = LineCounter.lines(
+                            line_counter.count_stream(file_blob.data_stream.read, file_blob.size))
+                return commit, updated_files
             except Exception as e:
                 print(f"Error processing commit {commit_hexsha}: {str(e)}")
-                return None, None
+                return commit, None
 
+        rows = {}       # 日時 -> 行番号
+        changes = {}    # ファイルのパス -> {行番号: 行数}
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_commit = {executor.submit(process_commit, commit): commit for commit in reversed(commit_data)}
-            
-            for future in tqdm(as_completed(future_to_commit), total=len(commit_data), desc="Processing commits"):
-                commit_date, updated_files = future.result()
-                if commit_date and updated_files:
-                    current_files.update(updated_files)
-                    data[commit_date] = current_files.copy()
- 
-        return pd.DataFrame(data).T.fillna(0)
-    
+            # map は結果を投入した順（古いコミットから）に返すので、数えるのは並列でも反映はコミット順になる
+            results = executor.map(count_commit, reversed(commit_data))
+            for commit, updated_files in tqdm(results, total=len(commit_data), desc="Processing commits"):
+                if not updated_files:
+                    continue
+                # 出現したことのないファイルの削除は記録しない
+                updated_files = {path: lines for path, lines in updated_files.items()
+                                 if lines > 0 or path in changes}
+                if not updated_files:
+                    continue
+                # 同じ日時のコミットは1行にまとめる（後のコミットの値を使う）
+                row = rows.setdefault(commit["date"].strftime('%Y-%m-%d %H:%M:%S'), len(rows))
+                for file_path, lines in updated_files.items():
+                    changes.setdefault(file_path, {})[row] = lines
+
+        # 1列ずつ疎な配列にする（密な行列は作らない）
+        buffer = np.full(len(rows), np.nan)
+        data = {}
+        for file_path, values in changes.items():
+            positions = np.fromiter(values.keys(), dtype=np.int64, count=len(values))
+            buffer[positions] = list(values.values())
+            data[file_path] = pd.arrays.SparseArray(buffer, fill_value=np.nan)
+            buffer[positions] = np.nan
+        return pd.DataFrame(data, index=pd.Index(list(rows), dtype=object))
+
     @staticmethod
     def process_dataframe(df):
         df.columns = [os.path.basename(col) for col in df.columns]
@@ -53,98 +103,187 @@ class DataFrameCreator:
     def aggregate_dataframe(df, period='W'):
         """
         データフレームを指定した期間で集計します。
-        
+
+        create_dataframe が返す疎なDataFrameは、密な行列に戻さずに期間ごとの最後の値を求めます。
+
         :param df: 元のデータフレーム
-        :param period: 集計期間 ('D' for daily, 'W' for weekly)
-        :return: 集計されたデータフレーム
+        :param period: 集計期間 ('D' for daily, 'W' for weekly, 'M', 'Y')
+        :return: 集計されたデータフレーム（期間×ファイルの行数。まだ存在しないファイルは0）
         """
+        if period not in ('D', 'W', 'M', 'Y'):
+            raise ValueError("Invalid period. Use 'D' for daily or 'W' for weekly.")
         df.index = pd.to_datetime(df.index)
-        
-        if period == 'D':
-            return df.resample('D').last().ffill()
-        elif period == 'W':
-            return df.resample('W').last().ffill()
-        elif period == 'M':
-            return df.resample('M').last().ffill()
-        elif period == 'Y':
-            return df.resample('Y').last().ffill()
+
+        if len(df.columns) and all(isinstance(dtype, pd.SparseDtype) for dtype in df.dtypes):
+            return DataFrameCreator._aggregate_sparse(df, period)
+        return df.resample(SnapshotEngine.frequency(period)).last().ffill().fillna(0)
+
+    @staticmethod
+    def _aggregate_sparse(df, period):
+        """
+        疎な列の値（行番号, 列番号, 値）だけから resample(period).last().ffill().fillna(0) と同じ表を作ります。
+        """
+        # resample と同じく日時の順（同じ日時は元の順）に並べてから期間に分ける
+        order = np.argsort(df.index.to_numpy(), kind='stable')
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        grouped = pd.Series(0, index=df.index[order]).groupby(pd.Grouper(freq=SnapshotEngine.frequency(period)))
+        bins = grouped.ngroup().to_numpy()
+        labels = grouped.size().index
+
+        ranks, columns, values = [], [], []
+        for column, name in enumerate(df.columns):
+            array = df[name].array
+            positions = array.sp_index.to_int_index().indices
+            ranks.append(rank[positions])
+            columns.append(np.full(len(positions), column, dtype=np.int64))
+            values.append(array.sp_values)
+        ranks, columns, values = np.concatenate(ranks), np.concatenate(columns), np.concatenate(values)
+
+        # 列ごと・日時の順に並べ、(列, 期間) ごとの最後の値だけを書き込む
+        index = np.lexsort((ranks, columns))
+        columns, values, periods = columns[index], values[index], bins[ranks[index]]
+        last = np.ones(len(index), dtype=bool)
+        last[:-1] = (columns[1:] != columns[:-1]) | (periods[1:] != periods[:-1])
+        result = np.full((len(labels), len(df.columns)), np.nan)
+        result[periods[last], columns[last]] = values[last]
+        return pd.DataFrame(result, index=labels, columns=df.columns).ffill().fillna(0)
+
+    @staticmethod
+    def load_history(filename, columns=None):
+        """
+        コミット履歴をCSVまたは列指向ストア（HistoryStore）から読み込み、date列を追加します。
+
+        File / OldPath / Change / Type / Commit はCategorical、日時は Date_Unix（int64のUNIX時刻）と
+        そこから作る date 列で持ちます。Date_ISO は columns で指定した場合だけ読み込みます。
+
+        :param filename: CSVファイルまたはストアのディレクトリのパス
+        :param columns: 読み込む列名のリスト（Noneなら Date_ISO 以外の全て）。Date_Unix は常に読み込まれます。
+                        履歴にない列（以前のバージョンが書いた履歴の FileId など）は読み込みません
+        :return: DataFrame
+        """
+        if columns is not None and 'Date_Unix' not in columns:
+            columns = ['Date_Unix'] + list(columns)
+
+        if HistoryStore.is_store(filename):
+            store = HistoryStore(filename)
+            if columns is None:
+                columns = [name for name in store.meta['columns'] if name != 'Tz_Offset']
+            df = store.read([name for name in columns if name in store.meta['columns'] or name == 'Date_ISO'])
         else:
-            raise ValueError("Invalid period. Use 'D' for daily or 'W' for weekly.")
-        
+            df = pd.read_csv(filename, usecols=(lambda name: name in columns) if columns else (lambda name: name != 'Date_ISO'),
+                             dtype={name: 'category' for name in DataFrameCreator.CATEGORICAL_COLUMNS})
+
+        # 以前のバージョンが書いた履歴にはディレクトリの集計行があるので、ここで1度だけ除く
+        if 'Type' in df.columns:
+            df = df[df['Type'] != 'directory'].reset_index(drop=True)
+
+        # Date_ISO をパースせず、UNIX時刻から直接UTCの日時を作る
+        df['date'] = pd.to_datetime(df['Date_Unix'], unit='s', utc=True)
+        return df
+
+    @staticmethod
+    def latest_state(df):
+        """
+        各ファイルの最新の状態（削除されたファイルと、リネームで別のパスに移ったファイルを除く）を返します。
+
+        :param df: load_history が返すDataFrame
+        :return: ファイルごとに1行のDataFrame（File は df と同じ型。Categoricalなら集計は整数のコードで行う）
+        """
+        df = df.sort_values('date')
+        df_latest = df.groupby('File', observed=True).last().reset_index()
+        df_latest = df_latest[df_latest['Lines'] > 0]  # 削除されたファイルを除外
+        if 'FileId' in df_latest:
+            # リネーム元のパスには削除の行がないので、FileId の最後のパスでないものを除外
+            current = df.groupby('FileId')['File'].last().astype(object)
+            df_latest = df_latest[df_latest['File'].astype(object) == df_latest['FileId'].map(current)]
+        return df_latest
+
+    @staticmethod
+    def change_counts(df, path_table=None):
+        """
+        ファイルごとの変更回数を返します。
+
+        FileId 列があれば、ファイルの変更回数はリネームを何回たどっても同じ FileId の行数の合計で、
+        パスにはそのパスの最後の行の FileId の回数を返します。
+        FileId 列がない履歴では、リネーム前のパスも含めてパスごとに数えます。
+
+        :param df: load_history が返すDataFrame（行はコミット順）
+        :param path_table: df のパスを含む PathTable（Noneなら df から作ります）
+        :return: パスをインデックスとする変更回数のSeries（変更のないパスは含まない）
+        """
+        if path_table is None:
+            path_table = PathTable.from_frames([df])
+        ids = path_table.ids(df['File'])
+        if 'FileId' not in df:
+            ids = [ids]
+            if 'OldPath' in df:
+                ids.append(path_table.ids(df['OldPath'][df['Change'] == 'renamed']))  # リネーム前のパスも含める
+            ids = np.concatenate(ids)
+            counts = np.bincount(ids[ids >= 0], minlength=len(path_table))
+            return pd.Series(counts, index=path_table.paths, name='count')[counts > 0]
+
+        file_ids = df['FileId'].to_numpy()
+        counts = np.zeros(len(path_table), dtype=np.int64)
+        # パスごとに最後の行の FileId を求め、その FileId の行数を変更回数とする
+        valid = ids >= 0
+        if valid.any():
+            file_counts = np.bincount(file_ids)
+            last_id = pd.Series(file_ids[valid]).groupby(ids[valid]).last()
+            counts[last_id.index] = file_counts[last_id.to_numpy()]
+        return pd.Series(counts, index=path_table.paths, name='count')[counts > 0]
+
+    @staticmethod
+    def treemap_frame(df_latest, file_changes, path_table=None):
+        """
+        最新の状態に変更回数とパスの階層のカラムを加えます。
+
+        :param path_table: df_latest のパスを含む PathTable（Noneなら df_latest から作ります）
+        :return: (DataFrame, パスのカラム名のリスト)
+        """
+        if path_table is None:
+            path_table = PathTable.from_frames([df_latest], columns=('File',))
+        ids = path_table.ids(df_latest['File'])
+        df_latest = df_latest.copy()
+        df_latest['changed_files'] = file_changes.reindex(path_table.paths, fill_value=0).to_numpy()[ids]
+
+        # ファイルパスの処理（分割済みの要素の表から取り出す）
+        path_columns = []
+        for i, values in enumerate(path_table.path_columns(ids)):
+            df_latest[f'path_{i}'] = values
+            path_columns.append(f'path_{i}')
+
+        df_latest['size'] = df_latest['Lines']
+
+        return df_latest, path_columns
+
     @staticmethod
     def treemap_dateframe(csv_filename):
         # 全てのカラムを読み込む
-        df = pd.read_csv(csv_filename)
-        
-        # データの前処理
-        df['date'] = pd.to_datetime(df['Date_ISO'], utc=True)
+        df = DataFrameCreator.load_history(csv_filename)
         
         # 変更タイプに基づいて処理
         # 削除されたファイルは Lines=0 として扱う
         # リネームされたファイルは新しいパスで処理
-        
-        # 最新の状態を取得（削除されたファイルは除外）
-        df_latest = df.sort_values('date').groupby('File').last().reset_index()
-        df_latest = df_latest[df_latest['Lines'] > 0]  # 削除されたファイルを除外
-        
-        # ファイルごとの変更回数をカウント（リネームも含める）
-        file_changes = pd.concat([
-            df['File'],
-            df[df['Change'] == 'renamed']['OldPath']  # リネーム前のパスも含める
-        ]).value_counts()
-        
-        df_latest['changed_files'] = df_latest['File'].map(file_changes)
-        
-        # ファイルパスの処理
-        path_parts = df_latest['File'].str.split('/', expand=True)
-        for i in range(len(path_parts.columns)):
-            df_latest[f'path_{i}'] = path_parts[i]
-        
-        df_latest['size'] = df_latest['Lines']
-        
-        # 動的にパスカラムのリストを作成
-        path_columns = [f'path_{i}' for i in range(len(path_parts.columns))]
-        
-        return df_latest, path_columns
+        return DataFrameCreator.treemap_frame(DataFrameCreator.latest_state(df),
+                                              DataFrameCreator.change_counts(df))
 
     @staticmethod
-    def create_time_series_df(df, period='Y'):
-        # dateでソート
-        df = df.sort_values('date')
-        
-        # 期間の開始時点を取得
-        period_starts = pd.date_range(
-            start=df['date'].min(),
-            end=df['date'].max(),
-            freq=period
-        )
-        
-        # 各期間の累積DataFrameを作成
+    def create_time_series_df(df, period='Y', path_table=None):
+        """
+        期間の区切りごとに、その時点までの各ファイルの最新状態を作成します
+
+        :param df: 元のDataFrame (date, File, Lines, Change, OldPathカラムを含む)
+        :param period: 期間('Y', 'M', 'W', 'D'のいずれか)
+        :param path_table: df のパスを含む PathTable（Noneなら df から作ります）
+        :return: 期間ごとの累積DataFrameのディクショナリ
+        """
+        # 履歴は SnapshotEngine が1回だけ走査する（変更回数にはリネーム前のパスも含める）
         cumulative_dfs = {}
-        
-        for period_end in period_starts:
-            # その期間までの全データを取得
-            period_mask = df['date'] <= period_end
-            period_df = df[period_mask].copy()
-            
-            if not period_df.empty:
-                # 各ファイルの最新状態を取得（削除されたファイルは除外）
-                latest_state = period_df.groupby('File').last().reset_index()
-                latest_state = latest_state[latest_state['Lines'] > 0]
-                
-                if not latest_state.empty:
-                    # リネームされたファイルの履歴も含めて変更回数を計算
-                    file_changes = pd.concat([
-                        period_df['File'],
-                        period_df[period_df['Change'] == 'renamed']['OldPath']
-                    ]).value_counts()
-                    
-                    latest_state['changed_files'] = latest_state['File'].map(file_changes)
-                    latest_state['path_parts'] = latest_state['File'].apply(lambda x: x.split('/'))
-                    
-                    print(f"Period {period_end}: {len(latest_state)} files")
-                    cumulative_dfs[period_end] = latest_state
-        
+        for period_end, latest_state in SnapshotEngine(df, period, path_table=path_table).snapshots():
+            print(f"Period {period_end}: {len(latest_state)} files")
+            cumulative_dfs[period_end] = latest_state
+
         return cumulative_dfs
     
     @staticmethod
@@ -158,60 +297,38 @@ class DataFrameCreator:
         """
         print(f"Processing data from {df['date'].min()} to {df['date'].max()}")
         
-        # dateでソート
-        df = df.sort_values('date')
-        
-        # 期間の開始時点を取得
-        period_starts = pd.date_range(
-            start=df['date'].min(),
-            end=df['date'].max(),
-            freq=period
-        )
-        print(f"Found {len(period_starts)} periods")
+        engine = SnapshotEngine(df, period, count_renames=False)
+        print(f"Found {len(engine.boundaries())} periods")
         
         # 各期間の累積DataFrameを作成
         cumulative_dfs = {}
-        
-        for period_end in period_starts:
-            # その期間までの全データを取得
-            period_mask = df['date'] <= period_end
-            period_df = df[period_mask].copy()
-            
-            if not period_df.empty:
-                # 各ファイルの最新状態を取得
-                latest_state = period_df.groupby('File').last().reset_index()
-                latest_state = latest_state[latest_state['Lines'] > 0]
-                
-                if not latest_state.empty:
-                    # changed_files を再計算
-                    file_changes = period_df['File'].value_counts()
-                    latest_state['changed_files'] = latest_state['File'].map(file_changes)
-                    
-                    # ファイルパスを分解してpath_partsカラムを追加
-                    latest_state['path_parts'] = latest_state['File'].apply(lambda x: x.split('/'))
-
-                    print(f"Period {period_end}: {len(latest_state)} files")
-                    cumulative_dfs[period_end] = latest_state
-
+        for period_end, latest_state in engine.snapshots():
+            print(f"Period {period_end}: {len(latest_state)} files")
+            cumulative_dfs[period_end] = latest_state
 
         return cumulative_dfs
     
     @staticmethod
     def create_extension_df(csv_filename):
-        # CSVファイルを読み込み
-        df = pd.read_csv(csv_filename)
-        
-        # 日付を変換
-        df['date'] = pd.to_datetime(df['Date_ISO'], utc=True)
+        # 必要な列だけを読み込み
+        df = DataFrameCreator.load_history(csv_filename, columns=['File', 'Lines', 'Type', 'FileId'])
         
         # 最新の状態のみを取得（各ファイルの最新バージョン）
-        latest_state = df.sort_values('date').groupby('File').last().reset_index()
-        
-        latest_state = latest_state[latest_state['Lines'] > 0]
-        
-        latest_state['extension'] = latest_state['File'].apply(
+        return DataFrameCreator.extension_stats(DataFrameCreator.latest_state(df))
+
+    @staticmethod
+    def extension_stats(latest_state):
+        """
+        拡張子ごとの合計行数とファイル数を返します。
+
+        :param latest_state: latest_state が返すファイルの最新状態
+        :return: extension / size / count カラムのDataFrame（size の降順）
+        """
+        # Categoricalならカテゴリ（パスの種類）ごとに1回だけ求める
+        extension = latest_state['File'].map(
             lambda x: os.path.splitext(x)[1].lower() or 'no_extension'
-        )
+        ).astype(object)
+        latest_state = latest_state.assign(extension=extension)
         
         # 拡張子ごとの合計行数を計算
         extension_stats = latest_state.groupby('extension').agg({
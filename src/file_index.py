@@ -0,0 +1,96 @@
+import json
+import os
+
+
+class FileIndex:
+    """
+    コミットを古い順に再生しながら、集計対象ファイルの行数と、
+    リネームをたどっても変わらないファイルの番号（FileId）を保持します。
+
+    状態はパスをキーに保持するため、同じ変更が2回適用されても（マージの差分など）
+    結果は変わりません。
+    """
+
+    def __init__(self):
+        self.file_lines = {}          # 集計対象ファイルのパス -> 行数
+        self.file_ids = {}            # 集計対象ファイルのパス -> FileId（リネームで新しいパスに引き継ぐ）
+        self.next_file_id = 0
+
+    def assign_file_ids(self, file_rows):
+        """
+        ファイルの行に FileId を設定します。行はコミット順に渡してください。
+
+        リネームの行は元のパスの番号を引き継ぎます。削除したパスの番号は残しておくので、
+        同じパスに戻したファイルも同じ番号になります（パスで数えていた従来の変更回数と同じ扱い）。
+        """
+        for row in file_rows:
+            path = row['File']
+            if row['Change'] == 'renamed' and row.get('OldPath') in self.file_ids:
+                self.file_ids[path] = self.file_ids.pop(row['OldPath'])
+            elif path not in self.file_ids:
+                self.file_ids[path] = self.next_file_id
+                self.next_file_id += 1
+            row['FileId'] = self.file_ids[path]
+
+    def changed_rows(self, file_rows):
+        """
+        記録済みの状態を変えるファイルの行だけを返します。
+
+        全てのコミットを走査する場合、マージコミットの行の多くは、側枝のコミットで記録済みの
+        内容をそのまま取り込んだだけのものです。これを除くと、同じ変更を2回数えずに済みます。
+        """
+        rows = []
+        for row in file_rows:
+            if row['Change'] == 'deleted':
+                changed = row['File'] in self.file_lines
+            else:
+                changed = (self.file_lines.get(row['File']) != row['Lines']
+                           or (row['Change'] == 'renamed' and row['OldPath'] in self.file_lines))
+            if changed:
+                rows.append(row)
+        return rows
+
+    def apply(self, file_rows):
+        """
+        1コミット分のファイルの行を反映します。
+
+        :param file_rows: GitRepository.build_rows が返したファイルの行
+        """
+        for row in file_rows:
+            if row['Change'] == 'renamed':
+                self.file_lines.pop(row['OldPath'], None)
+            if row['Change'] == 'deleted':
+                self.file_lines.pop(row['File'], None)
+            else:
+                self.file_lines[row['File']] = row['Lines']
+
+    def save(self, path, head):
+        """
+        状態を保存します。head は状態がどのコミットまでを反映しているかの記録です。
+        """
+        state = {'head': head, 'file_lines': self.file_lines,
+                 'file_ids': self.file_ids, 'next_file_id': self.next_file_id}
+        tmp_file = path + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path, head):
+        """
+        保存した状態を読み込みます。ファイルがない場合や、head までの状態でない場合はNoneを返します。
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+        except ValueError:
+            return None
+        if state.get('head') != head:
+            return None
+        index = cls()
+        index.file_lines = state['file_lines']
+        index.file_ids = state['file_ids']
+        index.next_file_id = state['next_file_id']
+        return index
@@ -1,26 +1,81 @@
 import re
-from collections import deque
+import hashlib
+import pickle
+from collections import deque, OrderedDict
 import git
 import os
 import csv
+import json
 from datetime import datetime
 import time
+import subprocess
+from itertools import islice
 from multiprocessing import Pool, cpu_count
-from functools import partial
+import numpy as np
+import pandas as pd
+from .line_count_cache import LineCountCache
+from .line_counter import LineCounter
+from .commit_stream import CommitStream
+from .blob_reader import BlobReader
+from .history_store import HistoryStore
+from .history_writer import HistoryWriter
+from .file_index import FileIndex
+from .snapshot_engine import SnapshotEngine
+from .telemetry import Telemetry
 
 
 class GitRepository:
-    def __init__(self, repo_url):
+    CLONE_MODES = ('full', 'blobless', 'mirror')
+
+    def __init__(self, repo_url, clone_mode='full'):
+        """
+        :param repo_url: GitHubのURL、file:// のURL、またはローカルのリポジトリのパス
+        :param clone_mode: 'full'（通常のクローン）、'blobless'（`--filter=blob:none` の部分クローン。
+                           作業ツリーは展開せず、必要なblobだけを後からまとめて取得します）、
+                           'mirror'（ベアのミラー）。ローカルのパスを指定した場合は使われません
+        """
+        if clone_mode not in self.CLONE_MODES:
+            raise ValueError(f"Invalid clone mode: {clone_mode}. Use 'full', 'blobless' or 'mirror'.")
         self.repo_url = repo_url
+        self.clone_mode = clone_mode
         self.repo_info = self.parse_repo_url(repo_url)
         self.repo_path = self.get_repo_path()
         self.output_dir = self.generate_output_dir()
+        self.line_counter = LineCounter()
+        self.line_cache = LineCountCache(os.path.join(self.output_dir, "line_count_cache.sqlite"),
+                                         rule=self.line_counter.rule())
         self.repo = None
+        self.storage = 'csv'
+        self.traversal = 'first-parent'
+        self.sample = None
         self.repo_name = self.repo_info['repo']
         self.owner = self.repo_info['owner']
+        self.telemetry = Telemetry(enabled=False)
         self.clone(repo_url)
+        self.blob_reader = BlobReader(self.repo_path)
+
+    def __getstate__(self):
+        # git.Repo はワーカーごとに開き直す（_init_worker を参照）
+        state = self.__dict__.copy()
+        state['repo'] = None
+        return state
+
+    @staticmethod
+    def parse_repo_url(url):
+        # ローカルのリポジトリはその場で解析し、file:// のURLはリモートと同じようにクローンする
+        local_path = os.path.expanduser(url)
+        if url.startswith('file://') or os.path.isdir(local_path):
+            path = url[len('file://'):] if url.startswith('file://') else local_path
+            path = os.path.abspath(os.path.normpath(path))
+            name = os.path.basename(path)
+            # 同じ名前の別のリポジトリと出力先（out/<owner>/<repo>）が重ならないよう、絶対パスのハッシュで区別する
+            digest = hashlib.sha1(path.encode('utf-8', errors='surrogateescape')).hexdigest()[:8]
+            return {
+                'owner': f'local-{digest}',
+                'repo': name[:-len('.git')] if name.endswith('.git') else name,
+                'local_path': None if url.startswith('file://') else path
+            }
 
-    def parse_repo_url(self, url):
         pattern = r"github\.com[:/](?P<owner>[^/]+)/(?P<repo>[^/]+)(?:\.git)?"
         match = re.search(pattern, url)
         if match:
@@ -32,20 +87,158 @@ class GitRepository:
             raise ValueError("Invalid GitHub URL")
         
     def get_repo_path(self):
-        return os.path.join(os.getcwd(), self.repo_info['owner'], self.repo_info['repo'])
+        if self.repo_info.get('local_path'):
+            return self.repo_info['local_path']
+        # ベアのミラーは通常のクローンと取り違えないように .git を付けた場所に置く
+        repo_dir = self.repo_info['repo'] + ('.git' if self.clone_mode == 'mirror' else '')
+        return os.path.join(os.getcwd(), self.repo_info['owner'], repo_dir)
 
     def clone(self, remote_url):
+        if self.repo_info.get('local_path'):
+            # 利用者の作業ツリーは書き換えない
+            print(f"Using local repository at {self.repo_path}")
+            self.repo = git.Repo(self.repo_path)
+            return
 
         if not os.path.exists(self.repo_path):
-            print(f"Cloning repository from {remote_url}...")
-            self.repo = git.Repo.clone_from(remote_url, self.repo_path)
+            print(f"Cloning repository from {remote_url} ({self.clone_mode})...")
+            if self.clone_mode == 'mirror':
+                self.repo = git.Repo.clone_from(remote_url, self.repo_path, mirror=True)
+            elif self.clone_mode == 'blobless':
+                self.repo = git.Repo.clone_from(remote_url, self.repo_path,
+                                                multi_options=['--filter=blob:none', '--no-checkout'])
+            else:
+                self.repo = git.Repo.clone_from(remote_url, self.repo_path)
             print("Repository cloned successfully.")
         else:
-            print("Repository already exists. Pulling latest changes...")
+            print("Repository already exists. Fetching latest changes...")
             self.repo = git.Repo(self.repo_path)
-            self.repo.remotes.origin.pull()
+            self.refresh()
             print("Repository updated successfully.")
 
+    def refresh(self):
+        """
+        `fetch` でリモートの変更を取得し、解析するブランチをリモートの状態に合わせます。
+        `pull` と違いマージは行わないので、強制プッシュされたブランチでも失敗しません。
+        """
+        if self.repo.bare:
+            # ミラーはリモートの参照がそのままローカルの参照に書き込まれる
+            self.repo.git.fetch('--prune', 'origin')
+            return
+
+        branch = self.repo.active_branch.name
+        self.repo.git.fetch('origin', branch)
+        if self.is_partial_clone():
+            # 作業ツリーを展開していないので、ブランチの参照だけを動かす
+            self.repo.git.update_ref(f"refs/heads/{branch}", 'FETCH_HEAD')
+        else:
+            self.repo.git.reset('--hard', 'FETCH_HEAD')
+
+    def is_partial_clone(self):
+        try:
+            return bool(self.repo.git.config('--get', 'remote.origin.partialclonefilter'))
+        except git.exc.GitCommandError:
+            return False
+
+    def blobs_in_range(self, rev_range, file_extensions=None):
+        """
+        範囲内のコミットで追加・変更された、拡張子フィルタを通るパスのblobのSHAを返します。
+        コミットの選び方とマージコミットの差分の取り方は、両方のバックエンドと同じく self.traversal に従います。
+        リネームの検出は行わない（blobの内容が必要になる）ので、リネーム先は追加として現れます。
+        """
+        process = subprocess.Popen(
+            ['git', '-C', self.repo_path, 'log', '-z', '--raw', '--no-abbrev', '--root', '--no-renames']
+            + CommitStream.log_options(self.traversal) + ['--format=', rev_range, '--'],
+            stdout=subprocess.PIPE)
+        blobs = set()
+        entry = None
+        buffer = b''
+        try:
+            for chunk in iter(lambda: process.stdout.read(1 << 16), b''):
+                buffer += chunk
+                tokens = buffer.split(b'\0')
+                buffer = tokens.pop()
+                # 変更の情報（":mode mode sha sha status"）の次のトークンがパス
+                for token in tokens:
+                    if entry is None:
+                        if token.startswith(b':'):
+                            entry = token[1:].decode('ascii').split(' ')
+                        continue
+                    _, _, _, b_sha, status = entry
+                    path = token.decode('utf-8', 'surrogateescape')
+                    entry = None
+                    if status in ('A', 'M') and not (file_extensions
+                                                     and not any(path.endswith(ext) for ext in file_extensions)):
+                        blobs.add(b_sha)
+        finally:
+            process.stdout.close()
+            process.wait()
+        return blobs
+
+    def fetch_missing_blobs(self, rev_range, file_extensions=None, chunk_size=10000, commits=None):
+        """
+        部分クローンで、拡張子フィルタを通るパスのうち手元にないblobをまとめて取得します。
+        取得しておかないと、cat-file がblobを1つ読むたびにリモートへ問い合わせることになります。
+
+        :param commits: 指定した場合、範囲の全てのコミットではなく、これらのコミットのツリーのblobだけを取得します
+        :return: 取得したblobの数
+        """
+        if commits is None:
+            wanted = self.blobs_in_range(rev_range, file_extensions)
+            objects = [rev_range]
+        else:
+            wanted = {blob for sha in commits for path, (blob, _) in self.ls_tree(sha).items()
+                      if not (file_extensions and not any(path.endswith(ext) for ext in file_extensions))}
+            objects = ['--no-walk'] + list(commits)
+        # 手元にないオブジェクトの一覧（パスは出力されないので、必要なblobの集合と突き合わせる）
+        process = self.repo.git.rev_list('--objects', '--missing=print', *objects, as_process=True)
+        try:
+            missing = [sha for sha in (line[1:].decode('ascii').strip()
+                                       for line in process.stdout if line.startswith(b'?'))
+                       if sha in wanted]
+        finally:
+            process.stdout.close()
+            process.wait()
+
+        for start in range(0, len(missing), chunk_size):
+            print(f"Fetching blobs {start + 1}-{min(start + chunk_size, len(missing))}/{len(missing)}...")
+            subprocess.run(
+                ['git', '-C', self.repo_path, '-c', 'fetch.negotiationAlgorithm=noop',
+                 'fetch', 'origin', '--no-tags', '--no-write-fetch-head', '--recurse-submodules=no',
+                 '--filter=blob:none', '--stdin'],
+                input=''.join(sha + '\n' for sha in missing[start:start + chunk_size]).encode('ascii'),
+                check=True)
+        return len(missing)
+
+    def ls_tree(self, commit_sha):
+        """
+        コミットのツリーの全てのblobを `git ls-tree -r -l -z` で読み込みます。
+        サブモジュール（gitlink）は blob ではないので含みません。
+
+        :return: パス -> (blobのSHA, サイズ) の辞書
+        """
+        output = subprocess.run(['git', '-C', self.repo_path, 'ls-tree', '-r', '-l', '-z', commit_sha],
+                                stdout=subprocess.PIPE, check=True).stdout
+        tree = {}
+        for entry in output.split(b'\0'):
+            if not entry:
+                continue
+            # "<mode> <type> <sha> <size>\t<path>"
+            info, path = entry.split(b'\t', 1)
+            _, object_type, sha, size = info.split()
+            if object_type == b'blob':
+                tree[path.decode('utf-8', errors='replace')] = (sha.decode('ascii'), int(size))
+        return tree
+
+    def close(self):
+        """
+        cat-file のプロセスと行数キャッシュの接続を閉じます。
+        """
+        self.blob_reader.close()
+        self.line_cache.close()
+        if self.repo is not None:
+            self.repo.close()
+
     def get_commit_history(self, directory_path):
         if not self.repo:
             self.repo = git.Repo(self.repo_path)
@@ -58,13 +251,9 @@ class GitRepository:
         return output_dir
 
     def count_lines_in_file(self, commit_hexsha, file_path):
-        if not self.repo:
-            self.repo = git.Repo(self.repo_path)
-        try:
-            file_content = self.repo.git.show(f"{commit_hexsha}:{file_path}")
-            return len(file_content.splitlines())
-        except git.exc.GitCommandError:
-            return 0
+        # 存在しないパスは (None, 0) として返る
+        (_, line_count), = self.blob_reader.line_counts([f"{commit_hexsha}:{file_path}"], self.line_counter)
+        return LineCounter.lines(line_count)
         
     def get_directories(self):
         if not self.repo:
@@ -88,205 +277,673 @@ class GitRepository:
         return self.repo_name
     
     def count_lines(self, blob):
-        try:
-            content = blob.data_stream.read().decode('utf-8', errors='replace')
-            return len(content.splitlines())
-        except Exception as e:
-            print(f"Error processing {blob.name}: {e}")
+        return self.count_blob_lines(blob.hexsha)
+
+    def count_blob_lines(self, hexsha):
+        # 同じblobは内容も同じなので、キャッシュがあればblobを読まない。
+        # キャッシュにはバイナリ・サイズ超過の印（LineCounter.BINARY など）もそのまま保存する
+        cached = self.line_cache.get(hexsha)
+        if cached is not None:
+            return LineCounter.lines(cached)
+        (size, line_count), = self.blob_reader.line_counts([hexsha], self.line_counter)
+        if size is None:
+            print(f"Error processing blob {hexsha}: object not found")
             return 0
+        self.line_cache.put(hexsha, line_count)
+        return LineCounter.lines(line_count)
 
-    def process_commit(self, file_extensions, commit_sha):
-        commit = self.repo.commit(commit_sha)
-        commit_date = commit.committed_datetime
-        
-        # コミット情報の基本データを作成
-        commit_info = {
-            'Commit': commit.hexsha,
-            'Date_Unix': int(commit_date.timestamp()),
-            'Date_ISO': commit_date.isoformat()
-        }
-        
+    def prefetch_line_counts(self, hexshas):
+        """
+        キャッシュにないblobの行数を、パイプライン化した1回のバッチでまとめて読み込みます。
+        """
+        missing = [sha for sha in dict.fromkeys(hexshas) if self.line_cache.get(sha) is None]
+        for sha, (size, line_count) in zip(missing, self.blob_reader.line_counts(missing, self.line_counter)):
+            if size is not None:
+                self.line_cache.put(sha, line_count)
+
+    @staticmethod
+    def blobs_to_count(changes, file_extensions):
+        """
+        行数を数える必要があるblobのSHAを返します（拡張子フィルタ適用後の追加・変更・リネーム）。
+        """
+        return [b_sha for change_type, a_path, b_path, b_sha in changes
+                if b_sha and change_type in ('A', 'M', 'R')
+                and not (file_extensions
+                         and not any((b_path or a_path).endswith(ext) for ext in file_extensions))]
+
+    def build_rows(self, commit_info, changes, file_extensions):
+        """
+        コミットの変更一覧からファイルの行を作成します。
+        FileId は FileIndex がコミット順に再生しながら振ります。
+
+        :param commit_info: Commit / Date_Unix / Date_ISO を持つ辞書
+        :param changes: (change_type, a_path, b_path, b_blob_sha) のリスト
+        :param file_extensions: 対象とする拡張子のリスト（Noneなら全て）
+        :return: 行の辞書のリスト
+        """
         results = []
-        paths_to_process = set()  # 処理対象のパスを保持
-        
-        def collect_directory_paths(path):
-            """パスのすべての親ディレクトリを収集"""
-            parts = path.split('/')
-            current_path = ''
-            dirs = set()
-            for part in parts[:-1]:  # 最後のパート（ファイル名）を除く
-                current_path = f"{current_path}{part}/" if current_path else f"{part}/"
-                dirs.add(current_path.rstrip('/'))
-            return dirs
 
-        # 初回コミットの場合
-        if not commit.parents:
-            for item in commit.tree.traverse():
-                if item.type == 'blob':
-                    if file_extensions is None or any(item.name.endswith(ext) for ext in file_extensions):
-                        line_count = self.count_lines(item)
-                        paths_to_process.add(item.path)
-                        row = {**commit_info, 
-                            'File': item.path, 
-                            'Lines': line_count, 
-                            'Change': 'added', 
-                            'Type': 'file'}
-                        results.append(row)
-            
-            # ディレクトリ情報の収集
-            all_dirs = set()
-            for path in paths_to_process:
-                all_dirs.update(collect_directory_paths(path))
-            
-            # ディレクトリエントリの追加
-            for dir_path in all_dirs:
-                row = {**commit_info,
-                    'File': dir_path,
-                    'Lines': 0,
-                    'Change': 'added',
-                    'Type': 'directory'}
-                results.append(row)
-                
-            return results
-        
-        # 差分の処理
-        parent = commit.parents[0]
-        diffs = parent.diff(commit)
-        
+        # このコミットで必要なblobをまとめて読み込んでおく
+        self.prefetch_line_counts(self.blobs_to_count(changes, file_extensions))
+
         # 変更されたファイルを処理
-        for diff in diffs:
-            file_path = diff.b_path if diff.b_path else diff.a_path
-            
+        for change_type, a_path, b_path, b_sha in changes:
+            file_path = b_path if b_path else a_path
+
             # 拡張子フィルタリング
             if file_extensions and not any(file_path.endswith(ext) for ext in file_extensions):
                 continue
-                
-            paths_to_process.add(file_path)
-            
-            if diff.change_type == 'A':  # Added
-                if diff.b_blob:
-                    line_count = self.count_lines(diff.b_blob)
-                    row = {**commit_info, 
-                        'File': file_path, 
-                        'Lines': line_count, 
+
+            if change_type == 'A':  # Added
+                if b_sha:
+                    row = {**commit_info,
+                        'File': file_path,
+                        'Lines': self.count_blob_lines(b_sha),
                         'Change': 'added',
-                        'Type': 'file'}
+                        'Type': 'file',
+                        'Files': 1}
                     results.append(row)
-                    
-            elif diff.change_type == 'M':  # Modified
-                if diff.b_blob:
-                    line_count = self.count_lines(diff.b_blob)
-                    row = {**commit_info, 
-                        'File': file_path, 
-                        'Lines': line_count, 
+
+            elif change_type == 'M':  # Modified
+                if b_sha:
+                    row = {**commit_info,
+                        'File': file_path,
+                        'Lines': self.count_blob_lines(b_sha),
                         'Change': 'modified',
-                        'Type': 'file'}
-                    results.append(row)
-                    
-            elif diff.change_type == 'D':  # Deleted
-                row = {**commit_info, 
-                    'File': file_path, 
-                    'Lines': 0, 
-                    'Change': 'deleted',
-                    'Type': 'file'}
-                results.append(row)
-                
-            elif diff.change_type == 'R':  # Renamed
-                if diff.b_blob:
-                    line_count = self.count_lines(diff.b_blob)
-                    row = {**commit_info, 
-                        'File': diff.b_path, 
-                        'Lines': line_count, 
-                        'Change': 'renamed', 
-                        'OldPath': diff.a_path,
-                        'Type': 'file'}
+                        'Type': 'file',
+                        'Files': 1}
                     results.append(row)
-        
-        # コミット時点でのディレクトリ構造を取得
-        all_dirs = set()
-        for path in paths_to_process:
-            all_dirs.update(collect_directory_paths(path))
-        
-        # 現在のツリーから存在するディレクトリを確認
-        for dir_path in all_dirs:
-            try:
-                # ディレクトリの存在確認
-                commit.tree[dir_path]
+
+            elif change_type == 'D':  # Deleted
                 row = {**commit_info,
-                    'File': dir_path,
+                    'File': file_path,
                     'Lines': 0,
-                    'Change': 'unchanged',
-                    'Type': 'directory'}
+                    'Change': 'deleted',
+                    'Type': 'file',
+                    'Files': 0}
                 results.append(row)
-            except KeyError:
-                # このディレクトリは削除された可能性がある
-                pass
-        
+
+            elif change_type == 'R':  # Renamed
+                if b_sha:
+                    row = {**commit_info,
+                        'File': b_path,
+                        'Lines': self.count_blob_lines(b_sha),
+                        'Change': 'renamed',
+                        'OldPath': a_path,
+                        'Type': 'file',
+                        'Files': 1}
+                    results.append(row)
+
+        self.line_cache.flush()
         return results
 
-    def process_commits(self, csv_filename, file_extensions=None, batch_size=100, start_commit=None):
-        # フィールド名の定義を一箇所に集中化
-        self.fieldnames = ['Commit', 'Date_Unix', 'Date_ISO', 'File', 'Lines', 'Change', 'OldPath', 'Type']
+    def process_commit(self, file_extensions, commit_sha):
+        """
+        1コミット分のファイルの行を作成します。
+        self.traversal が 'full' の場合、マージコミットは全ての親との差分をまとめたものを使います。
+
+        :return: (commit_info, ファイルの行, 親コミットのSHAのリスト) のタプル
+        """
+        commit = self.repo.commit(commit_sha)
+        commit_date = commit.committed_datetime
+        
+        # コミット情報の基本データを作成
+        commit_info = {
+            'Commit': commit.hexsha,
+            'Date_Unix': int(commit_date.timestamp()),
+            'Date_ISO': commit_date.isoformat()
+        }
+
+        # 初回コミットの場合
+        if not commit.parents:
+            changes = [('A', None, item.path, item.hexsha)
+                       for item in commit.tree.traverse() if item.type == 'blob']
+        else:
+            # 差分の処理
+            parents = commit.parents if self.traversal == 'full' else commit.parents[:1]
+            changes = CommitStream.union_changes(*(
+                [(diff.change_type, diff.a_path, diff.b_path, diff.b_blob.hexsha if diff.b_blob else None)
+                 for diff in parent.diff(commit)]
+                for parent in parents))
+
+        parents = [parent.hexsha for parent in commit.parents]
+        return commit_info, self.build_rows(commit_info, changes, file_extensions), parents
+
+    def replay(self, index, commit_info, parents, rows):
+        """
+        1コミット分のファイルの行をコミット順に反映し、書き込む行を返します。
+
+        'full' では、マージコミットの行のうち記録済みの状態を変えないもの（側枝の内容を
+        そのまま取り込んだだけのファイル）を除きます。第1親との差分だけを見ると、側枝のコミットで
+        記録した変更がマージでもう一度数えられてしまうためです。
+        """
+        if self.traversal == 'full' and len(parents) > 1:
+            rows = index.changed_rows(rows)
+        # バックエンドによって変更の並びが異なるので、パスの順に揃えてから番号を振る。
+        # リネーム元のパスに別のファイルが追加される場合に備えて、削除とリネームを先に反映する
+        rows = sorted(rows, key=lambda row: (row['Change'] not in ('deleted', 'renamed'), row['File']))
+        index.assign_file_ids(rows)
+        index.apply(rows)
+        return rows
+
+    def state_path(self, csv_filename):
+        return os.path.splitext(csv_filename)[0] + ".state.json"
+
+    def index_path(self, csv_filename):
+        return os.path.splitext(csv_filename)[0] + ".files.json"
+
+    def ingest_settings(self, file_extensions):
+        """
+        CSVの内容を左右する設定を返します。これが前回と異なる場合は全件再生成します。
+        """
+        return {
+            'fieldnames': self.fieldnames,
+            'file_extensions': sorted(file_extensions) if file_extensions else None,
+            'storage': self.storage,
+            'traversal': self.traversal,
+            'sample': self.sample,
+            'line_counter': self.line_counter.rule(),
+        }
+
+    def history_exists(self, history_path):
+        if self.storage == 'columnar':
+            return HistoryStore.is_store(history_path)
+        return os.path.exists(history_path)
+
+    def history_size(self, history_path):
+        """
+        出力の大きさを返します（CSVはバイト数、列指向ストアは行数）。
+        """
+        if self.storage == 'columnar':
+            return HistoryStore(history_path).rows
+        return os.path.getsize(history_path)
+
+    def truncate_history(self, history_path, size):
+        if self.storage == 'columnar':
+            HistoryStore(history_path).truncate(size)
+        else:
+            with open(history_path, 'r+b') as f:
+                f.truncate(size)
+
+    def reset_history(self, history_path):
+        """
+        既存の出力を削除し、空の出力を作成します。
+        """
+        if self.storage == 'columnar':
+            if HistoryStore.is_store(history_path):
+                print(f"Removed existing history store: {history_path}")
+            HistoryStore(history_path).create()
+            return
 
         # 既存のファイルを削除
-        if os.path.exists(csv_filename):
-            os.remove(csv_filename)
-            print(f"Removed existing CSV file: {csv_filename}")
+        if os.path.exists(history_path):
+            os.remove(history_path)
+            print(f"Removed existing CSV file: {history_path}")
 
         # ヘッダーの書き込み
-        with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
+        with open(history_path, 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=self.fieldnames)
             writer.writeheader()
 
-        commits = list(self.repo.iter_commits(self.repo.active_branch.name))
-        total_commits = len(commits)
+    def load_ingest_state(self, csv_filename):
+        state_file = self.state_path(csv_filename)
+        if not self.history_exists(csv_filename) or not os.path.exists(state_file):
+            return None
+        try:
+            with open(state_file, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_ingest_state(self, csv_filename, head, branch, settings):
+        state = {
+            'head': head,
+            'branch': branch,
+            'settings': settings,
+            'history_size': self.history_size(csv_filename),
+        }
+        state_file = self.state_path(csv_filename)
+        tmp_file = state_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_file, state_file)
+
+    def resume_point(self, csv_filename, head, branch, settings):
+        """
+        前回処理したHEADから追記で再開できる場合はそのコミットを返し、
+        全件再生成が必要な場合（強制プッシュ、ブランチ変更、設定変更）はNoneを返します。
+        """
+        state = self.load_ingest_state(csv_filename)
+        if state is None:
+            return None
+        if state.get('branch') != branch:
+            print(f"Branch changed ({state.get('branch')} -> {branch}). Rebuilding CSV.")
+            return None
+        if state.get('settings') != settings:
+            print("Ingest settings changed. Rebuilding CSV.")
+            return None
+        try:
+            if not self.repo.is_ancestor(state['head'], head):
+                print("Previous HEAD is not an ancestor of HEAD (force-push?). Rebuilding CSV.")
+                return None
+        except (git.exc.GitCommandError, ValueError):
+            print("Previous HEAD no longer exists. Rebuilding CSV.")
+            return None
+
+        # 前回の実行が途中で中断されていた場合は、記録時点のサイズまで切り詰める
+        recorded_size = state.get('history_size')
+        history_size = self.history_size(csv_filename)
+        if recorded_size is None or history_size < recorded_size:
+            print("History is shorter than recorded. Rebuilding CSV.")
+            return None
+        if history_size > recorded_size:
+            print(f"Discarded rows from an interrupted run in {csv_filename}")
+        self.truncate_history(csv_filename, recorded_size)
+        return state['head']
+
+    def process_commits(self, csv_filename, file_extensions=None, batch_size=100, start_commit=None,
+                        incremental=True, backend='gitpython', storage='csv', pool=None,
+                        traversal='first-parent', sample=None, max_blob_size=None):
+        """
+        コミット履歴を走査し、ファイルごとの行数の変化をCSVに書き出します。
+
+        :param csv_filename: 出力するCSVファイルのパス
+        :param file_extensions: 対象とする拡張子のリスト（Noneなら全て）
+        :param batch_size: 1回に処理してCSVに書き込むコミット数
+        :param start_commit: 指定した場合、このコミット以前の履歴のみを処理します
+        :param incremental: 前回の実行結果に新しいコミットだけを追記します
+        :param backend: 'gitpython'（コミットごとにGitPythonで差分を取得）または
+                        'log'（1本の `git log --raw -z` をストリームで読み込む）
+        :param storage: 'csv' または 'columnar'（HistoryStore。csv_filenameの拡張子を .cols にしたディレクトリ）
+        :param pool: 複数のリポジトリで共有するワーカープール（BatchScheduler を参照）。
+                     Noneなら 'gitpython' バックエンドは専用のプールを作ります
+        :param traversal: 'first-parent'（第1親だけをたどる本流のコミット）、'full'（側枝も含む全てのコミット。
+                          マージコミットは全ての親との差分から、側枝で記録済みでない変更だけを書き込みます）、
+                          または 'no-merges'（マージコミットを除く全てのコミット。マージコミット自体での変更
+                          （競合の解消など）は反映されないので、最後の状態がHEADと一致しない場合があります）
+        :param sample: 指定した場合、全てのコミットの差分を処理する代わりに、期間の区切り（'Y', 'M' など）
+                       またはN番目ごとのコミットの状態だけを求めます（process_commits_sampled を参照）。
+                       backend は使われず、traversal は 'first-parent' である必要があります
+        :param max_blob_size: 行数を数えるblobの最大バイト数。これを超えるblobは読まずに0行とします
+                              （LineCounter を参照。バイナリのblobも常に0行です）
+        :return: 出力したCSVファイルまたはストアのパス
+        """
+        if backend not in ('gitpython', 'log'):
+            raise ValueError(f"Invalid backend: {backend}. Use 'gitpython' or 'log'.")
+        if storage not in ('csv', 'columnar'):
+            raise ValueError(f"Invalid storage: {storage}. Use 'csv' or 'columnar'.")
+        CommitStream.rev_list_options(traversal)
+        if sample is not None and traversal != 'first-parent':
+            raise ValueError("Sampling follows the first-parent history. Use traversal='first-parent'.")
+        if isinstance(sample, int) and sample <= 0:
+            raise ValueError(f"Invalid sample interval: {sample}")
+
+        self.storage = storage
+        self.traversal = traversal
+        self.sample = sample
+        self.line_counter = LineCounter(max_blob_size)
+        # 数え方が変わった場合、キャッシュした行数は使えない
+        self.line_cache.set_rule(self.line_counter.rule())
+        if storage == 'columnar':
+            csv_filename = HistoryStore.path_for(csv_filename)
+
+        # フィールド名の定義を一箇所に集中化
+        self.fieldnames = ['Commit', 'Date_Unix', 'Date_ISO', 'File', 'Lines', 'Change', 'OldPath', 'Type', 'Files',
+                           'FileId']
+
+        branch = self.repo.active_branch.name
+        head = self.repo.head.commit.hexsha
+        settings = self.ingest_settings(file_extensions)
+
+        # 前回の状態から再開できる場合は、新しいコミットだけを追記する
+        last_head = None
+        if incremental and not start_commit:
+            last_head = self.resume_point(csv_filename, head, branch, settings)
+
+        if last_head == head:
+            print(f"Commit history is up to date: {csv_filename}")
+            return csv_filename
 
+        # FileId とファイルの行数は前回の実行で保存した状態から続ける
+        index = FileIndex()
+        if last_head:
+            index = FileIndex.load(self.index_path(csv_filename), last_head)
+            if index is None:
+                print("File index state is missing. Rebuilding CSV.")
+                index = FileIndex()
+                last_head = None
+
+        if last_head:
+            rev_range = f"{last_head}..{head}"
+            print(f"Resuming from {last_head[:8]}: processing {rev_range}")
+        else:
+            rev_range = branch
+            self.reset_history(csv_filename)
+
+        # start_commit を指定した場合は、そのコミットとその祖先だけを処理する
         if start_commit:
-            start_index = next((i for i, c in enumerate(commits) if c.hexsha == start_commit), 0)
-            commits = commits[start_index:]
+            rev_range = start_commit
+
+        # 部分クローンでは、行数を数えるblobを処理の前にまとめて取得しておく
+        if self.is_partial_clone():
+            with self.telemetry.stage('fetch_missing_blobs'):
+                commits = self.sample_commits(rev_range, sample) if sample is not None else None
+                self.telemetry.count('blobs_fetched', self.fetch_missing_blobs(rev_range, file_extensions,
+                                                                               commits=commits))
+
+        blob_stats = dict(self.blob_reader.stats)
+        with self.telemetry.stage('ingest', backend=backend, storage=storage, rev_range=rev_range,
+                                  traversal=traversal, sample=sample):
+            with HistoryWriter(csv_filename, self.fieldnames, storage) as writer:
+                if sample is not None:
+                    processed_commits = self.process_commits_sampled(
+                        writer, index, file_extensions, rev_range, sample, last_head)
+                elif backend == 'log':
+                    processed_commits = self.process_commits_from_log(
+                        writer, index, file_extensions, batch_size, rev_range)
+                else:
+                    processed_commits = self.process_commits_with_pool(
+                        writer, index, file_extensions, batch_size, rev_range, pool)
+            # ワーカーで読んだ分は process_commits_with_pool が加算している
+            self.telemetry.count('commits', processed_commits)
+            for name, value in self.blob_reader.stats.items():
+                self.telemetry.count(name, value - blob_stats[name])
+
+        self.line_cache.evict()
+        if not start_commit:
+            index.save(self.index_path(csv_filename), head)
+            self.save_ingest_state(csv_filename, head, branch, settings)
+        print(f"Total commits processed: {processed_commits}")
+        return csv_filename
+
+    def report_progress(self, processed_commits, total_commits, start_time):
+        elapsed_time = time.time() - start_time
+        commits_per_second = processed_commits / elapsed_time if elapsed_time > 0 else 0
+        estimated_time = (total_commits - processed_commits) / commits_per_second if commits_per_second else 0
+
+        print(f"Processed {processed_commits}/{total_commits} commits. "
+            f"Estimated time remaining: {estimated_time:.2f} seconds")
+
+    def count_commits(self, rev_range):
+        return int(self.repo.git.rev_list('--count', *CommitStream.rev_list_options(self.traversal), rev_range))
+
+    def iter_commit_shas(self, rev_range):
+        """
+        `git rev-list --reverse` の出力を1行ずつ読み、コミットのSHAを古い順に遅延的に返します。
+        """
+        process = self.repo.git.rev_list('--reverse', *CommitStream.rev_list_options(self.traversal), rev_range,
+                                         as_process=True)
+        try:
+            for line in process.stdout:
+                yield line.decode('ascii').strip()
+        finally:
+            process.stdout.close()
+            process.wait()
+
+    @staticmethod
+    def chunk_size(total_tasks, num_processes):
+        """
+        ワーカー1つあたり数回に分けて配るようにチャンクサイズを決めます。
+        小さすぎるとプロセス間通信が増え、大きすぎると最後に遅いワーカーを待つことになります。
+        """
+        return max(1, min(64, total_tasks // (num_processes * 8)))
+
+    def process_commits_with_pool(self, writer, index, file_extensions, batch_size, rev_range, pool=None):
+        total_commits = self.count_commits(rev_range)
 
         start_time = time.time()
         processed_commits = 0
 
         num_processes = cpu_count()
-        pool = Pool(processes=num_processes)
-        process_commit_partial = partial(self.process_commit, file_extensions)
-
-        for i in range(0, len(commits), batch_size):
-            batch_commits = commits[i:i+batch_size]
-            results = pool.map(process_commit_partial, [commit.hexsha for commit in batch_commits])
-            
-            flattened_results = [item for sublist in results for item in sublist]
-            
-            self.write_results(csv_filename, flattened_results)
-            
-            processed_commits += len(batch_commits)
-            elapsed_time = time.time() - start_time
-            commits_per_second = processed_commits / elapsed_time
-            estimated_time = (total_commits - processed_commits) / commits_per_second
-            
-            print(f"Processed {processed_commits}/{total_commits} commits. "
-                f"Estimated time remaining: {estimated_time:.2f} seconds")
-
-        pool.close()
-        pool.join()
+        chunksize = self.chunk_size(total_commits, num_processes)
 
-        print(f"Total commits processed: {processed_commits}")
+        # コミットはチャンクごとに apply_async で投入し、投入した順に結果を受け取る。
+        # 処理中のチャンク数に上限を設け、メモリ使用量を一定に保つ。共有プールでは、1つのリポジトリが
+        # プールのキューを埋め尽くさない上限にもなる。投入も待機もこのスレッドで行うので、
+        # プール側のスレッドが特定のリポジトリのために止まることはない
+        max_in_flight = max(1, max(batch_size, chunksize * num_processes * 4) // chunksize)
 
-    def write_results(self, csv_filename, results):
-        # クラスのフィールド名を使用
-        with open(csv_filename, 'a', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=self.fieldnames)
-            for row in results:
-                # 必要なフィールドがない場合のデフォルト値を設定
-                row_with_defaults = {
-                    'Commit': row.get('Commit', ''),
-                    'Date_Unix': row.get('Date_Unix', 0),
-                    'Date_ISO': row.get('Date_ISO', ''),
-                    'File': row.get('File', ''),
-                    'Lines': row.get('Lines', 0),
-                    'Change': row.get('Change', 'unchanged'),
-                    'OldPath': row.get('OldPath', ''),
-                    'Type': row.get('Type', 'file')
-                }
-                writer.writerow(row_with_defaults)
\ No newline at end of file
+        if pool is None:
+            own_pool = Pool(processes=num_processes, initializer=_init_worker, initargs=(self,))
+
+            def submit(chunk):
+                return own_pool.apply_async(_process_commits_in_worker, (file_extensions, chunk))
+        else:
+            own_pool = None
+            # ワーカーは共有プールの起動後に追加されたリポジトリを知らないので、状態をタスクと一緒に渡す
+            state = pickle.dumps(self)
+            key = (self.repo_path, self.traversal, self.line_counter.rule())
+
+            def submit(chunk):
+                return pool.apply_async(_process_shared_commits_in_worker, (key, state, file_extensions, chunk))
+
+        shas = self.iter_commit_shas(rev_range)
+        in_flight = deque()
+        batch_results = []
+
+        try:
+            while True:
+                while len(in_flight) < max_in_flight:
+                    chunk = list(islice(shas, chunksize))
+                    if not chunk:
+                        break
+                    in_flight.append(submit(chunk))
+                if not in_flight:
+                    break
+
+                # FileId はコミット順に振る必要があるので、先に投入したチャンクから反映する
+                for result, (pid, seconds, blob_stats) in in_flight.popleft().get():
+                    self.telemetry.record_worker(pid, 1, seconds, **blob_stats)
+                    for name, value in blob_stats.items():
+                        self.telemetry.count(name, value)
+                    commit_info, rows, parents = result
+                    batch_results.extend(self.replay(index, commit_info, parents, rows))
+                    processed_commits += 1
+
+                    if processed_commits % batch_size == 0:
+                        writer.write(batch_results)
+                        batch_results = []
+                        self.report_progress(processed_commits, total_commits, start_time)
+        finally:
+            shas.close()
+            if own_pool is not None:
+                own_pool.terminate()
+                own_pool.join()
+            else:
+                # 失敗した場合も、共有プールに残したチャンクが終わるのを待ってから戻る
+                for async_result in in_flight:
+                    async_result.wait()
+
+        writer.write(batch_results)
+        self.report_progress(processed_commits, total_commits, start_time)
+
+        return processed_commits
+
+    def process_commits_from_log(self, writer, index, file_extensions, batch_size, rev_range):
+        """
+        1本の `git log --raw -z` の出力をストリームで読み込み、コミット順に書き込みます。
+        """
+        total_commits = self.count_commits(rev_range)
+
+        start_time = time.time()
+        processed_commits = 0
+        batch = []
+
+        def flush_batch():
+            # バッチ内の全コミットのblobを1回のパイプライン要求で読み込んでから行を作る
+            self.prefetch_line_counts(
+                sha for _, _, changes in batch for sha in self.blobs_to_count(changes, file_extensions))
+            results = []
+            for commit_info, parents, changes in batch:
+                rows = self.build_rows(commit_info, changes, file_extensions)
+                results.extend(self.replay(index, commit_info, parents, rows))
+            writer.write(results)
+            batch.clear()
+
+        for commit in CommitStream(self.repo_path, rev_range, reverse=True, traversal=self.traversal):
+            batch.append(commit)
+            processed_commits += 1
+
+            if len(batch) >= batch_size:
+                flush_batch()
+                self.report_progress(processed_commits, total_commits, start_time)
+
+        flush_batch()
+        self.report_progress(processed_commits, total_commits, start_time)
+
+        return processed_commits
+
+    def sample_commits(self, rev_range, sample):
+        """
+        サンプリングで状態を求めるコミットを、第1親をたどった古い順で返します。
+
+        区切りは範囲の先頭ではなく、範囲の最後のコミットから第1親をたどった履歴全体を基準に決めるので、
+        `前回のHEAD..HEAD` から再開した場合も、全件を処理した場合と同じコミットが選ばれます。
+
+        :param sample: 期間（'Y', 'M', 'W', 'D' など）なら、履歴全体の最も古い日時から pd.date_range で作る
+                       区切り（SnapshotEngine.boundaries と同じ作り方）ごとの、それ以前の最後のコミット、
+                       整数Nなら履歴の先頭から数えて N 番目ごとのコミット。範囲の最後のコミットは常に含みます
+        :return: 範囲内のコミットのSHAのリスト
+        """
+        in_range = self.repo.git.rev_list('--first-parent', rev_range).split()
+        if not in_range:
+            return []
+        output = self.repo.git.log('--first-parent', '--reverse', '--format=%H %ct', in_range[0])
+        commits = [line.split() for line in output.splitlines()]
+        shas = [sha for sha, _ in commits]
+        if isinstance(sample, int):
+            indices = list(range(sample - 1, len(shas), sample))
+        else:
+            dates = np.array([int(unix) for _, unix in commits], dtype=np.int64)
+            boundaries = pd.date_range(start=pd.to_datetime(dates.min(), unit='s', utc=True),
+                                       end=pd.to_datetime(dates.max(), unit='s', utc=True),
+                                       freq=SnapshotEngine.frequency(sample))
+            # 日時が逆転していても「区切り以前の最後のコミット」になるよう、後ろからの最小値で探す
+            suffix_min = np.minimum.accumulate(dates[::-1])[::-1]
+            indices = np.searchsorted(suffix_min, boundaries.asi8 // 10 ** 9, side='right') - 1
+            indices = indices[indices >= 0].tolist()
+        in_range = set(in_range)
+        return [shas[i] for i in sorted(set(indices) | {len(shas) - 1}) if shas[i] in in_range]
+
+    def process_commits_sampled(self, writer, index, file_extensions, rev_range, sample, last_head=None):
+        """
+        サンプリングしたコミットの状態だけから履歴を作ります。
+
+        各サンプルのファイルの状態は `git ls-tree -r -l` で求め、行数は前のサンプルからblobが変わった
+        ファイルだけを数えます（変わらないファイルは前のサンプルの行数を使います）。変更回数は
+        blobを読まない `git log --raw --no-renames` で数え、サンプルの間にファイルを変更したコミットごとに
+        1行を書き込みます。その行の行数はサンプル時点の値なので、期間の区切りでの状態は正しくなりますが、
+        区切りの間の状態は表しません。リネームは削除と追加として記録されます。
+
+        :param sample: sample_commits の sample
+        :param last_head: 再開する場合、前回処理したコミット（その状態から差分を求めます）
+        :return: 走査したコミット数
+        """
+        samples = set(self.sample_commits(rev_range, sample))
+        total_commits = self.count_commits(rev_range)
+        start_time = time.time()
+        processed_commits = 0
+
+        def included(path):
+            return not (file_extensions and not any(path.endswith(ext) for ext in file_extensions))
+
+        # パス -> [blobのSHA, 行数]（行数は、拡張子フィルタを通らないかまだ数えていなければNone）
+        state = {path: [blob, None] for path, (blob, _) in self.ls_tree(last_head).items()} if last_head else {}
+        pending = []
+
+        for commit_info, _, changes in CommitStream(self.repo_path, rev_range, reverse=True, renames=False):
+            pending.append((commit_info, changes))
+            processed_commits += 1
+            if commit_info['Commit'] not in samples:
+                continue
+
+            tree = self.ls_tree(commit_info['Commit'])
+            touched = {b_path or a_path for _, changes in pending for _, a_path, b_path, _ in changes}
+            # 行数を数えるのは、blobが変わったファイルと、この期間に変更されて行数が未知のファイルだけ
+            recount = {path for path, (blob, _) in tree.items()
+                       if included(path) and (path not in state or state[path][0] != blob
+                                              or (path in touched and state[path][1] is None))}
+            self.prefetch_line_counts(tree[path][0] for path, (_, size) in tree.items()
+                                      if path in recount and size)
+
+            for path, (blob, size) in tree.items():
+                previous = state.get(path)
+                if previous is not None and previous[0] == blob:
+                    if path in recount:
+                        previous[1] = self.count_blob_lines(blob) if size else 0
+                    continue
+                lines = (self.count_blob_lines(blob) if size else 0) if included(path) else None
+                state[path] = [blob, lines]
+            for path in [path for path in state if path not in tree]:
+                del state[path]
+
+            # 変更回数のための行（期間内にファイルを変更したコミットごとに1行）
+            results = []
+            for info, changes in pending:
+                for change_type, a_path, b_path, b_sha in changes:
+                    path = b_path or a_path
+                    if change_type not in ('A', 'M', 'D') or not included(path) or (change_type != 'D' and not b_sha):
+                        continue
+                    present = change_type != 'D' and path in tree
+                    results.append({**info,
+                        'File': path,
+                        'Lines': state[path][1] if present else 0,
+                        'Change': {'A': 'added', 'M': 'modified', 'D': 'deleted'}[change_type],
+                        'Type': 'file',
+                        'Files': 1 if present else 0})
+            # リネームは検出しないので、FileId はパスごとの番号になる
+            index.assign_file_ids(results)
+            index.apply(results)
+            writer.write(results)
+            self.line_cache.flush()
+            self.telemetry.count('samples')
+            pending = []
+            self.report_progress(processed_commits, total_commits, start_time)
+
+        return processed_commits
+
+
+# ワーカープロセスごとのリポジトリ（Poolのinitializerで1度だけ用意する）
+_worker_repository = None
+
+
+def _init_worker(repository):
+    global _worker_repository
+    _worker_repository = repository
+    # fork元のgit.Repoは親プロセスとcat-fileのパイプを共有しているため、開き直す
+    _worker_repository.repo = git.Repo(repository.repo_path)
+
+
+def _measured_process_commit(repository, file_extensions, commit_sha):
+    """
+    コミットを処理し、(結果, (pid, 処理時間, BlobReader.stats の増分)) を返します。
+    """
+    reader = repository.blob_reader
+    stats = dict(reader.stats)
+    start = time.perf_counter()
+    result = repository.process_commit(file_extensions, commit_sha)
+    return result, (os.getpid(), time.perf_counter() - start,
+                    {name: value - stats[name] for name, value in reader.stats.items()})
+
+
+def _process_commits_in_worker(file_extensions, commit_shas):
+    return [_measured_process_commit(_worker_repository, file_extensions, sha) for sha in commit_shas]
+
+
+# 共有プールのワーカーで復元したリポジトリ（古いものから閉じる）
+_shared_repositories = OrderedDict()
+_MAX_SHARED_REPOSITORIES = 8
+
+
+def _process_shared_commits_in_worker(key, state, file_extensions, commit_shas):
+    repository = _shared_repositories.get(key)
+    if repository is None:
+        repository = pickle.loads(state)
+        repository.repo = git.Repo(repository.repo_path)
+        _shared_repositories[key] = repository
+        while len(_shared_repositories) > _MAX_SHARED_REPOSITORIES:
+            _, oldest = _shared_repositories.popitem(last=False)
+            oldest.close()
+    else:
+        _shared_repositories.move_to_end(key)
+    return [_measured_process_commit(repository, file_extensions, sha) for sha in commit_shas]
\ No newline at end of file
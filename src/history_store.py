@@ -0,0 +1,230 @@
+import json
+import os
+import shutil
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+
+class HistoryStore:
+    """
+    コミット履歴を列ごとの型付きバイナリファイルとして保存する列指向ストレージ。
+
+    各列は `<列名>.bin` に固定長の配列として追記され、読み込み時はnp.memmapで
+    コピーせずに参照します。File / OldPath / Change / Type / Commit は辞書エンコードされ、
+    辞書は `<辞書名>.jsonl` に1行1要素で保存されます。日時はUNIX時刻（int64）と
+    タイムゾーンのオフセット（分, int16）で保持し、Date_ISO は読み込み時に復元します。
+    """
+
+    VERSION = 3
+
+    # 列名: (dtype, 辞書名)
+    COLUMNS = {
+        'Commit': ('<i4', 'commits'),
+        'Date_Unix': ('<i8', None),
+        'Tz_Offset': ('<i2', None),
+        'File': ('<i4', 'paths'),
+        'Lines': ('<i8', None),
+        'Change': ('<i1', 'changes'),
+        'OldPath': ('<i4', 'paths'),
+        'Type': ('<i1', 'types'),
+        'Files': ('<i4', None),
+        'FileId': ('<i4', None),
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self._meta = None
+        self._dictionaries = {}
+        self._index = {}
+
+    @staticmethod
+    def path_for(csv_filename):
+        return os.path.splitext(csv_filename)[0] + ".cols"
+
+    @staticmethod
+    def is_store(path):
+        return os.path.isfile(os.path.join(path, 'meta.json'))
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @property
+    def meta(self):
+        if self._meta is None:
+            with open(self._file('meta.json'), encoding='utf-8') as f:
+                self._meta = json.load(f)
+        return self._meta
+
+    @property
+    def rows(self):
+        return self.meta['rows']
+
+    def _save_meta(self):
+        tmp_file = self._file('meta.json.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._meta, f, indent=2)
+        os.replace(tmp_file, self._file('meta.json'))
+
+    def create(self):
+        """
+        空のストアを作成します。既存のストアは削除されます。
+        """
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        dictionary_names = sorted({d for _, d in self.COLUMNS.values() if d})
+        for name in list(self.COLUMNS) + [f"{d}.jsonl" for d in dictionary_names]:
+            file_name = name if name.endswith('.jsonl') else f"{name}.bin"
+            open(self._file(file_name), 'wb').close()
+        self._meta = {
+            'version': self.VERSION,
+            'rows': 0,
+            'columns': {name: dtype for name, (dtype, _) in self.COLUMNS.items()},
+            'dictionaries': {name: 0 for name in dictionary_names},
+        }
+        self._dictionaries = {name: [] for name in dictionary_names}
+        self._index = {name: {} for name in dictionary_names}
+        self._save_meta()
+
+    def dictionary(self, name):
+        """
+        辞書（コードから文字列への対応）を読み込みます。
+        """
+        if name not in self._dictionaries:
+            count = self.meta['dictionaries'][name]
+            values = []
+            with open(self._file(f"{name}.jsonl"), encoding='utf-8') as f:
+                for line in f:
+                    if len(values) == count:
+                        break
+                    values.append(json.loads(line))
+            self._dictionaries[name] = values
+        return self._dictionaries[name]
+
+    def _encode(self, name, value):
+        index = self._index.get(name)
+        if index is None:
+            index = {v: i for i, v in enumerate(self.dictionary(name))}
+            self._index[name] = index
+        code = index.get(value)
+        if code is None:
+            code = len(index)
+            index[value] = code
+            self._dictionaries[name].append(value)
+        return code
+
+    def truncate(self, rows):
+        """
+        指定した行数までストアを切り詰めます（中断した追記の取り消しに使います）。
+        記録済みの辞書より後ろに書かれた要素も取り除きます。
+        """
+        for name, (dtype, _) in self.COLUMNS.items():
+            with open(self._file(f"{name}.bin"), 'r+b') as f:
+                f.truncate(rows * np.dtype(dtype).itemsize)
+        for name, count in self.meta['dictionaries'].items():
+            values = self.dictionary(name)[:count]
+            with open(self._file(f"{name}.jsonl"), 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(v, ensure_ascii=False) + '\n' for v in values)
+        self._meta['rows'] = rows
+        self._save_meta()
+
+    def append(self, results):
+        """
+        行の辞書のリストを追記します。
+
+        :param results: GitRepository.build_rows が返す形式の行のリスト
+        """
+        if not results:
+            return
+        dictionary_sizes = {name: len(self.dictionary(name)) for name in self.meta['dictionaries']}
+
+        columns = {name: [] for name in self.COLUMNS}
+        for row in results:
+            date_iso = row.get('Date_ISO', '')
+            offset = datetime.fromisoformat(date_iso).utcoffset() if date_iso else None
+            old_path = row.get('OldPath', '')
+            columns['Commit'].append(self._encode('commits', row.get('Commit', '')))
+            columns['Date_Unix'].append(row.get('Date_Unix', 0))
+            columns['Tz_Offset'].append(int(offset.total_seconds() // 60) if offset else 0)
+            columns['File'].append(self._encode('paths', row.get('File', '')))
+            columns['Lines'].append(row.get('Lines', 0))
+            columns['Change'].append(self._encode('changes', row.get('Change', 'unchanged')))
+            columns['OldPath'].append(self._encode('paths', old_path) if old_path else -1)
+            columns['Type'].append(self._encode('types', row.get('Type', 'file')))
+            columns['Files'].append(row.get('Files', 0))
+            columns['FileId'].append(row.get('FileId', -1))
+
+        for name, (dtype, _) in self.COLUMNS.items():
+            with open(self._file(f"{name}.bin"), 'ab') as f:
+                f.write(np.asarray(columns[name], dtype=dtype).tobytes())
+        for name, size in dictionary_sizes.items():
+            new_values = self._dictionaries[name][size:]
+            if new_values:
+                with open(self._file(f"{name}.jsonl"), 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(v, ensure_ascii=False) + '\n' for v in new_values)
+
+        # メタデータは最後に書き換えるので、途中で中断しても記録済みの行数までは整合している
+        self._meta['rows'] += len(results)
+        self._meta['dictionaries'] = {name: len(values) for name, values in self._dictionaries.items()}
+        self._save_meta()
+
+    def column(self, name):
+        """
+        列の生のコード配列をメモリマップで返します。
+        """
+        dtype = np.dtype(self.meta['columns'][name])
+        if self.rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._file(f"{name}.bin"), dtype=dtype, mode='r', shape=(self.rows,))
+
+    def _categorical(self, name):
+        _, dictionary_name = self.COLUMNS[name]
+        codes = self.column(name)
+        categories = pd.Index(self.dictionary(dictionary_name), dtype=object)
+        return pd.Categorical.from_codes(codes, categories=categories)
+
+    def _date_iso(self):
+        unix = pd.Series(self.column('Date_Unix'))
+        offsets = pd.Series(self.column('Tz_Offset'))
+        date_iso = pd.Series('', index=unix.index, dtype=object)
+        # オフセットごとにまとめて変換する
+        for offset in offsets.unique():
+            mask = offsets == offset
+            tz = timezone(timedelta(minutes=int(offset)))
+            date_iso[mask] = pd.to_datetime(unix[mask], unit='s', utc=True).dt.tz_convert(tz).map(
+                lambda t: t.isoformat())
+        return date_iso
+
+    def read(self, columns=None):
+        """
+        ストアをDataFrameとして読み込みます。
+
+        :param columns: 読み込む列名のリスト（Noneなら全て）。Date_ISO は Date_Unix と
+                        Tz_Offset から復元されます
+        :return: 数値列はメモリマップ、辞書エンコード列はCategoricalのDataFrame
+        """
+        if columns is None:
+            columns = [name for name in self.meta['columns'] if name != 'Tz_Offset']
+            columns.insert(columns.index('Date_Unix') + 1, 'Date_ISO')
+
+        data = {}
+        for name in columns:
+            if name == 'Date_ISO':
+                data[name] = self._date_iso()
+            elif self.COLUMNS[name][1]:
+                data[name] = self._categorical(name)
+            else:
+                data[name] = self.column(name)
+        return pd.DataFrame(data, copy=False)
+
+    def to_csv(self, csv_filename, chunk_rows=1_000_000):
+        """
+        ストアの内容を従来形式のCSV（csv.DictWriter と同じ改行コード）として書き出します。
+        """
+        df = self.read()
+        for start in range(0, max(len(df), 1), chunk_rows):
+            df.iloc[start:start + chunk_rows].to_csv(
+                csv_filename, mode='w' if start == 0 else 'a', header=start == 0, index=False,
+                lineterminator='\r\n')
@@ -0,0 +1,78 @@
+import csv
+import queue
+import threading
+from .history_store import HistoryStore
+
+
+class HistoryWriter:
+    """
+    コミット履歴の出力を1つの専用スレッドで書き込みます。
+
+    ファイルは開いたまま保持し、行のバッチは境界付きキューで受け取るため、
+    書き込みが遅れても呼び出し側が抱えるバッチ数は max_batches までに抑えられます。
+    """
+
+    def __init__(self, history_path, fieldnames, storage='csv', max_batches=8):
+        """
+        :param history_path: CSVファイルまたは列指向ストアのパス（既に作成済みであること）
+        :param fieldnames: CSVの列名
+        :param storage: 'csv' または 'columnar'
+        :param max_batches: キューに溜められるバッチ数の上限
+        """
+        self.history_path = history_path
+        self.fieldnames = fieldnames
+        self.storage = storage
+        self.rows_written = 0
+        self._queue = queue.Queue(maxsize=max_batches)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._error = None
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, rows):
+        """
+        行のバッチを書き込みキューに入れます。キューが一杯の場合は空くまで待ちます。
+        """
+        if self._error is not None:
+            raise self._error
+        if rows:
+            self._queue.put(rows)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _batches(self):
+        while True:
+            rows = self._queue.get()
+            if rows is None:
+                return
+            yield rows
+
+    def _run(self):
+        try:
+            if self.storage == 'columnar':
+                store = HistoryStore(self.history_path)
+                for rows in self._batches():
+                    store.append(rows)
+                    self.rows_written += len(rows)
+            else:
+                with open(self.history_path, 'a', newline='', encoding='utf-8') as csvfile:
+                    # OldPath 以外の列は常に行に含まれるので、欠けた列は空文字で埋める
+                    writer = csv.DictWriter(csvfile, fieldnames=self.fieldnames, restval='')
+                    for rows in self._batches():
+                        writer.writerows(rows)
+                        self.rows_written += len(rows)
+        except Exception as e:
+            self._error = e
+            # 呼び出し側がput()で止まらないよう、残りのバッチは読み捨てる
+            for _ in self._batches():
+                pass
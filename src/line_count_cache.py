@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class LineCountCache:
+    """
+    blobのSHAをキーとした行数キャッシュ。
+
+    出力ディレクトリ以下のSQLiteファイルに保存され、再実行時にも再利用されます。
+    接続はプロセス・スレッドごとに開き直すため、Poolのワーカー間やスレッド間で共有しても安全です。
+    保存した行数の数え方（LineCounter.rule）も記録し、数え方が変わった場合は全て破棄します。
+    """
+
+    def __init__(self, db_path, max_entries=1_000_000, rule=None):
+        """
+        :param db_path: SQLiteファイルのパス
+        :param max_entries: 保持する最大エントリ数（超過分は最終利用が古いものから削除）
+        :param rule: 行数の数え方を表す文字列（LineCounter.rule）
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.rule = rule
+        self._conn = None
+        self._pid = None
+        self._pending = {}
+        self._touched = set()
+        self._generation = int(time.time())
+
+    def __getstate__(self):
+        # SQLite接続はプロセス間で受け渡せないため、ピクル時には除外する
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        state['_pid'] = None
+        state['_pending'] = {}
+        state['_touched'] = set()
+        return state
+
+    def _connection(self):
+        # fork後の子プロセスや別のスレッドでは元の接続を使わず、新しく接続を開く
+        owner = (os.getpid(), threading.get_ident())
+        if self._conn is None or self._pid != owner:
+            self._conn = sqlite3.connect(self.db_path, timeout=60)
+            self._pid = owner
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS line_counts ('
+                'sha BLOB PRIMARY KEY, lines INTEGER NOT NULL, last_used INTEGER NOT NULL)'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS line_counts_last_used ON line_counts(last_used)'
+            )
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._conn.commit()
+            self._check_rule()
+        return self._conn
+
+    def _check_rule(self):
+        conn = self._connection()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'rule'").fetchone()
+        if row is not None and row[0] == self.rule:
+            return
+        with conn:
+            if row is not None:
+                print("Line counting rule changed. Clearing line count cache.")
+            conn.execute('DELETE FROM line_counts')
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rule', ?)", (self.rule,))
+
+    def set_rule(self, rule):
+        """
+        行数の数え方を設定します。キャッシュの数え方と異なる場合は、保存済みの行数を破棄します。
+        """
+        if rule == self.rule:
+            return
+        self.rule = rule
+        self._pending.clear()
+        self._touched.clear()
+        # ワーカーが接続を開く前に、ここで破棄しておく
+        self._connection()
+        self._check_rule()
+
+    def get(self, hexsha):
+        """
+        キャッシュされた行数を返します。見つからない場合はNoneを返します。
+        """
+        if hexsha in self._pending:
+            return self._pending[hexsha]
+        row = self._connection().execute(
+            'SELECT lines FROM line_counts WHERE sha = ?', (bytes.fromhex(hexsha),)
+        ).fetchone()
+        if row is None:
+            return None
+        self._touched.add(hexsha)
+        return row[0]
+
+    def put(self, hexsha, lines):
+        self._pending[hexsha] = lines
+
+    def flush(self):
+        """
+        保留中の書き込みと利用記録をまとめて1トランザクションで反映します。
+        """
+        if not self._pending and not self._touched:
+            return
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO line_counts (sha, lines, last_used) VALUES (?, ?, ?)',
+                [(bytes.fromhex(sha), lines, self._generation)
+                 for sha, lines in self._pending.items()]
+            )
+            conn.executemany(
+                'UPDATE line_counts SET last_used = ? WHERE sha = ?',
+                [(self._generation, bytes.fromhex(sha)) for sha in self._touched]
+            )
+        self._pending.clear()
+        self._touched.clear()
+
+    def evict(self):
+        """
+        エントリ数がmax_entriesを超えている場合、最終利用が古いものから削除します。
+        """
+        self.flush()
+        conn = self._connection()
+        with conn:
+            total = conn.execute('SELECT COUNT(*) FROM line_counts').fetchone()[0]
+            excess = total - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    'DELETE FROM line_counts WHERE sha IN '
+                    '(SELECT sha FROM line_counts ORDER BY last_used ASC LIMIT ?)',
+                    (excess,)
+                )
+                print(f"Evicted {excess} entries from line count cache")
+
+    def close(self):
+        if self._conn is not None and self._pid == (os.getpid(), threading.get_ident()):
+            self.flush()
+            self._conn.close()
+        self._conn = None
+        self._pid = None
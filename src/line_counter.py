@@ -0,0 +1,88 @@
+class LineCounter:
+    """
+    blobの内容をデコードせずに、バイト列のまま行数を数えます。
+
+    数え方: 行は LF（b'\\n'）までのバイト列で、最後の行が LF で終わらない場合もその行を1行と数えます。
+    CRLF は LF と同じく1行で、CR だけの改行や改ページなどは区切りとして扱いません。
+    内容は chunk_size ごとに読みながら数えるので、大きなblobも全体をメモリに載せません。
+
+    先頭の probe_size バイトに NUL を含むblobは（git diff と同じ判定で）バイナリとみなし、
+    max_size を超えるblobは内容を読み捨て、それぞれ行数の代わりに BINARY / OVERSIZED を返します。
+    これらの値は行数キャッシュにもそのまま保存されるので、次回からはblobを読みません。
+    """
+
+    BINARY = -1
+    OVERSIZED = -2
+    # 数え方を変えた場合は上げる（キャッシュと出力が作り直されます）
+    VERSION = 1
+
+    def __init__(self, max_size=None, probe_size=8000, chunk_size=1 << 20):
+        """
+        :param max_size: 行数を数えるblobの最大バイト数（Noneなら制限なし）
+        :param probe_size: バイナリの判定に使う先頭のバイト数
+        :param chunk_size: 一度に読み込むバイト数
+        """
+        if max_size is not None and max_size < 0:
+            raise ValueError(f"Invalid max blob size: {max_size}")
+        self.max_size = max_size
+        self.probe_size = probe_size
+        self.chunk_size = chunk_size
+
+    def rule(self):
+        """
+        行数を左右する設定を表す文字列。キャッシュや出力を作り直すかどうかの判定に使います。
+        """
+        return f"lf-v{self.VERSION};probe={self.probe_size};max={self.max_size}"
+
+    @staticmethod
+    def lines(count):
+        """
+        count / count_stream の結果から、履歴に記録する行数を返します（バイナリとサイズ超過は0行）。
+        """
+        return max(count, 0)
+
+    def count(self, data):
+        """
+        メモリ上の内容（bytes）の行数を返します。
+        """
+        if self.max_size is not None and len(data) > self.max_size:
+            return self.OVERSIZED
+        if b'\0' in data[:self.probe_size]:
+            return self.BINARY
+        return data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0)
+
+    def count_stream(self, read, size):
+        """
+        ストリームから size バイトを読みながら行数を数えます。
+        バイナリやサイズ超過の場合も、続きを読めるよう size バイトを全て読み捨てます。
+
+        :param read: バイト数を受け取り、その長さのbytesを返す関数（ファイルの read など）
+        :param size: 内容のバイト数
+        :return: 行数、BINARY または OVERSIZED
+        """
+        if self.max_size is not None and size > self.max_size:
+            self._skip(read, size)
+            return self.OVERSIZED
+        probe = read(min(size, self.probe_size))
+        remaining = size - len(probe)
+        if b'\0' in probe:
+            self._skip(read, remaining)
+            return self.BINARY
+
+        lines = probe.count(b'\n')
+        last = probe[-1:]
+        while remaining > 0:
+            chunk = read(min(remaining, self.chunk_size))
+            if not chunk:
+                raise EOFError(f"Unexpected end of stream ({remaining} bytes left)")
+            lines += chunk.count(b'\n')
+            last = chunk[-1:]
+            remaining -= len(chunk)
+        return lines + (1 if last and last != b'\n' else 0)
+
+    def _skip(self, read, size):
+        while size > 0:
+            chunk = read(min(size, self.chunk_size))
+            if not chunk:
+                raise EOFError(f"Unexpected end of stream ({size} bytes left)")
+            size -= len(chunk)
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+
+class PathTable:
+    """
+    パスを整数のIDに変換する表。
+
+    ファイルのパスと、その親ディレクトリのパスを全て昇順に並べ、位置をIDとします。
+    親ディレクトリのID（parent_ids）と、パスを '/' で区切った要素の表（component_codes）は
+    作成時に1回だけ求めるので、フレームごとにパスの文字列を分割する必要がありません。
+    昇順なので groupby('File') の順序とIDの順序は一致し、親は必ず子より前に並びます。
+    文字列が必要になったら paths / components から取り出してください。
+    """
+
+    def __init__(self, paths):
+        """
+        :param paths: ファイルのパスのイテラブル（重複があってもよい）
+        """
+        nodes = set()
+        for path in paths:
+            # 親ディレクトリは、すでに登録されていればその先も登録済み
+            while path and path not in nodes:
+                nodes.add(path)
+                path = path[:max(path.rfind('/'), 0)]
+        self.paths = pd.Index(sorted(nodes), dtype=object)
+
+        cuts = [path.rfind('/') for path in self.paths]
+        self.parent_ids = self.paths.get_indexer([path[:cut] if cut >= 0 else None
+                                                  for path, cut in zip(self.paths, cuts)])
+        self.depths = np.array([path.count('/') for path in self.paths], dtype=np.int64)
+        self.names = np.array([path[cut + 1:] for path, cut in zip(self.paths, cuts)], dtype=object)
+
+        # 要素の表: component_codes[ID, 階層] は components での位置（その階層がなければ -1）
+        name_codes, self.components = pd.factorize(self.names)
+        width = int(self.depths.max()) + 1 if len(self.paths) else 0
+        self.component_codes = np.full((len(self.paths), width), -1, dtype=np.int32)
+        node = np.arange(len(self.paths))
+        rows = node
+        while len(rows):
+            self.component_codes[rows, self.depths[node]] = name_codes[node]
+            node = self.parent_ids[node]
+            rows, node = rows[node >= 0], node[node >= 0]
+        self._parts = np.empty(len(self.paths), dtype=object)
+        self._mapped = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    @classmethod
+    def from_frames(cls, dfs, columns=('File', 'OldPath')):
+        """
+        DataFrameの File 列（あれば OldPath 列も）に現れるパスから表を作ります。
+
+        :param dfs: DataFrameのイテラブル
+        :param columns: パスを持つ列名
+        """
+        paths = set()
+        for df in dfs:
+            for name in columns:
+                if name in df:
+                    paths.update(df[name].dropna().unique())
+        return cls(paths)
+
+    def ids(self, values):
+        """
+        パスの列をIDの配列に変換します。表にないパスと欠損値は -1 になります。
+
+        :param values: パスのSeries（Categoricalなら、カテゴリだけを変換します）
+        :return: int64の配列
+        """
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories = values.cat.categories
+            codes = values.cat.codes.to_numpy().astype(np.int64)
+            if categories is self.paths:
+                return codes
+            # 同じカテゴリの列が続くことが多いので、カテゴリの変換表は直前のものを使い回す
+            # （末尾の -1 は欠損値のコード -1 の変換先）
+            mapped = self._mapped
+            if mapped is None or mapped[0] is not categories:
+                mapped = self._mapped = (categories, np.append(self.paths.get_indexer(categories), -1))
+            return mapped[1][codes]
+        return self.paths.get_indexer(values).astype(np.int64)
+
+    def categorical(self, ids):
+        """
+        IDの配列を、表のパスをカテゴリとするCategoricalにします（文字列はコピーしません）。
+        """
+        return pd.Categorical.from_codes(ids, categories=self.paths, validate=False)
+
+    def ancestors(self, ids):
+        """
+        指定したIDと、その全ての祖先のIDを昇順で返します。
+        """
+        nodes = [np.asarray(ids, dtype=np.int64)]
+        while len(nodes[-1]):
+            parents = self.parent_ids[nodes[-1]]
+            nodes.append(np.unique(parents[parents >= 0]))
+        return np.unique(np.concatenate(nodes))
+
+    def parts(self, ids):
+        """
+        パスを '/' で区切った要素のリストを、IDごとに返します（作ったリストは表に保持して使い回します）。
+        """
+        missing = ids[np.equal(self._parts[ids], None)]
+        components = self.components
+        for node in missing:
+            codes = self.component_codes[node, :self.depths[node] + 1]
+            self._parts[node] = components[codes].tolist()
+        return self._parts[ids]
+
+    def path_columns(self, ids):
+        """
+        パスの階層ごとの列を作ります。str.split('/', expand=True) と同じく、階層がなければNoneです。
+
+        :return: 階層ごとのobject配列のリスト
+        """
+        if not len(ids):
+            return []
+        components = np.append(self.components, None)
+        codes = self.component_codes[ids, :int(self.depths[ids].max()) + 1]
+        # コード -1 は末尾の None を指す
+        return [components[codes[:, level]] for level in range(codes.shape[1])]
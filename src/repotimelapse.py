@@ -5,47 +5,144 @@ from .git_repository import GitRepository
 from .commit_analyzer import CommitAnalyzer
 from .dataframe_creator import DataFrameCreator
 from .video_generator import VideoGenerator
+from .history_store import HistoryStore
+from .telemetry import Telemetry
+from .analysis_session import AnalysisSession
 
 
 class RepositoryTimelapse:
-    def __init__(self, repo_url):
-        self.repo = GitRepository(repo_url)
+    def __init__(self, repo_url, clone_mode='full', telemetry=None):
+        # 計測しない場合も同じ呼び出しで済むよう、無効な Telemetry を使う
+        self.telemetry = telemetry or Telemetry(enabled=False)
+        with self.telemetry.stage('clone', clone_mode=clone_mode):
+            self.repo = GitRepository(repo_url, clone_mode)
+        self.repo.telemetry = self.telemetry
+        self._session = None
         self.analyzer = CommitAnalyzer()
         self.df_creator = DataFrameCreator()
         self.video_generator = VideoGenerator()
 
-    def generate_commit_history_csv(self, file_extensions=None, batch_size=100, start_commit=None):
+    def generate_commit_history_csv(self, file_extensions=None, batch_size=100, start_commit=None,
+                                    incremental=True, backend='gitpython', storage='csv', export_csv=False,
+                                    pool=None, traversal='first-parent', sample=None, max_blob_size=None):
         csv_filename = os.path.join(self.repo.output_dir, "commit_history.csv")
-        self.repo.process_commits(csv_filename, file_extensions, batch_size, start_commit)
-        print(f"Commit history CSV has been generated: {csv_filename}")
-        return csv_filename
+        history_path = self.repo.process_commits(csv_filename, file_extensions, batch_size, start_commit,
+                                                 incremental, backend, storage, pool, traversal, sample,
+                                                 max_blob_size)
+        print(f"Commit history has been generated: {history_path}")
+        if storage == 'columnar' and export_csv:
+            HistoryStore(history_path).to_csv(csv_filename)
+            print(f"Commit history CSV has been exported: {csv_filename}")
+        # 履歴を書き直したので、以前に読み込んだ表は使えない
+        self.session(history_path).invalidate()
+        return history_path
 
-    def generate_treemap(self, csv_filename):
-        df_latest, path_columns = self.df_creator.treemap_dateframe(csv_filename)
+    def session(self, csv_filename):
+        """
+        コミット履歴の AnalysisSession を返します。同じ履歴に対しては同じセッションを使い回します。
+        """
+        if self._session is None or self._session.history_path != csv_filename:
+            self._session = AnalysisSession(csv_filename)
+        return self._session
+
+    def generate_treemap(self, csv_filename, node_budget=None):
+        df_latest, path_columns = self.session(csv_filename).treemap_frame()
         output_path = os.path.join(self.repo.output_dir, "file_structure_treemap.html")
-        self.video_generator.generate_treemap(df_latest, output_path, 'File Structure Treemap', path_columns)
+        self.video_generator.generate_treemap(df_latest, output_path, 'File Structure Treemap', path_columns,
+                                              node_budget=node_budget)
         print(f"Treemap has been generated: {output_path}")
         webbrowser.open('file://' + os.path.realpath(output_path))
 
-    def generate_treemap_video(self, csv_filename):
-        df_latest, path_columns = self.df_creator.treemap_dateframe(csv_filename)
-        period_dfs = self.df_creator.create_time_series_df(df_latest)
+    def generate_treemap_video(self, csv_filename, treemap_format='html', node_budget=None):
+        with self.telemetry.stage('snapshots'):
+            period_dfs = self.session(csv_filename).snapshots()
+        if treemap_format == 'player':
+            output_path = os.path.join(self.repo.output_dir, "file_structure_treemap_player.html")
+            self.video_generator.generate_treemap_player(
+                period_dfs,
+                output_path=output_path,
+                title='File Structure Treemap Animation',
+                node_budget=node_budget
+            )
+            return
         output_path = os.path.join(self.repo.output_dir, "file_structure_treemap_animation.html")
 
         self.video_generator.generate_animated_treemap(
             period_dfs, 
             output_path=output_path,
-            title='File Structure Treemap Animation'
+            title='File Structure Treemap Animation',
+            node_budget=node_budget
+        )
+
+    def generate_timelapse_videos(self, csv_filename, fps=30, resolution=(1280, 720), node_budget=None):
+        with self.telemetry.stage('snapshots'):
+            period_dfs = self.session(csv_filename).snapshots()
+        width, height = resolution
+        self.video_generator.generate_treemap_mp4(
+            period_dfs,
+            output_path=os.path.join(self.repo.output_dir, "file_structure_treemap.mp4"),
+            title='File Structure Treemap',
+            fps=fps, width=width, height=height, node_budget=node_budget
+        )
+        self.video_generator.generate_bar_race_mp4(
+            period_dfs,
+            output_path=os.path.join(self.repo.output_dir, "line_count_race.mp4"),
+            title='Line Count Race',
+            fps=fps, width=width, height=height
         )
 
     def generate_bar_chart(self, csv_filename):
-        df = self.df_creator.create_extension_df(csv_filename)
+        df = self.session(csv_filename).extension_stats()
         df.to_csv(os.path.join(self.repo.output_dir, "extension.csv"), index=False)
         output_path = os.path.join(self.repo.output_dir, 'extension_bar.html')
         self.video_generator.bar_chart(df, output_path)
 
-    def run_extended_analysis(self, file_extensions=None):
-        csv_filename = self.generate_commit_history_csv(file_extensions)
+    def generate_churn_tables(self, file_extensions=None, traversal='first-parent'):
+        """
+        作者ごと・トップレベルのディレクトリごとの追加・削除行数を author_churn.csv / directory_churn.csv に書き出します。
+        """
+        df = self.analyzer.churn_frame(self.repo.repo_path, 'HEAD',
+                                       file_extensions=file_extensions, traversal=traversal)
+        for name, table in (('author_churn', self.analyzer.author_churn(df)),
+                            ('directory_churn', self.analyzer.directory_churn(df))):
+            output_path = os.path.join(self.repo.output_dir, f"{name}.csv")
+            table.to_csv(output_path, index=False)
+            print(f"Churn table has been saved to {output_path}")
+
+    def run_extended_analysis(self, file_extensions=None, incremental=True, backend='gitpython',
+                              storage='csv', export_csv=False, treemap_format='html', node_budget=None,
+                              video=False, fps=30, resolution=(1280, 720), pool=None, traversal='first-parent',
+                              sample=None, max_blob_size=None, churn=False):
+        with self.telemetry.stage('commit_history'):
+            csv_filename = self.generate_commit_history_csv(file_extensions, incremental=incremental,
+                                                            backend=backend, storage=storage,
+                                                            export_csv=export_csv, pool=pool,
+                                                            traversal=traversal, sample=sample,
+                                                            max_blob_size=max_blob_size)
         # self.generate_treemap(csv_filename)
-        self.generate_treemap_video(csv_filename)
-        self.generate_bar_chart(csv_filename)
+        with self.telemetry.stage('treemap_video', treemap_format=treemap_format):
+            self.generate_treemap_video(csv_filename, treemap_format, node_budget)
+        if video:
+            with self.telemetry.stage('timelapse_videos'):
+                self.generate_timelapse_videos(csv_filename, fps, resolution, node_budget)
+        with self.telemetry.stage('bar_chart'):
+            self.generate_bar_chart(csv_filename)
+        if churn:
+            with self.telemetry.stage('churn'):
+                self.generate_churn_tables(file_extensions, traversal)
+
+    def write_profile(self, format='json'):
+        """
+        計測結果を出力ディレクトリの profile.json（Chromeのトレース形式なら profile.trace.json）に書き出します。
+        ステージごとのプロファイルを取った場合は profile/ に書き出します。
+
+        :param format: 'json' または 'chrome'
+        :return: 書き出したファイルのパス
+        """
+        file_name = "profile.json" if format == 'json' else "profile.trace.json"
+        output_path = os.path.join(self.repo.output_dir, file_name)
+        self.telemetry.write(output_path, format)
+        print(f"Profile has been saved to {output_path}")
+        for path in self.telemetry.write_captures(os.path.join(self.repo.output_dir, "profile")):
+            print(f"Stage profile has been saved to {path}")
+        return output_path
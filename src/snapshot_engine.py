@@ -0,0 +1,155 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from .path_table import PathTable
+
+
+class SnapshotEngine:
+    """
+    日付順に並べたコミット履歴を1回だけ走査し、期間の区切りごとに各ファイルの最新状態を作ります。
+
+    ファイルのパスは最初に整数のIDに変換し、ファイルごとに「最後の行の位置」と変更回数だけを
+    配列で保持します。区切りの間に追加された行だけを反映するため、区切りごとに履歴全体を
+    マスクして集計し直す必要がありません。最新状態は groupby('File').last() と同じく、
+    列ごとに最後の欠損でない値を持ちます。
+
+    FileId 列があれば、ファイルの変更回数は FileId ごとに数えます（リネームを何回たどっても同じファイル）。
+    リネーム元のパスには削除の行がないので、FileId の最後のパスでなくなったパスも最新状態から除きます。
+    """
+
+    def __init__(self, df, period='Y', count_renames=True, path_table=None):
+        """
+        :param df: date / File / Lines / Change / OldPath を含むDataFrame
+        :param period: 期間（pd.date_range の freq。'Y', 'M', 'W', 'D' など）
+        :param count_renames: Trueならリネーム前の変更も変更回数に数えます（FileId 列があればそれで、
+                              なければリネーム前のパスの変更回数として数えます）
+        :param path_table: df のパスを含む PathTable（Noneなら df から作ります）
+        """
+        # 同じ日時の行は元の順序を保つ
+        self.df = df.sort_values('date', kind='stable').reset_index(drop=True)
+        self.period = period
+        self.count_renames = count_renames
+
+        # PathTable のIDはパスの昇順なので、groupby と同じ順序になる
+        self.path_table = path_table if path_table is not None else PathTable.from_frames([self.df])
+        self.paths = self.path_table.paths
+        self.file_ids = self.path_table.ids(self.df['File'])
+        self.rename_ids = np.full(len(self.df), -1)
+        if count_renames and 'OldPath' in self.df:
+            renamed = (self.df['Change'] == 'renamed').to_numpy()
+            self.rename_ids[renamed] = self.path_table.ids(self.df['OldPath'][renamed])
+        self.identity_ids = None
+        if count_renames and 'FileId' in self.df:
+            self.identity_ids = self.df['FileId'].to_numpy().astype(np.int64)
+
+        # 欠損のない列はファイルの最後の行をそのまま使い、欠損のある列だけ列ごとに位置を持つ
+        self.columns = [name for name in self.df.columns if name != 'File']
+        self.sparse_columns = [name for name in self.columns if self.df[name].isna().any()]
+
+    @staticmethod
+    def frequency(period):
+        """
+        期間を pd.date_range / resample の freq に変換します。
+        pandas 2.2 で非推奨になった期間末の別名（'Y', 'M' など）は、同じ意味の 'YE', 'ME' などに置き換えます。
+        """
+        return re.sub(r'^(\d*)(?:Y|A)(?=$|-)', r'\1YE', re.sub(r'^(\d*)(M|Q)(?=$|-)', r'\1\2E', period))
+
+    def boundaries(self):
+        """期間の区切りの日時を返します。"""
+        return pd.date_range(
+            start=self.df['date'].min(),
+            end=self.df['date'].max(),
+            freq=self.frequency(self.period)
+        )
+
+    @staticmethod
+    def _assign_last(target, ids, positions):
+        """ids ごとに最後の positions を target に書き込みます（positions は昇順）。"""
+        if len(ids):
+            unique_ids, index = np.unique(ids[::-1], return_index=True)
+            target[unique_ids] = positions[::-1][index]
+
+    def _iter_states(self):
+        """
+        区切りごとに (period_end, 最後の行の位置, 列ごとの位置, 登場済みか, 変更回数, リネームで移ったか) を返します。
+        返す配列は走査とともに更新されるので、呼び出し側はその場で使い切ること。
+        """
+        boundaries = self.boundaries()
+        ends = self.df['date'].searchsorted(boundaries, side='right')
+
+        size = len(self.paths)
+        last_row = np.full(size, -1, dtype=np.int64)
+        last_value = {name: np.full(size, -1, dtype=np.int64) for name in self.sparse_columns}
+        seen = np.zeros(size, dtype=bool)
+        counts = np.zeros(size, dtype=np.int64)
+        moved = np.zeros(size, dtype=bool)
+        identities = self.identity_ids
+        if identities is not None:
+            # ファイルは FileId ごとに数え、パスにはそのパスの最後の行の FileId の回数を返す
+            identity_counts = np.zeros(int(identities.max()) + 1 if len(identities) else 0, dtype=np.int64)
+            last_identity = np.full(size, -1, dtype=np.int64)
+            identity_path = np.full(len(identity_counts), -1, dtype=np.int64)  # FileId -> 最後の行のパス
+        start = 0
+        for period_end, end in zip(boundaries, ends):
+            positions = np.arange(start, end)
+            ids = self.file_ids[start:end]
+            valid = ids >= 0
+            self._assign_last(last_row, ids[valid], positions[valid])
+            for name, target in last_value.items():
+                mask = valid & self.df[name].iloc[start:end].notna().to_numpy()
+                self._assign_last(target, ids[mask], positions[mask])
+            seen[ids[valid]] = True
+
+            if identities is None:
+                rename_ids = self.rename_ids[start:end]
+                changed = np.concatenate([ids[valid], rename_ids[rename_ids >= 0]])
+                counts += np.bincount(changed, minlength=size)
+            else:
+                identity = identities[start:end]
+                identity_counts += np.bincount(identity[valid], minlength=len(identity_counts))
+                self._assign_last(last_identity, ids[valid], identity[valid])
+                self._assign_last(identity_path, identity[valid], ids[valid])
+                has_file = last_identity >= 0
+                counts[has_file] = identity_counts[last_identity[has_file]]
+                moved[has_file] = identity_path[last_identity[has_file]] != np.flatnonzero(has_file)
+            start = end
+            if seen.any():
+                yield period_end, last_row, last_value, seen, counts, moved
+
+    def _frame(self, ids, index, last_row, last_value, counts):
+        """
+        指定したIDのファイルの最新状態をDataFrameにします。
+        File はパス表のパスをカテゴリとするCategorical（コードがID）です。
+        """
+        data = {'File': self.path_table.categorical(ids)}
+        for name in self.columns:
+            positions = last_value[name][ids] if name in last_value else last_row[ids]
+            data[name] = self.df[name].array.take(positions, allow_fill=True)
+
+        frame = pd.DataFrame(data, index=index)
+        frame['changed_files'] = counts[ids]
+        frame['path_parts'] = self.path_table.parts(ids)
+        return frame
+
+    def _alive(self, last_row, last_value):
+        positions = last_value['Lines'] if 'Lines' in last_value else last_row
+        lines = self.df['Lines'].to_numpy()
+        return np.where(positions >= 0, lines[positions], 0) > 0
+
+    def snapshots(self):
+        """
+        区切りごとに (period_end, 最新状態) を返します。
+
+        最新状態は File 列と changed_files / path_parts 列を持ち、削除されたファイルと
+        リネームで別のパスに移ったファイルを除いたものです。
+        行番号は groupby('File').last().reset_index() を絞り込んだ場合と同じになります。
+        最新状態が空の区切りは返しません。
+        """
+        for period_end, last_row, last_value, seen, counts, moved in self._iter_states():
+            ids = np.flatnonzero(seen & ~moved & self._alive(last_row, last_value))
+            if not len(ids):
+                continue
+            rank = np.cumsum(seen) - 1
+            yield period_end, self._frame(ids, rank[ids], last_row, last_value, counts)
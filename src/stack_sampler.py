@@ -0,0 +1,44 @@
+import os
+import sys
+import threading
+from collections import defaultdict
+
+
+class StackSampler:
+    """
+    別スレッドから一定間隔で対象スレッドのスタックを取り、同じスタックの出現回数を数える
+    簡易なサンプリングプロファイラー。
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = None
+        self._target = None
+
+    def enable(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        # flamegraph.pl / speedscope が読める "スタック 回数" の形式
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, samples in sorted(self.stacks.items()):
+                f.write(f"{stack} {samples}\n")
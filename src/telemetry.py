@@ -0,0 +1,246 @@
+import cProfile
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from .stack_sampler import StackSampler
+
+
+class Telemetry:
+    """
+    ステージごとの経過時間・CPU時間・ピークRSS・カウンターを記録します。
+
+    ステージは stage() で入れ子にでき、カウンターは count() で開いている全てのステージに加算されます。
+    ピークRSSは1本のスレッドが /proc/self/statm を定期的に読んで、開いているステージに反映します。
+    Poolのワーカーでの処理は record_worker() でワーカーごとに集計します。
+    結果は write() でJSON、またはChromeのトレース形式（chrome://tracing や Perfetto で表示できる）に書き出します。
+
+    capture に 'cprofile' または 'sample' を指定すると、最上位のステージごとに
+    cProfile の統計（.prof）、またはサンプリングしたスタック（flamegraph.pl などで使う .folded）を取ります。
+    enabled=False の場合は何も記録しません。
+    """
+
+    CAPTURES = ('cprofile', 'sample')
+
+    def __init__(self, enabled=True, capture=None, sample_interval=0.005, rss_interval=0.01):
+        """
+        :param enabled: Falseなら全ての記録を省略します
+        :param capture: None、'cprofile' または 'sample'
+        :param sample_interval: 'sample' でスタックを取る間隔（秒）
+        :param rss_interval: RSSを読む間隔（秒）
+        """
+        if capture not in (None,) + self.CAPTURES:
+            raise ValueError(f"Invalid capture: {capture}. Use 'cprofile' or 'sample'.")
+        self.enabled = enabled
+        self.capture = capture
+        self.sample_interval = sample_interval
+        self.rss_interval = rss_interval
+        self.stages = []
+        self.counters = defaultdict(int)
+        self.workers = {}
+        self.captures = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = []
+        self._sampler = None
+        self._epoch = time.time()
+        self._page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    def __getstate__(self):
+        # ワーカーには記録を持ち込まない（ワーカーの集計は record_worker で親に返す）
+        return {'enabled': False, 'capture': None}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _rss(self):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * self._page_size
+        except (OSError, ValueError, IndexError):
+            # Linux以外では ru_maxrss（Linuxはキロバイト、macOSはバイト）で代用する
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return rss if sys.platform == 'darwin' else rss * 1024
+
+    def _sample_rss(self):
+        while True:
+            time.sleep(self.rss_interval)
+            rss = self._rss()
+            with self._lock:
+                if not self._open:
+                    self._sampler = None
+                    return
+                for record in self._open:
+                    record['peak_rss'] = max(record['peak_rss'], rss)
+
+    @contextmanager
+    def stage(self, name, **args):
+        """
+        ステージを計測するコンテキストマネージャー。
+
+        :param name: ステージ名
+        :param args: 記録に残す追加の情報
+        :return: ステージの記録（辞書）。終了時に計測結果が書き込まれます
+        """
+        if not self.enabled:
+            yield {}
+            return
+
+        stack = self._stack()
+        record = {
+            'name': name,
+            'parent': stack[-1]['name'] if stack else None,
+            'depth': len(stack),
+            'thread': threading.get_ident(),
+            'args': args,
+            'counters': defaultdict(int),
+            'peak_rss': self._rss(),
+        }
+        stack.append(record)
+        with self._lock:
+            self._open.append(record)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+                self._sampler.start()
+
+        # 取得は最上位のステージだけで行う（cProfile は入れ子にできない）
+        profiler = None
+        if self.capture and record['depth'] == 0:
+            profiler = cProfile.Profile() if self.capture == 'cprofile' else StackSampler(self.sample_interval)
+            profiler.enable()
+
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.time()
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - wall
+            record['cpu_seconds'] = time.process_time() - cpu
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            record['children_cpu_seconds'] = max(0.0, after.ru_utime + after.ru_stime
+                                                 - children.ru_utime - children.ru_stime)
+            record['start'] = start
+            if profiler is not None:
+                profiler.disable()
+                self.captures.setdefault(name, []).append(profiler)
+            stack.pop()
+            with self._lock:
+                self._open.remove(record)
+                record['peak_rss'] = max(record['peak_rss'], self._rss())
+                record['peak_rss_mb'] = record.pop('peak_rss') / 2 ** 20
+                record['counters'] = dict(record['counters'])
+                self.stages.append(record)
+
+    def count(self, name, value=1):
+        """
+        カウンターに加算します。現在のスレッドで開いている全てのステージにも加算されます。
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] += value
+        for record in self._stack():
+            record['counters'][name] += value
+
+    def record_worker(self, pid, commits, seconds, **counters):
+        """
+        Poolのワーカーでの処理を集計します。
+
+        :param pid: ワーカーのプロセスID
+        :param commits: 処理したコミット数
+        :param seconds: 処理にかかった時間（秒）
+        :param counters: その他のカウンター（blobs_read など）
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            worker = self.workers.setdefault(pid, defaultdict(float))
+            worker['commits'] += commits
+            worker['seconds'] += seconds
+            worker['first'] = worker.get('first') or time.time() - seconds
+            worker['last'] = time.time()
+            for name, value in counters.items():
+                worker[name] += value
+
+    def summary(self):
+        """記録をJSONにできる辞書で返します。"""
+        workers = {}
+        for pid, worker in self.workers.items():
+            worker = {name: value for name, value in worker.items() if name not in ('first', 'last')}
+            worker['commits_per_second'] = worker['commits'] / worker['seconds'] if worker['seconds'] else None
+            workers[str(pid)] = worker
+        return {
+            'stages': [{name: value for name, value in record.items() if name != 'thread'}
+                       for record in sorted(self.stages, key=lambda r: r['start'])],
+            'counters': dict(self.counters),
+            'workers': workers,
+        }
+
+    def chrome_trace(self):
+        """Chromeのトレース形式（Trace Event Format）の辞書を返します。"""
+        pid = os.getpid()
+        events = []
+        for record in self.stages:
+            events.append({
+                'name': record['name'], 'ph': 'X', 'pid': pid, 'tid': record['thread'],
+                'ts': (record['start'] - self._epoch) * 1e6, 'dur': record['wall_seconds'] * 1e6,
+                'args': {**record['args'], **record['counters'],
+                         'cpu_seconds': record['cpu_seconds'], 'peak_rss_mb': record['peak_rss_mb']},
+            })
+        for worker_pid, worker in self.workers.items():
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': worker_pid,
+                           'args': {'name': f'worker {worker_pid}'}})
+            events.append({
+                'name': 'commits', 'ph': 'X', 'pid': worker_pid, 'tid': worker_pid,
+                'ts': (worker['first'] - self._epoch) * 1e6, 'dur': (worker['last'] - worker['first']) * 1e6,
+                'args': {name: value for name, value in worker.items() if name not in ('first', 'last')},
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path, format='json'):
+        """
+        記録をファイルに書き出します。
+
+        :param path: 出力するファイルのパス
+        :param format: 'json'（summary の内容）または 'chrome'（トレース形式）
+        """
+        if format not in ('json', 'chrome'):
+            raise ValueError(f"Invalid format: {format}. Use 'json' or 'chrome'.")
+        data = self.summary() if format == 'json' else self.chrome_trace()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2 if format == 'json' else None)
+
+    def write_captures(self, directory):
+        """
+        ステージごとの取得結果を `<ステージ名>.prof` または `<ステージ名>.folded` に書き出します。
+
+        :return: 書き出したファイルのパスのリスト
+        """
+        paths = []
+        if self.captures:
+            os.makedirs(directory, exist_ok=True)
+        for name, profilers in self.captures.items():
+            for i, profiler in enumerate(profilers):
+                suffix = f"_{i}" if len(profilers) > 1 else ""
+                if isinstance(profiler, cProfile.Profile):
+                    path = os.path.join(directory, f"{name}{suffix}.prof")
+                    profiler.dump_stats(path)
+                else:
+                    path = os.path.join(directory, f"{name}{suffix}.folded")
+                    profiler.write(path)
+                paths.append(path)
+        return paths
+
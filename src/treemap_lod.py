@@ -0,0 +1,137 @@
+from collections import defaultdict
+
+import pandas as pd
+
+
+class TreemapLOD:
+    """
+    TreeMapのノード数が上限に収まるように、小さいファイルやサブツリーを
+    ディレクトリごとの "(other)" ノードにまとめます。
+
+    まとめ方は fit で一度だけ決め、すべてのフレームに同じ対応表を使うため、
+    アニメーションの途中でノードがまとめられたり戻ったりしません。
+    まとめたノードの行数は合計するので、各ディレクトリの行数は変わりません。
+    """
+
+    OTHER = "(other)"
+
+    def __init__(self, node_budget):
+        """
+        :param node_budget: ルートも含めたノード数の上限
+        """
+        self.node_budget = node_budget
+        self.mapping = {}
+
+    def fit(self, dfs):
+        """
+        フレームのDataFrameからまとめるファイルを決めます。
+
+        ファイルの大きさは全フレームでの最大の行数で比べます。
+
+        :param dfs: File, Linesカラムを含むDataFrameのイテラブル
+        :return: self
+        """
+        weights = [df.groupby('File', observed=True)['Lines'].max() for df in dfs]
+        # File がCategoricalなら、集計は出現したパスだけで行う
+        weights = (pd.concat(weights).groupby(level=0, observed=True).max() if weights
+                   else pd.Series(dtype='int64'))
+        self.mapping = self._collapse(weights)
+        return self
+
+    def _collapse(self, weights):
+        """小さいノードから順にまとめ、ファイルのパスからまとめ先のパスへの対応表を返します。"""
+        # ノード表を作る（0はルート。子は必ず親より後ろに追加される）
+        index = {'': 0}
+        parent = [-1]
+        weight = [0]
+        is_file = [False]
+        node_paths = ['']
+        for path, lines in weights.items():
+            parts = path.split('/')
+            node = 0
+            for depth in range(1, len(parts) + 1):
+                prefix = '/'.join(parts[:depth])
+                child = index.get(prefix)
+                if child is None:
+                    child = len(parent)
+                    index[prefix] = child
+                    parent.append(node)
+                    weight.append(0)
+                    is_file.append(depth == len(parts))
+                    node_paths.append(prefix)
+                weight[child] += lines
+                node = child
+
+        # サブツリーのノード数
+        size = [1] * len(parent)
+        for node in range(len(parent) - 1, 0, -1):
+            size[parent[node]] += size[node]
+
+        total = len(parent)
+        collapsed = [False] * len(parent)
+        has_other = [False] * len(parent)
+        other_items = defaultdict(list)
+        # 行数の少ない順（同じならパス順）にまとめる
+        for node in sorted(range(1, len(parent)), key=lambda i: (weight[i], node_paths[i])):
+            if total <= self.node_budget:
+                break
+            ancestor = parent[node]
+            while ancestor > 0 and not collapsed[ancestor]:
+                ancestor = parent[ancestor]
+            if ancestor > 0:
+                continue  # 親がすでにまとめられている
+
+            # まとめるとサブツリーのノードが消え、親に "(other)" が1つ増える
+            saving = size[node] - (0 if has_other[parent[node]] else 1)
+            collapsed[node] = True
+            has_other[parent[node]] = True
+            other_items[parent[node]].append(node)
+            ancestor = parent[node]
+            while ancestor >= 0:
+                size[ancestor] -= saving
+                ancestor = parent[ancestor]
+            total -= saving
+
+        # ファイル1つだけの "(other)" はノード数が変わらないので元に戻す
+        for items in other_items.values():
+            if len(items) == 1 and is_file[items[0]]:
+                collapsed[items[0]] = False
+
+        mapping = {}
+        for path in weights.index:
+            parts = path.split('/')
+            for depth in range(1, len(parts) + 1):
+                if collapsed[index['/'.join(parts[:depth])]]:
+                    mapping[path] = '/'.join(parts[:depth - 1] + [self.OTHER])
+                    break
+        return mapping
+
+    def transform(self, df):
+        """
+        まとめたファイルを "(other)" ノードの行（Type は 'other'）に置き換えたDataFrameを返します。
+
+        :param df: File, Lines, Typeカラムを含むDataFrame
+        :return: DataFrame
+        """
+        mapped = df['File'].astype(object).map(self.mapping)
+        kept = df[mapped.isna()]
+        others = df[mapped.notna()].assign(File=mapped[mapped.notna()])
+
+        aggregations = {'Lines': 'sum'}
+        for name, how in (('size', 'sum'), ('changed_files', 'sum'), ('date', 'max')):
+            if name in df.columns:
+                aggregations[name] = how
+        others = others.groupby('File', as_index=False).agg(aggregations)
+        others['Type'] = 'other'
+        return pd.concat([kept, others], ignore_index=True)
+
+    @staticmethod
+    def path_columns(df):
+        """
+        File から path_0, path_1, ... のカラムを作り直し、(DataFrame, カラム名のリスト) を返します。
+        """
+        df = df.drop(columns=[c for c in df.columns if c.startswith('path_') and c[5:].isdigit()])
+        path_parts = df['File'].str.split('/', expand=True)
+        for i in range(len(path_parts.columns)):
+            df[f'path_{i}'] = path_parts[i]
+        return df, [f'path_{i}' for i in range(len(path_parts.columns))]
@@ -0,0 +1,284 @@
+import json
+import os
+import shutil
+from html import escape
+
+import numpy as np
+from plotly.offline import get_plotlyjs
+from tqdm import tqdm
+
+
+PLAYER_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>__TITLE__</title>
+<script src="plotly.min.js"></script>
+<style>
+body { font-family: sans-serif; margin: 0 16px; }
+#controls { display: flex; gap: 8px; align-items: center; width: 1200px; margin: 8px 0; }
+#slider { flex: 1; }
+</style>
+</head>
+<body>
+<div id="controls">
+  <button id="play">Play</button>
+  <input id="slider" type="range" min="0" max="0" value="0">
+  <span id="date"></span>
+</div>
+<div id="treemap" style="width: 1200px; height: 800px;"></div>
+<script>
+const config = __CONFIG__;
+(function () {
+  // フレームのスクリプトは window.__timelapseFrames[i] に差分を書き込む
+  const frames = window.__timelapseFrames = {};
+  const loading = {};
+  const slider = document.getElementById('slider');
+  const playButton = document.getElementById('play');
+  const dateLabel = document.getElementById('date');
+  let nodes = null, values = null, changes = null;
+  let current = -1, playing = false, queue = Promise.resolve();
+
+  function loadScript(src) {
+    return new Promise(function (resolve, reject) {
+      const script = document.createElement('script');
+      script.src = src;
+      script.onload = resolve;
+      script.onerror = function () { reject(new Error('Failed to load ' + src)); };
+      document.head.appendChild(script);
+    });
+  }
+
+  function frameFile(i) {
+    return config.framesDir + '/frame_' + String(i).padStart(5, '0') + '.js';
+  }
+
+  function loadFrame(i) {
+    if (!loading[i]) {
+      loading[i] = loadScript(frameFile(i)).then(function () { return frames[i]; });
+    }
+    return loading[i];
+  }
+
+  function apply(frame) {
+    if (frame.key) { values.fill(0); changes.fill(0); }
+    let index = 0;
+    for (let k = 0; k < frame.index.length; k++) {
+      index += frame.index[k];
+      values[index] = frame.values[k];
+      changes[index] = frame.changes[k];
+    }
+  }
+
+  function render(i) {
+    const ids = [], parents = [], labels = [], nodeValues = [], customdata = [], colors = [];
+    for (let n = 0; n < nodes.ids.length; n++) {
+      if (values[n] <= 0) continue;
+      const parent = nodes.parents[n];
+      ids.push(nodes.ids[n]);
+      parents.push(parent < 0 ? '' : nodes.ids[parent]);
+      labels.push(nodes.labels[n]);
+      nodeValues.push(values[n]);
+      customdata.push([parent < 0 ? '' : nodes.ids[n], values[n], changes[n], nodes.types[n]]);
+      colors.push(changes[n]);
+    }
+    Plotly.react('treemap', [{
+      type: 'treemap', ids: ids, parents: parents, labels: labels, values: nodeValues,
+      customdata: customdata, branchvalues: 'total', textinfo: 'label',
+      hovertemplate: config.hovertemplate,
+      marker: {
+        colors: colors, colorscale: 'Blues', cmid: config.maxChanges / 2,
+        showscale: true, colorbar: { title: 'Number of Changes' }
+      }
+    }], {
+      title: { text: config.title + '<br><sup>Color indicates number of changes</sup>', x: 0.5, xanchor: 'center' },
+      width: 1200, height: 800
+    });
+    slider.value = i;
+    dateLabel.textContent = 'Date: ' + config.names[i];
+  }
+
+  async function seek(target) {
+    // 直前のキーフレームから、または現在のフレームから差分を当てる
+    const keyframe = target - target % config.keyframeInterval;
+    const start = current >= keyframe && current <= target ? current + 1 : keyframe;
+    const needed = [];
+    for (let i = start; i <= target; i++) needed.push(loadFrame(i));
+    const loaded = await Promise.all(needed);
+    loaded.forEach(apply);
+    current = target;
+    render(target);
+    if (target + 1 < config.names.length) loadFrame(target + 1);
+  }
+
+  function enqueue(target) {
+    queue = queue.then(function () { return seek(target); });
+    return queue;
+  }
+
+  function sleep(ms) {
+    return new Promise(function (resolve) { setTimeout(resolve, ms); });
+  }
+
+  async function play() {
+    if (current >= config.names.length - 1) await enqueue(0);
+    while (playing && current < config.names.length - 1) {
+      await sleep(config.frameDuration);
+      if (playing) await enqueue(current + 1);
+    }
+    playing = false;
+    playButton.textContent = 'Play';
+  }
+
+  playButton.addEventListener('click', function () {
+    playing = !playing;
+    playButton.textContent = playing ? 'Pause' : 'Play';
+    if (playing) play();
+  });
+  slider.addEventListener('input', function () {
+    playing = false;
+    enqueue(Number(slider.value));
+  });
+
+  loadScript(config.framesDir + '/nodes.js').then(function () {
+    nodes = window.__timelapseNodes;
+    values = new Float64Array(nodes.ids.length);
+    changes = new Float64Array(nodes.ids.length);
+    slider.max = config.names.length - 1;
+    return enqueue(0);
+  });
+})();
+</script>
+</body>
+</html>
+"""
+
+
+class TreemapPlayer:
+    """
+    時系列のTreeMapを、ノード表とフレームごとの差分に分けて書き出します。
+
+    ノード表（ID・親・ラベル・種別）は全フレームで1回だけ `<出力名>_frames/nodes.js` に書き、
+    各フレームは直前のフレームから値が変わったノードだけを `frame_00000.js` のような
+    個別のファイルに書きます。HTMLは小さなプレーヤーで、フレームを必要になった時点で
+    読み込んでTreeMapを更新します。ファイルは `<script>` で読み込むため、
+    file:// で開いた場合もそのまま動作します。
+    """
+
+    HOVERTEMPLATE = (
+        "<b>Path:</b> %{customdata[0]}<br>"
+        "<b>Lines:</b> %{customdata[1]}<br>"
+        "<b>Changes:</b> %{customdata[2]}<br>"
+        "<b>Type:</b> %{customdata[3]}"
+        "<extra></extra>"
+    )
+
+    def __init__(self, output_path, title, keyframe_interval=25, frame_duration=1000):
+        """
+        :param output_path: 出力するHTMLファイルのパス
+        :param title: グラフのタイトル
+        :param keyframe_interval: 全ノードの値を持つフレームを入れる間隔（シーク時に当てる差分の数の上限）
+        :param frame_duration: 再生時の1フレームの表示時間（ミリ秒）
+        """
+        self.output_path = output_path
+        self.title = title
+        self.keyframe_interval = keyframe_interval
+        self.frame_duration = frame_duration
+        self.frames_dir = os.path.splitext(output_path)[0] + "_frames"
+        self._index = {}
+        self._ids = []
+        self._parents = []
+        self._labels = []
+        self._types = []
+
+    def _node_indices(self, ids, parents, labels, types):
+        """フレームのノードをノード表に登録し、ノード表での位置を返します。"""
+        for node_id, parent, label, node_type in zip(ids, parents, labels, types):
+            if node_id not in self._index:
+                self._index[node_id] = len(self._ids)
+                self._ids.append(node_id)
+                self._parents.append(parent)
+                self._labels.append(label)
+                self._types.append(node_type)
+        return np.fromiter((self._index[node_id] for node_id in ids), dtype=np.int64, count=len(ids))
+
+    @staticmethod
+    def _script(variable, data):
+        # </script> などがHTMLとして解釈されないようにする
+        return variable + " = " + json.dumps(data, ensure_ascii=False).replace("</", "<\\/") + ";\n"
+
+    def write(self, period_dfs, prepare):
+        """
+        プレーヤーのHTMLとノード表・フレームのファイルを書き出します。
+
+        :param period_dfs: 期間ごとのDataFrameを含む辞書
+        :param prepare: DataFrameから (ids, parents, values, labels, customdata) を作る関数
+        """
+        # 前回の出力のフレームが残らないように作り直す
+        if os.path.exists(self.frames_dir):
+            shutil.rmtree(self.frames_dir)
+        os.makedirs(self.frames_dir)
+        names = []
+        max_changes = 0
+        previous_values = np.zeros(0, dtype=np.int64)
+        previous_changes = np.zeros(0, dtype=np.int64)
+
+        for date, df in tqdm(period_dfs.items(), desc="Writing frames"):
+            if df.empty:
+                continue
+            ids, parents, values, labels, customdata = prepare(df)
+            index = self._node_indices(ids, parents, labels, customdata[:, 3])
+
+            node_values = np.zeros(len(self._ids), dtype=np.int64)
+            node_values[index] = values
+            node_changes = np.zeros(len(self._ids), dtype=np.int64)
+            node_changes[index] = customdata[:, 2].astype(np.int64)
+
+            # キーフレームは空の状態からの差分として書く
+            key = len(names) % self.keyframe_interval == 0
+            base_values = np.zeros(len(self._ids), dtype=np.int64)
+            base_changes = np.zeros(len(self._ids), dtype=np.int64)
+            if not key:
+                base_values[:len(previous_values)] = previous_values
+                base_changes[:len(previous_changes)] = previous_changes
+            changed = np.flatnonzero((node_values != base_values) | (node_changes != base_changes))
+
+            frame = {
+                "key": key,
+                "index": np.diff(changed, prepend=0).tolist(),
+                "values": node_values[changed].tolist(),
+                "changes": node_changes[changed].tolist(),
+            }
+            frame_file = os.path.join(self.frames_dir, f"frame_{len(names):05d}.js")
+            with open(frame_file, "w", encoding="utf-8") as f:
+                f.write(self._script(f"window.__timelapseFrames[{len(names)}]", frame))
+
+            names.append(date.strftime("%Y-%m-%d"))
+            max_changes = max(max_changes, int(node_changes.max(initial=0)))
+            previous_values, previous_changes = node_values, node_changes
+
+        parents = [self._index[parent] if parent else -1 for parent in self._parents]
+        with open(os.path.join(self.frames_dir, "nodes.js"), "w", encoding="utf-8") as f:
+            f.write(self._script("window.__timelapseNodes", {
+                "ids": self._ids, "parents": parents, "labels": self._labels, "types": self._types,
+            }))
+
+        # plotly.js はHTMLと同じディレクトリに1つだけ置く
+        plotly_js = os.path.join(os.path.dirname(os.path.abspath(self.output_path)), "plotly.min.js")
+        if not os.path.exists(plotly_js):
+            with open(plotly_js, "w", encoding="utf-8") as f:
+                f.write(get_plotlyjs())
+
+        config = {
+            "title": self.title,
+            "framesDir": os.path.basename(self.frames_dir),
+            "names": names,
+            "keyframeInterval": self.keyframe_interval,
+            "frameDuration": self.frame_duration,
+            "maxChanges": max_changes,
+            "hovertemplate": self.HOVERTEMPLATE,
+        }
+        html = PLAYER_TEMPLATE.replace("__TITLE__", escape(self.title)).replace(
+            "__CONFIG__", json.dumps(config, ensure_ascii=False).replace("</", "<\\/"))
+        with open(self.output_path, "w", encoding="utf-8") as f:
+            f.write(html)
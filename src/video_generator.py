@@ -1,4 +1,4 @@
-import bar_chart_race as bcr
+import functools
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
@@ -6,11 +6,18 @@ from tqdm import tqdm
 import plotly.io as pio
 import plotly.express as px
 import numpy as np
+from .treemap_player import TreemapPlayer
+from .treemap_lod import TreemapLOD
+from .path_table import PathTable
+from .video_renderer import VideoRenderer, draw_treemap_frame, draw_bar_frame
 
 
 class VideoGenerator:
     @staticmethod
     def generate_video(df, output_path, title):
+        # bar_chart_race は requirements.txt に含まれないので、使う時だけ読み込む
+        import bar_chart_race as bcr
+
         bcr.bar_chart_race(
             df=df,
             filename=output_path,
@@ -100,7 +107,7 @@ class VideoGenerator:
         VideoGenerator.generate_plotly_animation(df, plotly_output, title)
 
     @staticmethod
-    def generate_treemap(df, output_path, title, path_columns):
+    def generate_treemap(df, output_path, title, path_columns, node_budget=None):
         """
         Generates a treemap visualization using Plotly and saves it as an HTML file.
 
@@ -108,7 +115,11 @@ class VideoGenerator:
         :param output_path: Path to save the HTML file
         :param title: Title of the treemap
         :param path_columns: List of column names to use for the treemap hierarchy
+        :param node_budget: Maximum number of nodes; smaller subtrees are collapsed into "(other)" nodes
         """
+        if node_budget:
+            lod = TreemapLOD(node_budget).fit([df])
+            df, path_columns = TreemapLOD.path_columns(lod.transform(df))
         fig = px.treemap(
             df,
             path=path_columns,
@@ -125,94 +136,108 @@ class VideoGenerator:
         print(f"Treemap has been saved to {output_path}")
 
     @staticmethod
-    def prepare_treemap_data(df):
+    def prepare_treemap_data(df, path_table=None):
         """
         TreeMap用にデータを準備します
 
-        :param df: 入力DataFrame
-        :return: ids, parents, values, labels, customdataのタプル
+        ファイルのパスを PathTable のIDに変換し、親ディレクトリのIDをたどって
+        ノードとディレクトリの合計行数（子孫のファイルの合計）を整数の配列で求めます。
+        パスやラベルの文字列は、最後に表から取り出します。
+
+        :param df: 入力DataFrame（File, Lines, changed_files, Typeカラムを含む）
+        :param path_table: File のパスを含む PathTable（Noneまたは表にないパスがある場合は df から作ります）
+        :return: ids, parents, values, labels, customdataのnumpy配列のタプル
+                 values はディレクトリも子孫の合計を持つので branchvalues="total" で描画する
         """
-        # 全てのパスの部分を収集
-        nodes = []
-        root_added = False
-
-        for _, row in df.iterrows():
-            path_parts = row["File"].split("/")
-            current_path = ""
-
-            # ルートノードの追加（一度だけ）
-            if not root_added:
-                nodes.append(
-                    {
-                        "id": "root",
-                        "parent": "",
-                        "name": "root",
-                        "full_path": "",
-                        "lines": 0,
-                        "changes": 0,
-                        "type": "directory",
-                    }
-                )
-                root_added = True
-
-            # パスの各部分をノードとして追加
-            for i, part in enumerate(path_parts):
-                parent_path = current_path if current_path else "root"
-                current_path = f"{current_path}/{part}".lstrip("/")
-
-                # 最後の部分（ファイル自体）かどうかを判断
-                is_file = i == len(path_parts) - 1 and row["Type"] == "file"
-
-                node = {
-                    "id": current_path,
-                    "parent": parent_path,
-                    "name": part,
-                    "full_path": current_path,
-                    "lines": row["Lines"] if is_file else 0,
-                    "changes": row["changed_files"] if is_file else 0,
-                    "type": "file" if is_file else "directory",
-                }
-                nodes.append(node)
-
-        # ノードの重複を除去（同じIDのノードは最新のものを保持）
-        unique_nodes = {}
-        for node in nodes:
-            unique_nodes[node["id"]] = node
-
-        # データの準備
-        ids = [node["id"] for node in unique_nodes.values()]
-        parents = [node["parent"] for node in unique_nodes.values()]
-        values = [node["lines"] for node in unique_nodes.values()]
-        labels = [node["name"] for node in unique_nodes.values()]
-        customdata = np.array(
-            [
-                [node["full_path"], node["lines"], node["changes"], node["type"]]
-                for node in unique_nodes.values()
-            ]
-        )
+        files = df.drop_duplicates("File", keep="last")
+        if files.empty:
+            empty = np.array([], dtype=object)
+            return empty, empty, np.array([], dtype=np.int64), empty, np.empty((0, 4), dtype=object)
+
+        file_ids = path_table.ids(files["File"]) if path_table is not None else None
+        if file_ids is None or (file_ids < 0).any():
+            path_table = PathTable.from_frames([files], columns=("File",))
+            file_ids = path_table.ids(files["File"])
+        lines = files["Lines"].to_numpy(dtype=np.int64)
+        changes = files["changed_files"].to_numpy()
+        types = files["Type"].to_numpy(dtype=object)
+
+        # ノードはファイルとその祖先のディレクトリ（昇順なので親は子より前）。位置0はルート
+        nodes = path_table.ancestors(file_ids)
+        node_count = len(nodes) + 1
+        leaves = np.searchsorted(nodes, file_ids) + 1
+
+        # 各ファイルの行数を親をたどりながら加算する
+        node_lines = np.zeros(node_count, dtype=np.int64)
+        node, weights = file_ids, lines
+        while len(node):
+            node_lines += np.bincount(np.searchsorted(nodes, node) + 1, weights=weights,
+                                      minlength=node_count).astype(np.int64)
+            node = path_table.parent_ids[node]
+            node, weights = node[node >= 0], weights[node >= 0]
+        node_lines[0] = lines.sum()
+        parent_ids = path_table.parent_ids[nodes]
+        parent_of = np.zeros(node_count, dtype=np.int64)
+        parent_of[1:] = np.where(parent_ids >= 0, np.searchsorted(nodes, parent_ids) + 1, 0)
+        node_changes = np.zeros(node_count, dtype=changes.dtype)
+        node_changes[leaves] = changes
+        node_types = np.full(node_count, "directory", dtype=object)
+        node_types[leaves] = types
+
+        # 文字列はここで初めて取り出す
+        ids = np.empty(node_count, dtype=object)
+        ids[0] = "root"
+        ids[1:] = path_table.paths.take(nodes)
+        labels = np.empty(node_count, dtype=object)
+        labels[0] = "root"
+        labels[1:] = path_table.names[nodes]
+        parents = ids[parent_of]
+        parents[0] = ""
+        values = node_lines
+        full_paths = ids.copy()
+        full_paths[0] = ""
+        customdata = np.empty((node_count, 4), dtype=object)
+        customdata[:, 0] = full_paths
+        customdata[:, 1] = node_lines
+        customdata[:, 2] = node_changes
+        customdata[:, 3] = node_types
 
         return ids, parents, values, labels, customdata
 
     @staticmethod
-    def generate_animated_treemap(period_dfs, output_path, title):
+    def apply_node_budget(period_dfs, node_budget):
+        """
+        全フレームで共通の対応表を使い、ノード数が node_budget に収まるように小さいノードをまとめます
+
+        :param period_dfs: 期間ごとのDataFrameを含む辞書
+        :param node_budget: ノード数の上限（Noneならそのまま返す）
+        :return: 期間ごとのDataFrameを含む辞書
+        """
+        if not node_budget:
+            return period_dfs
+        lod = TreemapLOD(node_budget).fit(period_dfs.values())
+        return {date: lod.transform(df) for date, df in period_dfs.items()}
+
+    @staticmethod
+    def generate_animated_treemap(period_dfs, output_path, title, node_budget=None):
         """
         時系列のTreeMapアニメーションを生成します
 
         :param period_dfs: 期間ごとのDataFrameを含む辞書
         :param output_path: 出力するHTMLファイルのパス
         :param title: グラフのタイトル
+        :param node_budget: ノード数の上限。超える場合は小さいノードを "(other)" にまとめる
         """
+        period_dfs = VideoGenerator.apply_node_budget(period_dfs, node_budget)
+        # パス表は全フレームで1つだけ作る
+        path_table = PathTable.from_frames(period_dfs.values(), columns=("File",))
         frames = []
-        max_changes = max(
-            df["changed_files"].max()
-            for df in period_dfs.values()
-            if not df.empty and "changed_files" in df.columns
-        )
+        max_changes = max(df["changed_files"].max() for df in period_dfs.values() if not df.empty and "changed_files" in df.columns)
 
         # 初期フレームのデータを取得
         first_df = next(iter(period_dfs.values()))
         ids, parents, values, labels, customdata = VideoGenerator.prepare_treemap_data(
-            first_df
+            first_df, path_table
         )
 
         # 基本のTreemapを作成
@@ -224,6 +249,7 @@ class VideoGenerator:
                     values=values,
                     labels=labels,
                     customdata=customdata,
+                    branchvalues="total",
                     hovertemplate="""
                     <b>Path:</b> %{customdata[0]}<br>
                     <b>Lines:</b> %{customdata[1]}<br>
@@ -247,7 +273,7 @@ class VideoGenerator:
         for date, df in tqdm(period_dfs.items(), desc="Generating frames"):
             if not df.empty:
                 ids, parents, values, labels, customdata = (
-                    VideoGenerator.prepare_treemap_data(df)
+                    VideoGenerator.prepare_treemap_data(df, path_table)
                 )
 
                 frame = go.Frame(
@@ -258,6 +284,7 @@ class VideoGenerator:
                             values=values,
                             labels=labels,
                             customdata=customdata,
+                            branchvalues="total",
                             hovertemplate="""
                             <b>Path:</b> %{customdata[0]}<br>
                             <b>Lines:</b> %{customdata[1]}<br>
@@ -355,6 +382,85 @@ class VideoGenerator:
         pio.write_html(fig, file=output_path)
         print(f"Animated treemap has been saved to {output_path}")
 
+    @staticmethod
+    def generate_treemap_player(period_dfs, output_path, title, node_budget=None):
+        """
+        時系列のTreeMapを、フレームを遅延読み込みするプレーヤー形式で生成します
+
+        全フレームを1つのHTMLに埋め込む generate_animated_treemap と違い、
+        ノード表は1回だけ、各フレームは前のフレームからの差分だけを別ファイルに書き出します。
+
+        :param period_dfs: 期間ごとのDataFrameを含む辞書
+        :param output_path: 出力するHTMLファイルのパス
+        :param title: グラフのタイトル
+        :param node_budget: ノード数の上限。超える場合は小さいノードを "(other)" にまとめる
+        """
+        period_dfs = VideoGenerator.apply_node_budget(period_dfs, node_budget)
+        path_table = PathTable.from_frames(period_dfs.values(), columns=("File",))
+        TreemapPlayer(output_path, title).write(
+            period_dfs, functools.partial(VideoGenerator.prepare_treemap_data, path_table=path_table))
+        print(f"Treemap player has been saved to {output_path}")
+
+    @staticmethod
+    def generate_treemap_mp4(period_dfs, output_path, title, fps=30, width=1280, height=720,
+                             period_seconds=0.5, node_budget=None, num_processes=None):
+        """
+        時系列のTreeMapをプロセスプールで描画し、ffmpeg でMP4に書き出します
+
+        :param period_dfs: 期間ごとのDataFrameを含む辞書（create_time_series_df の結果）
+        :param output_path: 出力するMP4ファイルのパス
+        :param title: 動画のタイトル
+        :param fps: フレームレート
+        :param width: 幅（ピクセル）
+        :param height: 高さ（ピクセル）
+        :param period_seconds: 1期間を表示する秒数
+        :param node_budget: ノード数の上限。超える場合は小さいノードを "(other)" にまとめる
+        :param num_processes: 描画に使うプロセス数
+        """
+        period_dfs = VideoGenerator.apply_node_budget(period_dfs, node_budget)
+        frames = {date: df for date, df in period_dfs.items() if not df.empty}
+        max_changes = max((df["changed_files"].max() for df in frames.values()), default=0)
+        # ワーカーに送るのは描画に必要な列だけにする（File はパス表全体を送らないよう文字列にする）
+        tasks = [
+            (VideoGenerator.prepare_treemap_data,
+             df[["File", "Lines", "changed_files", "Type"]].astype({"File": object}),
+             title, date.strftime("%Y-%m-%d"), max_changes, width, height)
+            for date, df in frames.items()
+        ]
+        VideoRenderer(output_path, fps, width, height, period_seconds, num_processes).render(
+            draw_treemap_frame, tasks)
+        print(f"Treemap video has been saved to {output_path}")
+
+    @staticmethod
+    def generate_bar_race_mp4(period_dfs, output_path, title, top_n=15, fps=30, width=1280, height=720,
+                              period_seconds=0.5, num_processes=None):
+        """
+        期間ごとの行数の多いファイルの横棒グラフをプロセスプールで描画し、ffmpeg でMP4に書き出します
+
+        :param period_dfs: 期間ごとのDataFrameを含む辞書（create_time_series_df の結果）
+        :param output_path: 出力するMP4ファイルのパス
+        :param title: 動画のタイトル
+        :param top_n: 表示するファイル数
+        :param fps: フレームレート
+        :param width: 幅（ピクセル）
+        :param height: 高さ（ピクセル）
+        :param period_seconds: 1期間を表示する秒数
+        :param num_processes: 描画に使うプロセス数
+        """
+        tops = {}
+        for date, df in period_dfs.items():
+            if not df.empty:
+                tops[date] = df.nlargest(top_n, "Lines")
+        max_value = max((top["Lines"].max() for top in tops.values()), default=1)
+        tasks = [
+            (top["File"].tolist(), top["Lines"].astype(int).tolist(), title, date.strftime("%Y-%m-%d"),
+             max_value, width, height)
+            for date, top in tops.items()
+        ]
+        VideoRenderer(output_path, fps, width, height, period_seconds, num_processes).render(
+            draw_bar_frame, tasks)
+        print(f"Bar chart race video has been saved to {output_path}")
+
     @staticmethod
     def bar_chart(df, output_path):
         fig = px.bar(
@@ -0,0 +1,228 @@
+import os
+import shutil
+import subprocess
+import threading
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+
+def squarify(sizes, x, y, width, height):
+    """
+    Squarified TreeMap（Bruls et al.）のレイアウトを計算します。
+
+    :param sizes: 降順に並んだ正の値のリスト。合計が width * height になるように正規化しておくこと
+    :return: sizes と同じ順序の (x, y, width, height) のリスト
+    """
+    rects = []
+    i = 0
+    while i < len(sizes):
+        short = min(width, height)
+        if short <= 0:
+            rects.extend((x, y, 0.0, 0.0) for _ in range(len(sizes) - i))
+            break
+
+        # 縦横比の最悪値が悪化しない間、同じ列に並べる
+        total = largest = smallest = sizes[i]
+        worst = max(short * short * largest / (total * total), total * total / (short * short * smallest))
+        j = i + 1
+        while j < len(sizes):
+            candidate_total = total + sizes[j]
+            candidate = max(short * short * largest / (candidate_total * candidate_total),
+                            candidate_total * candidate_total / (short * short * sizes[j]))
+            if candidate > worst:
+                break
+            total, smallest, worst = candidate_total, sizes[j], candidate
+            j += 1
+
+        if width >= height:
+            column_width = total / height
+            offset = y
+            for size in sizes[i:j]:
+                rects.append((x, offset, column_width, size / column_width))
+                offset += size / column_width
+            x += column_width
+            width -= column_width
+        else:
+            row_height = total / width
+            offset = x
+            for size in sizes[i:j]:
+                rects.append((offset, y, size / row_height, row_height))
+                offset += size / row_height
+            y += row_height
+            height -= row_height
+        i = j
+    return rects
+
+
+def _new_figure(width, height):
+    # pyplot の状態を持たない Figure を使うので、ワーカープロセスでも安全に描画できる
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure(figsize=(width / 100, height / 100), dpi=100)
+    FigureCanvasAgg(figure)
+    return figure
+
+
+def _to_rgba(figure):
+    figure.canvas.draw()
+    return bytes(figure.canvas.buffer_rgba())
+
+
+def draw_treemap_frame(task):
+    """
+    TreeMapの1フレームを描画し、RGBAの生データを返します。
+
+    :param task: (prepare, df, title, date, max_changes, width, height) のタプル。
+                 prepare は VideoGenerator.prepare_treemap_data と同じ形式の値を返す関数
+    """
+    from matplotlib import colormaps
+    from matplotlib.collections import PatchCollection
+    from matplotlib.patches import Rectangle
+
+    prepare, df, title, date, max_changes, width, height = task
+    ids, parents, values, labels, customdata = prepare(df)
+
+    figure = _new_figure(width, height)
+    title_height = 60
+    ax = figure.add_axes([0, 0, 1, 1 - title_height / height])
+    ax.set_xlim(0, width)
+    ax.set_ylim(height - title_height, 0)
+    ax.axis('off')
+    figure.suptitle(f"{title}\n{date}", y=1 - 8 / height, va='top')
+
+    children = {}
+    for index, parent in enumerate(parents):
+        children.setdefault(parent, []).append(index)
+
+    # ルートから順に子ノードを親の矩形の中に並べる
+    leaves, directories = [], []
+    stack = [(index, (0.0, 0.0, float(width), float(height - title_height)), 0)
+             for index in children.get("", [])]
+    while stack:
+        index, (x, y, w, h), depth = stack.pop()
+        kids = [k for k in children.get(ids[index], []) if values[k] > 0]
+        if not kids:
+            leaves.append((index, (x, y, w, h)))
+            continue
+        if depth > 0:
+            directories.append((x, y, w, h))
+        padding = 2.0 if w > 8 and h > 8 and depth > 0 else 0.0
+        x, y, w, h = x + padding, y + padding, max(w - 2 * padding, 0.0), max(h - 2 * padding, 0.0)
+        kids.sort(key=lambda k: values[k], reverse=True)
+        total = float(sum(values[k] for k in kids))
+        sizes = [values[k] * w * h / total for k in kids]
+        for kid, rect in zip(kids, squarify(sizes, x, y, w, h)):
+            stack.append((kid, rect, depth + 1))
+
+    cmap = colormaps['Blues']
+    scale = max(max_changes, 1)
+    ax.add_collection(PatchCollection(
+        [Rectangle((x, y), w, h) for _, (x, y, w, h) in leaves],
+        facecolors=[cmap(0.15 + 0.85 * min(float(customdata[i][2]) / scale, 1.0)) for i, _ in leaves],
+        edgecolors='white', linewidths=0.5))
+    ax.add_collection(PatchCollection(
+        [Rectangle((x, y), w, h) for x, y, w, h in directories],
+        facecolors='none', edgecolors='#333333', linewidths=0.8))
+    for i, (x, y, w, h) in leaves:
+        # 収まらないラベルは描かない（1文字あたり約4.5px）
+        if h > 14 and w > 4.5 * len(str(labels[i])) + 6:
+            ax.text(x + 3, y + 3, str(labels[i]), fontsize=7, va='top', ha='left', clip_on=True)
+    return _to_rgba(figure)
+
+
+def draw_bar_frame(task):
+    """
+    上位のファイルの行数の横棒グラフを1フレーム描画し、RGBAの生データを返します。
+
+    :param task: (names, values, title, date, max_value, width, height) のタプル
+    """
+    names, values, title, date, max_value, width, height = task
+    figure = _new_figure(width, height)
+    ax = figure.add_subplot(1, 1, 1)
+    positions = np.arange(len(names))[::-1]
+    ax.barh(positions, values, color='#4c78a8')
+    ax.set_yticks(positions, names)
+    ax.set_xlim(0, max_value * 1.1)
+    for position, value in zip(positions, values):
+        ax.text(value, position, f" {value:,}", va='center', fontsize=9)
+    ax.set_title(f"{title}\n{date}")
+    ax.set_xlabel('Lines')
+    figure.tight_layout()
+    return _to_rgba(figure)
+
+
+class VideoRenderer:
+    """
+    フレームをプロセスプールで並列に描画し、`ffmpeg` のパイプに生データのまま書き込んでMP4にします。
+
+    フレームはプールから期間の順序どおりに受け取ります。描画済みでまだ書き込んでいない
+    フレームの数は境界付きのセマフォで抑えるため、エンコードが遅くてもメモリは増え続けません。
+    """
+
+    def __init__(self, output_path, fps=30, width=1280, height=720, period_seconds=0.5,
+                 num_processes=None, ffmpeg='ffmpeg'):
+        """
+        :param output_path: 出力するMP4ファイルのパス
+        :param fps: 動画のフレームレート
+        :param width: 動画の幅（ピクセル, 偶数）
+        :param height: 動画の高さ（ピクセル, 偶数）
+        :param period_seconds: 1期間を表示する秒数
+        :param num_processes: 描画に使うプロセス数（Noneならコア数）
+        :param ffmpeg: ffmpeg の実行ファイル
+        """
+        if width % 2 or height % 2:
+            raise ValueError("width and height must be even numbers for yuv420p encoding.")
+        self.output_path = output_path
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.period_seconds = period_seconds
+        self.num_processes = num_processes or cpu_count()
+        self.ffmpeg = ffmpeg
+
+    def command(self):
+        return [
+            self.ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{self.width}x{self.height}',
+            '-r', str(self.fps), '-i', '-',
+            '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-movflags', '+faststart',
+            self.output_path,
+        ]
+
+    def render(self, draw, tasks):
+        """
+        タスクを並列に描画し、期間ごとに fps * period_seconds フレームずつ ffmpeg に書き込みます。
+
+        :param draw: 1つのタスクからRGBAの生データを返す関数（モジュールのトップレベルに定義されたもの）
+        :param tasks: 期間の順に並んだタスクのリスト
+        :return: 書き込んだ期間の数
+        """
+        if shutil.which(self.ffmpeg) is None:
+            raise RuntimeError(f"{self.ffmpeg} was not found. Install ffmpeg to export videos.")
+
+        repeat = max(1, round(self.fps * self.period_seconds))
+        window = threading.BoundedSemaphore(self.num_processes * 4)
+
+        def windowed():
+            for task in tasks:
+                window.acquire()
+                yield task
+
+        process = subprocess.Popen(self.command(), stdin=subprocess.PIPE)
+        written = 0
+        try:
+            with Pool(processes=self.num_processes) as pool:
+                for frame in pool.imap(draw, windowed()):
+                    for _ in range(repeat):
+                        process.stdin.write(frame)
+                    window.release()
+                    written += 1
+        finally:
+            process.stdin.close()
+            process.wait()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, self.command())
+        print(f"Rendered {written} periods to {os.path.abspath(self.output_path)}")
+        return written
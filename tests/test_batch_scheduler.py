@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from benchmarks.synthetic_repo import SyntheticRepository
+from src.batch_scheduler import BatchScheduler
+from src.git_repository import GitRepository
+
+
+class BatchSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        self.addCleanup(os.chdir, self.cwd)
+
+    def test_failed_repository_does_not_block_shared_pool(self):
+        bad = SyntheticRepository(os.path.join(self.tmp.name, 'bad'), commits=150, files=40, seed=1).generate()
+        good = SyntheticRepository(os.path.join(self.tmp.name, 'good'), commits=150, files=40, seed=2).generate()
+        manifest = os.path.join(self.tmp.name, 'manifest.json')
+        with open(manifest, 'w', encoding='utf-8') as f:
+            json.dump([{'repo_url': bad, 'priority': 1}, good], f)
+
+        process_commit = GitRepository.process_commit
+
+        def failing_process_commit(repository, file_extensions, commit_sha):
+            if repository.repo_path == bad:
+                raise RuntimeError('boom')
+            return process_commit(repository, file_extensions, commit_sha)
+
+        # 共有プールは run の中でforkされるので、ワーカーにも差し替えが引き継がれる
+        scheduler = BatchScheduler(manifest, num_processes=2, max_concurrent_repos=1,
+                                   defaults={'extensions': ['.java', '.py']})
+        results = []
+        with mock.patch.object(GitRepository, 'process_commit', failing_process_commit):
+            thread = threading.Thread(target=lambda: results.extend(scheduler.run()), daemon=True)
+            thread.start()
+            thread.join(timeout=300)
+        self.assertFalse(thread.is_alive(), 'batch did not finish after a repository failed')
+
+        statuses = {result['repo_url']: result['status'] for result in results}
+        self.assertEqual(statuses, {bad: 'failed', good: 'succeeded'})
+        self.assertIn('boom', next(result['error'] for result in results if result['repo_url'] == bad))
+
+
+if __name__ == '__main__':
+    unittest.main()
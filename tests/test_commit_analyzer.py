@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+import git
+
+from benchmarks.synthetic_repo import SyntheticRepository
+from src.commit_analyzer import CommitAnalyzer
+
+
+class AnalyzeRangeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.repo_path = SyntheticRepository(os.path.join(cls.tmp.name, 'merges'), commits=120, files=40,
+                                            rename_rate=0.2, merge_interval=5, seed=5).generate()
+        cls.repo = git.Repo(cls.repo_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.repo.close()
+        cls.tmp.cleanup()
+
+    def assert_same_commits(self, expected, actual):
+        self.assertEqual([commit['commit_hexsha'] for commit in actual],
+                         [commit['commit_hexsha'] for commit in expected])
+        for want, got in zip(expected, actual):
+            self.assertEqual(got['author'], want['author'])
+            self.assertEqual(got['date'], want['date'])
+            self.assertEqual(got['message'], want['message'])
+            self.assertEqual(sorted(got['files'], key=lambda f: f['file_path']),
+                             sorted(want['files'], key=lambda f: f['file_path']), got['commit_hexsha'])
+
+    def test_matches_analyze_commits_including_merges(self):
+        commits = list(self.repo.iter_commits('main'))
+        self.assertTrue(any(len(commit.parents) > 1 for commit in commits))
+        expected = [commit for commit in CommitAnalyzer.analyze_commits(self.repo, commits, '') if commit['files']]
+        actual = CommitAnalyzer.analyze_range(self.repo_path, 'main', traversal='full')
+        self.assert_same_commits(expected, actual)
+
+    def test_first_parent(self):
+        commits = list(self.repo.iter_commits('main', first_parent=True))
+        expected = [commit for commit in CommitAnalyzer.analyze_commits(self.repo, commits, 'd0_1/')
+                    if commit['files']]
+        actual = CommitAnalyzer.analyze_range(self.repo_path, 'main', 'd0_1/')
+        self.assert_same_commits(expected, actual)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+import git
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_repo import SyntheticRepository
+from src.blob_reader import BlobReader
+from src.commit_analyzer import CommitAnalyzer
+from src.dataframe_creator import DataFrameCreator
+from src.line_counter import LineCounter
+
+
+class CreateDataframeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.repo_path = SyntheticRepository(os.path.join(cls.tmp.name, 'synthetic'), commits=150, files=50,
+                                            rename_rate=0.2, seed=10).generate()
+        cls.repo = git.Repo(cls.repo_path)
+        cls.commit_data = CommitAnalyzer.analyze_range(cls.repo_path, 'main')
+        cls.expected = cls.dense_states()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.repo.close()
+        cls.tmp.cleanup()
+
+    @classmethod
+    def dense_states(cls):
+        """コミットごとにツリー全体の行数を数え直した、日時×ファイルの密な表。"""
+        counter = LineCounter()
+        states = {}
+        for commit in reversed(cls.commit_data):
+            tree = cls.repo.commit(commit['commit_hexsha']).tree
+            states[commit['date'].strftime('%Y-%m-%d %H:%M:%S')] = {
+                blob.path: LineCounter.lines(counter.count(blob.data_stream.read()))
+                for blob in tree.traverse() if blob.type == 'blob'}
+        return pd.DataFrame.from_dict(states, orient='index').fillna(0)
+
+    def check(self, blob_reader):
+        df = DataFrameCreator.create_dataframe(self.repo, '', self.commit_data, blob_reader=blob_reader)
+        self.assertTrue(all(isinstance(dtype, pd.SparseDtype) for dtype in df.dtypes))
+
+        # 値を持たない行は直前の状態のままなので、前方埋めすると各コミットの状態になる
+        dense = df.sparse.to_dense().ffill().fillna(0)
+        dense = dense.reindex(sorted(set(dense.index) | set(self.expected.index))).ffill().fillna(0)
+        states = dense.reindex(columns=dense.columns.union(self.expected.columns), fill_value=0)
+        expected = self.expected.reindex(columns=states.columns, fill_value=0)
+        np.testing.assert_array_equal(states.loc[expected.index].to_numpy(), expected.to_numpy())
+
+        for period in ('W', 'M'):
+            sparse = DataFrameCreator.aggregate_dataframe(df.copy(), period)
+            resampled = DataFrameCreator.aggregate_dataframe(df.sparse.to_dense(), period)
+            pd.testing.assert_frame_equal(sparse, resampled)
+
+    def test_gitpython_matches_dense_states(self):
+        self.check(None)
+
+    def test_blob_reader_matches_dense_states(self):
+        blob_reader = BlobReader(self.repo_path)
+        self.addCleanup(blob_reader.close)
+        self.check(blob_reader)
+
+
+if __name__ == '__main__':
+    unittest.main()
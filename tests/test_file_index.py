@@ -0,0 +1,113 @@
+import os
+import subprocess
+import tempfile
+import unittest
+
+from src.dataframe_creator import DataFrameCreator
+from src.file_index import FileIndex
+from src.git_repository import GitRepository
+from src.snapshot_engine import SnapshotEngine
+
+
+class AssignFileIdsTest(unittest.TestCase):
+    def assign(self, index, *rows):
+        rows = [dict(row) for row in rows]
+        index.assign_file_ids(rows)
+        return [row['FileId'] for row in rows]
+
+    def test_file_id_follows_renames_and_restores(self):
+        index = FileIndex()
+        a, d = self.assign(index, {'File': 'A.py', 'Change': 'added'}, {'File': 'D.py', 'Change': 'added'})
+        self.assertNotEqual(a, d)
+        self.assertEqual(self.assign(index, {'File': 'B.py', 'Change': 'renamed', 'OldPath': 'A.py'}), [a])
+        self.assertEqual(self.assign(index, {'File': 'C.py', 'Change': 'renamed', 'OldPath': 'B.py'}), [a])
+        self.assertEqual(self.assign(index, {'File': 'C.py', 'Change': 'modified'}), [a])
+        # 削除したパスに戻したファイルは同じ番号になる
+        self.assertEqual(self.assign(index, {'File': 'D.py', 'Change': 'deleted'}), [d])
+        self.assertEqual(self.assign(index, {'File': 'D.py', 'Change': 'added'}), [d])
+        # リネーム元のパスに追加した別のファイルは新しい番号になる
+        self.assertNotIn(self.assign(index, {'File': 'A.py', 'Change': 'added'})[0], (a, d))
+
+
+class RenameChainTest(unittest.TestCase):
+    """A.py を A→B→C とリネームし、D.py を削除して同じパスに戻すリポジトリで変更回数を確かめます。"""
+
+    # (コミットの日時, 実行するコマンド)。1か月に1コミットなので、月ごとのスナップショットで途中の状態も見られる
+    COMMITS = [
+        ('2020-01-15', [('write', 'A.py', 'a\n' * 3), ('write', 'D.py', 'd\n' * 2)]),
+        ('2020-02-15', [('write', 'A.py', 'a\n' * 4)]),
+        ('2020-03-15', [('git', 'mv', 'A.py', 'B.py')]),
+        ('2020-04-15', [('write', 'B.py', 'a\n' * 5)]),
+        ('2020-05-15', [('git', 'mv', 'B.py', 'C.py')]),
+        ('2020-06-15', [('git', 'rm', '-q', 'D.py')]),
+        ('2020-07-15', [('write', 'D.py', 'd\n' * 2)]),
+        ('2020-08-15', [('write', 'C.py', 'a\n' * 6)]),
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.cwd = os.getcwd()
+        os.chdir(cls.tmp.name)
+        cls.repo_path = os.path.join(cls.tmp.name, 'renames')
+        os.makedirs(cls.repo_path)
+        cls.git('init', '-q', '-b', 'main')
+        for date, steps in cls.COMMITS:
+            for step in steps:
+                if step[0] == 'write':
+                    with open(os.path.join(cls.repo_path, step[1]), 'w', encoding='utf-8') as f:
+                        f.write(step[2])
+                    cls.git('add', step[1])
+                else:
+                    cls.git(*step[1:])
+            cls.git('commit', '-q', '-m', date, env={'GIT_AUTHOR_DATE': f'{date}T12:00:00Z',
+                                                      'GIT_COMMITTER_DATE': f'{date}T12:00:00Z'})
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        cls.tmp.cleanup()
+
+    @classmethod
+    def git(cls, *args, env=None):
+        subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args],
+                       cwd=cls.repo_path, check=True, env={**os.environ, **(env or {})})
+
+    def load(self, backend):
+        repository = GitRepository(self.repo_path)
+        self.addCleanup(repository.close)
+        path = repository.process_commits(os.path.join(self.tmp.name, f'{backend}.csv'),
+                                          incremental=False, backend=backend)
+        return DataFrameCreator.load_history(path)
+
+    def test_file_id_and_change_counts_follow_the_chain(self):
+        for backend in ('gitpython', 'log'):
+            with self.subTest(backend=backend):
+                df = self.load(backend)
+                files = df['File'].astype(str)
+                chain = df[files.isin(['A.py', 'B.py', 'C.py'])]
+                self.assertEqual(chain['Change'].astype(str).tolist(),
+                                 ['added', 'modified', 'renamed', 'modified', 'renamed', 'modified'])
+                self.assertEqual(chain['FileId'].nunique(), 1)
+                restored = df[files == 'D.py']
+                self.assertEqual(restored['Change'].astype(str).tolist(), ['added', 'deleted', 'added'])
+                self.assertEqual(restored['FileId'].nunique(), 1)
+                self.assertNotEqual(restored['FileId'].iloc[0], chain['FileId'].iloc[0])
+
+                counts = DataFrameCreator.change_counts(df)
+                self.assertEqual((counts['C.py'], counts['D.py']), (6, 3))
+
+                snapshots = {period_end.strftime('%Y-%m'): state.set_index(state['File'].astype(str))
+                             for period_end, state in SnapshotEngine(df, 'M').snapshots()}
+                # 2回目のリネームの前は B.py が A.py の変更も数える
+                self.assertEqual(snapshots['2020-04']['changed_files'].to_dict(), {'B.py': 4, 'D.py': 1})
+                # 削除した月は D.py が消え、戻した月からは削除を含めた全ての変更を数える
+                self.assertEqual(snapshots['2020-06']['changed_files'].to_dict(), {'C.py': 5})
+                self.assertEqual(snapshots['2020-07']['changed_files'].to_dict(), {'C.py': 5, 'D.py': 3})
+                # リネーム元のパスは最新状態に残らない
+                latest = DataFrameCreator.latest_state(df)
+                self.assertEqual(latest['File'].astype(str).tolist(), ['C.py', 'D.py'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.synthetic_repo import SyntheticRepository
+from src.dataframe_creator import DataFrameCreator
+from src.git_repository import GitRepository
+from src.history_store import HistoryStore
+
+
+class RepositoryTestCase(unittest.TestCase):
+    """合成リポジトリを1つ作り、出力（out/）を一時ディレクトリに書くテストの基底クラス。"""
+
+    repository_options = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.cwd = os.getcwd()
+        os.chdir(cls.tmp.name)
+        cls.repo_path = SyntheticRepository(os.path.join(cls.tmp.name, 'synthetic'),
+                                            **cls.repository_options).generate()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        cls.tmp.cleanup()
+
+    def open_repository(self):
+        repository = GitRepository(self.repo_path)
+        self.addCleanup(repository.close)
+        return repository
+
+
+class ParseRepoUrlTest(unittest.TestCase):
+    def test_local_repositories_with_same_name_get_different_outputs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            first = os.path.join(tmp, 'a', 'app')
+            second = os.path.join(tmp, 'b', 'app')
+            os.makedirs(first)
+            os.makedirs(second)
+
+            first_info = GitRepository.parse_repo_url(first)
+            second_info = GitRepository.parse_repo_url(second)
+            self.assertEqual(first_info['repo'], 'app')
+            self.assertEqual(second_info['repo'], 'app')
+            self.assertNotEqual(first_info['owner'], second_info['owner'])
+            # 同じリポジトリは表記が違っても同じ出力先になる
+            self.assertEqual(GitRepository.parse_repo_url(first + os.sep)['owner'], first_info['owner'])
+
+    def test_github_url(self):
+        info = GitRepository.parse_repo_url('https://github.com/stleary/JSON-java.git')
+        self.assertEqual((info['owner'], info['repo']), ('stleary', 'JSON-java'))
+
+
+class SampleCommitsTest(RepositoryTestCase):
+    repository_options = {'commits': 200, 'files': 40, 'merge_interval': 7, 'seed': 4}
+
+    def test_resumed_range_selects_the_same_samples_as_the_full_history(self):
+        repository = self.open_repository()
+        mainline = repository.repo.git.rev_list('--first-parent', '--reverse', 'main').split()
+        for sample in ('D', 'W', 5):
+            full = repository.sample_commits('main', sample)
+            for last_head in (mainline[10], mainline[77], mainline[150]):
+                resumed = repository.sample_commits(f'{last_head}..main', sample)
+                after = set(mainline[mainline.index(last_head) + 1:])
+                self.assertEqual(resumed, [sha for sha in full if sha in after], (sample, last_head))
+
+
+class BackendTest(RepositoryTestCase):
+    repository_options = {'commits': 200, 'files': 60, 'rename_rate': 0.25, 'merge_interval': 6, 'seed': 7}
+
+    def process(self, name, **options):
+        repository = self.open_repository()
+        return repository.process_commits(os.path.join(self.tmp.name, f'{name}.csv'), incremental=False, **options)
+
+    def read(self, path):
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+    def test_gitpython_and_log_backends_write_the_same_rows(self):
+        for traversal in ('first-parent', 'full', 'no-merges'):
+            with self.subTest(traversal=traversal):
+                gitpython = self.process(f'gitpython-{traversal}', backend='gitpython', traversal=traversal)
+                log = self.process(f'log-{traversal}', backend='log', traversal=traversal)
+                self.assertEqual(self.read(gitpython), self.read(log))
+
+
+class IncrementalTest(RepositoryTestCase):
+    repository_options = {'commits': 200, 'files': 60, 'rename_rate': 0.2, 'merge_interval': 9, 'seed': 8}
+
+    def move_branch(self, sha):
+        repository = self.open_repository()
+        repository.repo.git.reset('--hard', sha)
+
+    def test_resume_matches_full_rebuild(self):
+        mainline = self.open_repository().repo.git.rev_list('--first-parent', '--reverse', 'main').split()
+        self.addCleanup(self.move_branch, mainline[-1])
+        for backend, storage, traversal in (('gitpython', 'csv', 'first-parent'), ('log', 'csv', 'full'),
+                                            ('log', 'columnar', 'first-parent')):
+            with self.subTest(backend=backend, storage=storage, traversal=traversal):
+                options = dict(backend=backend, storage=storage, traversal=traversal)
+                incremental = os.path.join(self.tmp.name, f'incremental-{backend}-{storage}-{traversal}.csv')
+                # 途中までの履歴を処理した後、2回に分けて新しいコミットを追記する
+                for head in (mainline[60], mainline[130], mainline[-1]):
+                    self.move_branch(head)
+                    path = self.open_repository().process_commits(incremental, **options)
+                full = self.open_repository().process_commits(
+                    os.path.join(self.tmp.name, f'full-{backend}-{storage}-{traversal}.csv'),
+                    incremental=False, **options)
+                self.assertTrue(os.path.exists(self.open_repository().index_path(path)))
+                self.assertTrue(DataFrameCreator.load_history(path).equals(DataFrameCreator.load_history(full)))
+
+
+class ColumnarStorageTest(RepositoryTestCase):
+    repository_options = {'commits': 150, 'files': 60, 'rename_rate': 0.2, 'seed': 9}
+
+    def test_columnar_store_matches_csv(self):
+        csv_path = self.open_repository().process_commits(os.path.join(self.tmp.name, 'history.csv'),
+                                                          incremental=False, backend='log')
+        store_path = self.open_repository().process_commits(os.path.join(self.tmp.name, 'store.csv'),
+                                                            incremental=False, backend='log', storage='columnar')
+        self.assertTrue(HistoryStore.is_store(store_path))
+
+        expected = DataFrameCreator.load_history(csv_path)
+        actual = DataFrameCreator.load_history(store_path)
+        self.assertEqual(list(actual.columns), list(expected.columns))
+        for name in expected.columns:
+            self.assertEqual(actual[name].astype(object).where(actual[name].notna(), None).tolist(),
+                             expected[name].astype(object).where(expected[name].notna(), None).tolist(), name)
+
+        exported = os.path.join(self.tmp.name, 'exported.csv')
+        HistoryStore(store_path).to_csv(exported)
+        with open(csv_path, encoding='utf-8') as f, open(exported, encoding='utf-8') as g:
+            self.assertEqual(g.read(), f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import io
+import unittest
+
+from src.line_counter import LineCounter
+
+# ストリームの内容の後ろに続く、次のblob（cat-file の次の出力）の代わり
+TRAILER = b'<next blob>'
+
+
+class LineCounterTest(unittest.TestCase):
+    def count_both(self, counter, data):
+        """count と count_stream の結果を返し、count_stream がちょうど len(data) バイトを読んだことを確かめます。"""
+        stream = io.BytesIO(data + TRAILER)
+        result = counter.count_stream(stream.read, len(data))
+        self.assertEqual(stream.tell(), len(data))
+        self.assertEqual(stream.read(), TRAILER)
+        return counter.count(data), result
+
+    def test_last_line_without_lf_is_counted(self):
+        counter = LineCounter(chunk_size=2)
+        for data, expected in ((b'', 0), (b'\n', 1), (b'a', 1), (b'a\nb', 2), (b'a\nb\n', 2),
+                               (b'a\r\nb\r\n', 2), (b'a\rb\r', 1), (b'\n\n\n', 3)):
+            with self.subTest(data=data):
+                self.assertEqual(self.count_both(counter, data), (expected, expected))
+
+    def test_nul_only_in_the_probe_marks_binary(self):
+        counter = LineCounter(chunk_size=1000)
+        text = b'x' * 7999 + b'\n' + b'y\n' * 100
+        inside = text[:7999] + b'\0' + text[8000:]
+        self.assertEqual(self.count_both(counter, inside), (LineCounter.BINARY, LineCounter.BINARY))
+        self.assertEqual(self.count_both(counter, b'\0'), (LineCounter.BINARY, LineCounter.BINARY))
+        # 先頭 8000 バイトより後の NUL はテキストとして数える
+        outside = text[:8000] + b'\0' + text[8000:]
+        self.assertEqual(self.count_both(counter, outside), (101, 101))
+
+    def test_max_size_boundary(self):
+        data = b'line\n' * 20
+        at_limit = LineCounter(max_size=len(data), chunk_size=7)
+        self.assertEqual(self.count_both(at_limit, data), (20, 20))
+        over_limit = LineCounter(max_size=len(data) - 1, chunk_size=7)
+        self.assertEqual(self.count_both(over_limit, data), (LineCounter.OVERSIZED, LineCounter.OVERSIZED))
+        # サイズの上限はバイナリの判定より先に見る
+        binary = b'\0' + data[1:]
+        self.assertEqual(self.count_both(over_limit, binary), (LineCounter.OVERSIZED, LineCounter.OVERSIZED))
+        self.assertEqual(self.count_both(LineCounter(max_size=0), b''), (0, 0))
+
+    def test_truncated_stream_raises(self):
+        counter = LineCounter(max_size=4, chunk_size=2)
+        for size in (3, 10):
+            with self.subTest(size=size), self.assertRaises(EOFError):
+                counter.count_stream(io.BytesIO(b'a\n').read, size)
+
+    def test_lines_clamps_binary_and_oversized_to_zero(self):
+        self.assertEqual([LineCounter.lines(count) for count in (LineCounter.BINARY, LineCounter.OVERSIZED, 0, 5)],
+                         [0, 0, 0, 5])
+
+    def test_rule_changes_with_the_settings(self):
+        self.assertNotEqual(LineCounter().rule(), LineCounter(max_size=100).rule())
+        self.assertNotEqual(LineCounter().rule(), LineCounter(probe_size=100).rule())
+        self.assertEqual(LineCounter(chunk_size=10).rule(), LineCounter().rule())
+
+    def test_negative_max_size_is_rejected(self):
+        with self.assertRaises(ValueError):
+            LineCounter(max_size=-1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.synthetic_repo import SyntheticRepository
+from src.dataframe_creator import DataFrameCreator
+from src.git_repository import GitRepository
+from src.snapshot_engine import SnapshotEngine
+
+
+class SnapshotEngineTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cwd = os.getcwd()
+        os.chdir(cls.tmp.name)
+        try:
+            path = SyntheticRepository(os.path.join(cls.tmp.name, 'renames'), commits=200, files=60,
+                                       rename_rate=0.3, seed=3).generate()
+            repository = GitRepository(path)
+            history_path = repository.process_commits(os.path.join(repository.output_dir, 'commit_history.csv'),
+                                                      backend='log', incremental=False)
+            repository.close()
+            cls.df = DataFrameCreator.load_history(os.path.abspath(history_path))
+        finally:
+            os.chdir(cwd)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_snapshots_match_history_up_to_each_boundary(self):
+        df = self.df.sort_values('date', kind='stable')
+        snapshots = list(SnapshotEngine(df, 'M').snapshots())
+        self.assertGreater(len(snapshots), 3)
+        for period_end, state in snapshots:
+            rows = df[df['date'] <= period_end]
+            expected = DataFrameCreator.latest_state(rows)
+            self.assertEqual(state['File'].astype(str).tolist(), expected['File'].astype(str).tolist())
+            self.assertEqual(state['Lines'].tolist(), expected['Lines'].tolist())
+            # 変更回数はリネームをたどった同じファイル（FileId）ごとに数える
+            counts = DataFrameCreator.change_counts(rows)
+            self.assertEqual(state['changed_files'].tolist(),
+                             counts.reindex(expected['File'].astype(str), fill_value=0).tolist(),
+                             f"changed_files differ at {period_end}")
+
+
+class FrequencyTest(unittest.TestCase):
+    def test_deprecated_period_aliases_are_replaced(self):
+        self.assertEqual([SnapshotEngine.frequency(period) for period in ('Y', 'M', 'W', 'D', '2M', 'Y-DEC', 'MS')],
+                         ['YE', 'ME', 'W', 'D', '2ME', 'YE-DEC', 'MS'])
+
+
+if __name__ == '__main__':
+    unittest.main()